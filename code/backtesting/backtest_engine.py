@@ -0,0 +1,100 @@
+import logging
+import sys
+from datetime import timedelta
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+file = Path(__file__).resolve()
+parent, root = file.parent, file.parents[1]
+sys.path.append(str(root))
+
+from trading.dom.trading_session import Trading_Session
+from trading.strategies.base.strategy_exec import TradingStrategyExec
+
+logger = logging.getLogger()
+
+"""
+Backtest loop over NumPy arrays instead of DataFrame.iterrows.
+
+The indicator columns are taken out of strategy.data once, every bar is handed to set_strategy_indicators as a
+plain dict of their values, so the strategy's own determine_trade_action makes every decision and the trade
+list is the same as the iterrows loop's.
+
+Most of the time the position is flat and nothing happens. A strategy can return a mask of the bars where it
+could possibly open a trade from entry_candidates (a necessary condition, computed over whole columns), the
+loop then jumps from candidate to candidate while flat and only walks bar by bar while a trade is open.
+"""
+class BacktestEngine():
+
+    def __init__(self, strategy: TradingStrategyExec):
+        self.strategy = strategy
+
+    def run(self, data: pd.DataFrame = None) -> Trading_Session:
+
+        """
+            data defaults to strategy.data with the indicators calculated, returns the strategy's trading session
+        """
+
+        data = self.strategy.data if data is None else data
+
+        names = list(data.columns)
+        columns = {name: data[name].to_numpy() for name in names}
+
+        # numeric columns are upcast to floats like iterrows does
+        if all(np.issubdtype(column.dtype, np.number) for column in columns.values()):
+            return self.run_arrays(names, data.to_numpy(dtype=np.float64), data.index.to_numpy())
+
+        return self.walk(names, columns, lambda i: [columns[name][i] for name in names], data.index.to_numpy())
+
+    def run_arrays(self, names, bars: np.ndarray, times: np.ndarray) -> Trading_Session:
+
+        """
+            bars: one row per bar, one float column per name, times: the bar times as datetime64.
+            Both can be read-only memory maps, parameter_sweep.py shares them between processes that way.
+        """
+
+        columns = {name: bars[:, j] for j, name in enumerate(names)}
+        # only the visited rows are converted: reading, comparing and rounding python floats costs a fraction of numpy scalars
+        return self.walk(names, columns, lambda i: bars[i].tolist(), times)
+
+    def walk(self, names, columns, bar, times) -> Trading_Session:
+
+        strategy = self.strategy
+        session = strategy.trading_session
+        count = len(times)
+
+        candidates = strategy.entry_candidates(columns)
+        candidate_rows = None if candidates is None else np.flatnonzero(candidates)
+
+        pause_trading = None
+        i: int = 0
+
+        while i < count:
+
+            if candidate_rows is not None and session.have_units == 0:
+                # flat, skip to the next bar where the strategy could open a trade
+                next_candidate = np.searchsorted(candidate_rows, i)
+                if next_candidate == len(candidate_rows):
+                    break
+                i = int(candidate_rows[next_candidate])
+
+            time = pd.Timestamp(times[i])
+            row = dict(zip(names, bar(i)))
+            row["time"] = time
+            strategy.set_strategy_indicators(row=row)
+
+            if pause_trading is None or time > pause_trading:
+                trade_action = strategy.determine_trade_action(trading_time=time)
+
+                if trade_action:
+                    session.open_trade = trade_action.open_trade
+
+                    if trade_action.sl_trade:
+                        logger.debug("Pausing trading for 5 minutes at %s", time)
+                        pause_trading = time + timedelta(minutes = 1)
+
+            i = i + 1
+
+        return session
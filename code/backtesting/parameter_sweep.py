@@ -0,0 +1,212 @@
+import argparse
+import configparser
+import itertools
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from decimal import Decimal
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from tabulate import tabulate
+
+file = Path(__file__).resolve()
+parent, root = file.parent, file.parents[1]
+sys.path.append(str(root))
+
+from backtesting.backtest_engine import BacktestEngine
+from backtesting.trading_bot_backtest import read_days
+from trading.api.candle_source import CsvSource, ParquetSource
+from trading.dom.trading_session import Trading_Session
+from trading.strategies.base.strategy_exec import TradingStrategyExec
+
+logger = logging.getLogger()
+
+"""
+Backtests every combination of a set of pairs.ini values for one strategy section and ranks them.
+
+The candles and indicators are calculated once, none of the swept settings changes them. They are written
+to a temporary directory as .npy files that every worker opens as a read-only memory map, so the data is
+never pickled to the workers and exists once in memory whatever the number of processes. Each combination
+is a BacktestEngine run in a process pool, the results are written to a csv sorted by --rank, best first:
+lowest first for the cost columns (max_drawdown, stop_losses), highest first for the others.
+
+    --param sl_perc=0.002..0.004..0.001      a range, stop included
+    --param keep_trade_open_time=60,90,120   a list
+    --param pause_start=12:00:00,12:30:00
+"""
+
+# per process state of the workers, set by init_worker
+worker = {}
+
+# summary columns where less is better, ranked ascending
+cost_columns = {"max_drawdown", "stop_losses"}
+
+
+def parse_param(text):
+
+    name, values = text.split("=", 1)
+
+    if ".." in values:
+        start, stop, step = (Decimal(value) for value in values.split(".."))
+        # Decimal keeps 0.1 + 0.2 steps exact
+        count = int((stop - start) / step) + 1
+        values = [str(start + i * step) for i in range(count)]
+    else:
+        values = values.split(",")
+
+    return name.strip(), [value.strip() for value in values]
+
+
+def combinations(params) -> list:
+
+    names = [name for name, _ in params]
+    return [dict(zip(names, values)) for values in itertools.product(*[values for _, values in params])]
+
+
+def strategy_class(config, trading_strategy):
+
+    strategy = config.get(trading_strategy, 'strategy')
+    modules = strategy.split(sep=".", maxsplit=2)
+    module = __import__(f"trading.strategies.{modules[0]}", fromlist=[f"{modules[1]}"])
+    return getattr(module, modules[1])
+
+
+def write_bars(directory, data: pd.DataFrame):
+
+    # one float row per bar like BacktestEngine.run_arrays reads them, the times as datetime64
+    data = data.select_dtypes("number")
+    np.save(os.path.join(directory, "bars.npy"), data.to_numpy(dtype=np.float64))
+    np.save(os.path.join(directory, "times.npy"), data.index.to_numpy())
+    with open(os.path.join(directory, "names.json"), "w") as f:
+        json.dump(list(data.columns), f)
+
+
+def init_worker(directory, pair_file, trading_strategy):
+
+    with open(os.path.join(directory, "names.json")) as f:
+        worker["names"] = json.load(f)
+    worker["bars"] = np.load(os.path.join(directory, "bars.npy"), mmap_mode="r")
+    worker["times"] = np.load(os.path.join(directory, "times.npy"), mmap_mode="r")
+
+    config = configparser.ConfigParser()
+    config.read(pair_file)
+    worker["config"] = config
+    worker["trading_strategy"] = trading_strategy
+    worker["class"] = strategy_class(config, trading_strategy)
+    # the strategies read their settings from a pairs file, every combination is written to this process' copy
+    worker["pair_file"] = os.path.join(directory, f"pairs_{os.getpid()}.ini")
+
+
+def run_backtest(params: dict) -> dict:
+
+    config = worker["config"]
+    trading_strategy = worker["trading_strategy"]
+
+    for name, value in params.items():
+        config.set(trading_strategy, name, value)
+    with open(worker["pair_file"], "w") as f:
+        config.write(f)
+
+    strategy: TradingStrategyExec = worker["class"](trading_strategy=trading_strategy, pair_file=worker["pair_file"], unit_test=False)
+    strategy.backtest = True
+
+    session = BacktestEngine(strategy).run_arrays(worker["names"], worker["bars"], worker["times"])
+    return dict(params, **summary(session))
+
+
+def summary(session: Trading_Session) -> dict:
+
+    closed = [trade for trade in session.trades if trade[2].startswith("Close")]
+    trade_pl = [float(trade[6].replace("$", "").replace(",", "")) for trade in closed]
+    pl = np.cumsum(trade_pl) if trade_pl else np.zeros(1)
+
+    return dict(
+        pl=round(session.pl, 2),
+        trades=len(closed),
+        long_trades=session.long_trades,
+        short_trades=session.short_trades,
+        win_rate=round(sum(1 for value in trade_pl if value > 0) / len(closed), 4) if closed else 0,
+        stop_losses=sum(1 for trade in closed if trade[2].endswith("(SL)")),
+        max_drawdown=round(float(np.max(np.maximum.accumulate(np.maximum(pl, 0)) - pl)), 2),
+        open_trade=session.have_units != 0
+    )
+
+
+def sweep(trading_strategy, pair_file, data: pd.DataFrame, params, workers = None, rank = "pl") -> pd.DataFrame:
+
+    config = configparser.ConfigParser()
+    config.read(pair_file)
+
+    logger.info(f"Calculating indicators for {len(data)} bars...")
+    strategy: TradingStrategyExec = strategy_class(config, trading_strategy)(trading_strategy=trading_strategy, pair_file=pair_file, unit_test=False)
+    strategy.data = data.copy()
+    strategy.calc_indicators()
+
+    directory = tempfile.mkdtemp(prefix="sweep_")
+    try:
+        write_bars(directory, strategy.data)
+
+        runs = combinations(params)
+        workers = workers or os.cpu_count()
+        logger.info(f"Running {len(runs)} backtests on {workers} processes")
+
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(directory, pair_file, trading_strategy)) as executor:
+            results = list(executor.map(run_backtest, runs, chunksize=max(1, len(runs) // (workers * 4))))
+
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    return pd.DataFrame(results).sort_values(rank, ascending=rank in cost_columns, kind="stable").reset_index(drop=True)
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('trading_strategy', type=str, help='trading_strategy, the pairs.ini section to sweep')
+    parser.add_argument('--param', type=str, action='append', required=True, help='name=v1,v2,... or name=start..stop..step, repeat for every setting')
+    parser.add_argument('--days', type = int, default=33, help='Days of data from the candle store, like trading_bot_backtest.py')
+    parser.add_argument('--store_dir', type = str, default="../../data/candles", help='Candle store directory')
+    parser.add_argument('--csv_dir', type = str, default=None, help='Read <instrument>.csv files from this directory instead of the candle store')
+    parser.add_argument('--data', type = str, default=None, help='Candles pickle instead of the candle store')
+    parser.add_argument('--workers', type = int, default=None, help='Processes, defaults to the number of cores')
+    parser.add_argument('--rank', type = str, default="pl", help='Column to rank by: pl, win_rate, trades, max_drawdown ...')
+    parser.add_argument('--top', type = int, default=20, help='Rows to print')
+    parser.add_argument('--out', type = str, default=None, help='Results csv, defaults to ../../data/sweep_<trading_strategy>_<days>.csv')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    pair_file = "../trading/pairs.ini"
+    config = configparser.ConfigParser()
+    config.read(pair_file)
+    instrument = config.get(args.trading_strategy, "pair")
+
+    if args.data is not None:
+        logger.info(f"Reading data from {args.data}")
+        data = pd.read_pickle(args.data)
+    elif args.csv_dir is not None:
+        logger.info(f"Reading data from {args.csv_dir}")
+        data = read_days(CsvSource(args.csv_dir), instrument, args.days)
+    else:
+        logger.info(f"Reading data from {args.store_dir}")
+        data = read_days(ParquetSource(args.store_dir), instrument, args.days)
+
+    started = time.perf_counter()
+    results = sweep(args.trading_strategy, pair_file, data, [parse_param(param) for param in args.param], args.workers, args.rank)
+    elapsed = time.perf_counter() - started
+
+    out = args.out or f"../../data/sweep_{args.trading_strategy}_{args.days}.csv"
+    results.to_csv(out, index=False)
+
+    print(tabulate(results.head(args.top), headers="keys", showindex=False))
+    print(f"{len(results)} backtests in {elapsed:.1f}s, results: {out}")
+
+
+# python parameter_sweep.py EUR_USD#1 --param sl_perc=0.002..0.004..0.0005 --param tp_perc=0.003,0.0035,0.004 --param keep_trade_open_time=60,90,120
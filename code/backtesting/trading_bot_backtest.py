@@ -13,18 +13,35 @@ file = Path(__file__).resolve()
 parent, root = file.parent, file.parents[1]
 sys.path.append(str(root))
 
+from backtesting.backtest_engine import BacktestEngine
+from trading.api.candle_source import CandleSource, CsvSource, OandaSource, ParquetSource
 from trading.api.oanda_api import OandaApi
 from trading.strategies.base.strategy_exec import TradingStrategyExec
+from trading.utils.candle_store import CandleStore
 from trading.utils import utils
 
 logger = logging.getLogger()
 
+def read_days(source: CandleSource, instrument, days) -> pd.DataFrame:
+
+    # the backtest window, the complete UTC days before today, with and without --refresh
+    today = datetime.combine(datetime.now(tz=timezone.utc).date(), datetime.min.time())
+    return source.candles(instrument, today - timedelta(days=days), today)
+
+
 class TradingBacktester():
     
-    def __init__(self, conf_file, pairs_file, trading_strategy, days = 33, refresh = False):
+    def __init__(self, conf_file, pairs_file, trading_strategy, days = 33, refresh = False, vectorized = True, store_dir = "../../data/candles",
+                 source: CandleSource = None):
         
         self.days = days
         self.refresh = refresh
+        # one parquet file per instrument per day, shared by every --days value
+        self.store = CandleStore(store_dir)
+        # where the data comes from without refresh, the candle store by default
+        self.source = source or ParquetSource(store_dir)
+        # walk NumPy arrays with BacktestEngine instead of DataFrame.iterrows, the trades are the same
+        self.vectorized = vectorized
         self.api = OandaApi(conf_file)
         config = configparser.ConfigParser()  
         config.read(pairs_file)
@@ -61,22 +78,43 @@ class TradingBacktester():
     
     def get_history_with_all_prices(self):
         
-        df: pd.DataFrame = self.api.get_price_candles(self.strategy.instrument, self.days)
+        # only the days missing from the store are downloaded
+        df: pd.DataFrame = read_days(OandaSource(self.api, store=self.store), self.strategy.instrument, self.days)
                
         return df
 
-    def get_data(self):
+    def read_legacy_cache(self) -> pd.DataFrame:
 
+        # the pickle of now - days to now the backtester wrote before the candle store, None if there is none
         pcl_file_name = f"../../data/backtest_{self.strategy.instrument}_{self.days}.pcl"
+        if not os.path.exists(pcl_file_name):
+            return None
+
+        logger.warning(f"Reading the old cache {pcl_file_name}, run with --refresh True to move to the candle store")
+        return pd.read_pickle(pcl_file_name)
+
+    def get_data(self):
+
         if self.refresh:
-            logger.info("Getting data from OANDA API...")                
+            logger.info("Getting missing data from OANDA API...")                
             df = self.get_history_with_all_prices()
-            logger.info(f"Saving data to {pcl_file_name}")
-            df.to_pickle(pcl_file_name)
-            # df.to_excel(f"../../data/backtest_{self.strategy.instrument}.xlsx")
         else:
-            logger.info(f"Reading data from {pcl_file_name}")
-            df = pd.read_pickle(pcl_file_name)
+            # the complete days of the period from the local files, no network
+            logger.info(f"Reading data from {type(self.source).__name__}")
+            try:
+                df = read_days(self.source, self.strategy.instrument, self.days)
+            except ImportError as error:
+                # the candle store needs pyarrow
+                df = self.read_legacy_cache()
+                if df is None:
+                    raise ImportError(f"{error} Or read CSV files with --csv_dir.") from error
+
+            if len(df) == 0:
+                legacy = self.read_legacy_cache()
+                if legacy is None:
+                    logger.warning(f"No {self.strategy.instrument} candles for the last {self.days} days, run with --refresh True to download them")
+                else:
+                    df = legacy
       
         # df = df.between_time(self.start, self.end)
         return df
@@ -101,22 +139,11 @@ class TradingBacktester():
             #     logger.error("Couldn't wtite to " + f"../../data/backtest_{self.strategy.instrument}_{self.days}.xlsx." + " File is open")
  
  
-            pause_trading = None
-
             logger.info(f"Starting trading for {self.strategy.instrument}...")
-            for index, row in self.strategy.data.iterrows():
-
-                self.strategy.set_strategy_indicators(row=row)
-                
-                if pause_trading == None or index > pause_trading:
-                    trade_action = self.strategy.determine_trade_action(trading_time=index)
-                                        
-                    if trade_action:
-                        self.strategy.trading_session.open_trade = trade_action.open_trade
-
-                        if trade_action.sl_trade:
-                            logger.debug(f"Pausing trading for 5 minutes at {index}")
-                            pause_trading = index + timedelta(minutes = 1)                        
+            if self.vectorized:
+                BacktestEngine(self.strategy).run()
+            else:
+                self.trade_rows()
         
             logger.info("Finished trading, printing report...")
             self.strategy.trading_session.print_trades()
@@ -130,6 +157,24 @@ class TradingBacktester():
         finally:
             logger.info("Stoping Backtesting")
 
+    def trade_rows(self):
+
+        pause_trading = None
+
+        for index, row in self.strategy.data.iterrows():
+
+            self.strategy.set_strategy_indicators(row=row)
+            
+            if pause_trading == None or index > pause_trading:
+                trade_action = self.strategy.determine_trade_action(trading_time=index)
+                                    
+                if trade_action:
+                    self.strategy.trading_session.open_trade = trade_action.open_trade
+
+                    if trade_action.sl_trade:
+                        logger.debug(f"Pausing trading for 5 minutes at {index}")
+                        pause_trading = index + timedelta(minutes = 1)                        
+
 
 if __name__ == "__main__":
 
@@ -138,6 +183,9 @@ if __name__ == "__main__":
 
     parser.add_argument('--days', type = int, default=33, help='Number of days, numeric only')
     parser.add_argument('--refresh', choices=['True', 'False', 'true', 'false'], default="False", type = str, help='Refresh data')
+    parser.add_argument('--store_dir', type = str, default="../../data/candles", help='Candle store directory')
+    parser.add_argument('--csv_dir', type = str, default=None, help='Read <instrument>.csv files from this directory instead of the candle store')
+    parser.add_argument('--vectorized', choices=['True', 'False', 'true', 'false'], default="True", type = str, help='Run the bars through BacktestEngine instead of iterrows')
     args = parser.parse_args()
 
     
@@ -151,7 +199,9 @@ if __name__ == "__main__":
     trader = TradingBacktester(
         conf_file=config_file,
         pairs_file="../trading/pairs.ini",
-        trading_strategy=args.trading_strategy, days=args.days, refresh=(args.refresh in ['True', 'true']))
+        trading_strategy=args.trading_strategy, days=args.days, refresh=(args.refresh in ['True', 'true']),
+        vectorized=(args.vectorized in ['True', 'true']), store_dir=args.store_dir,
+        source=(None if args.csv_dir is None else CsvSource(args.csv_dir)))
 
     trader.start_trading_backtest()
 
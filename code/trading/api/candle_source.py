@@ -0,0 +1,232 @@
+import logging
+import os
+import sys
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+file = Path(__file__).resolve()
+parent, root = file.parent, file.parents[1]
+sys.path.append(str(root))
+
+from utils.candle_store import COLUMNS, CandleStore
+
+logger = logging.getLogger()
+
+"""
+Candles from anywhere in one schema, so a backtest does not care where they come from.
+
+Every CandleSource returns frames like OandaApi's: indexed by naive UTC time (datetime64[ns], named time) with
+volume (int64), close, bid and ask (float64), sorted, one row per time. Sources without quotes (yfinance) have
+bid and ask equal to close. Ranges are start <= time < end, times without a time zone are UTC.
+
+    OandaSource     OandaApi, optionally through the candle store
+    YFinanceSource  yfinanceApi, needs the yfinance package
+    CsvSource       <directory>/<instrument>.csv with a time column and the schema's columns
+    ParquetSource   a candle store directory, <directory>/<instrument>/<YYYY-MM-DD>.parquet
+
+iter_candles walks a range in chunks of time, fetch gets several instruments at once on worker threads.
+"""
+
+
+def naive_utc(t) -> pd.Timestamp:
+
+    t = pd.Timestamp(t)
+    return t if t.tz is None else t.tz_convert("UTC").tz_localize(None)
+
+
+def empty_candles() -> pd.DataFrame:
+
+    return pd.DataFrame({"volume": pd.Series(dtype="int64"), "close": pd.Series(dtype="float64"), "bid": pd.Series(dtype="float64"),
+                         "ask": pd.Series(dtype="float64")}, index=pd.DatetimeIndex([], dtype="datetime64[ns]", name="time"))
+
+
+def conform(df: pd.DataFrame) -> pd.DataFrame:
+
+    """
+        df in the common schema, the columns other than volume, close, bid and ask are dropped
+    """
+
+    if df is None or len(df) == 0:
+        return empty_candles()
+
+    index = pd.DatetimeIndex(df.index)
+    if index.tz is not None:
+        index = index.tz_convert("UTC").tz_localize(None)
+
+    close = df["close"].to_numpy(dtype=np.float64)
+    candles = pd.DataFrame({
+        "volume": df["volume"].fillna(0).to_numpy(dtype=np.int64) if "volume" in df else np.zeros(len(df), dtype=np.int64),
+        "close": close,
+        "bid": df["bid"].to_numpy(dtype=np.float64) if "bid" in df else close,
+        "ask": df["ask"].to_numpy(dtype=np.float64) if "ask" in df else close
+    }, index=index.as_unit("ns").rename("time"))
+
+    if not candles.index.is_monotonic_increasing:
+        candles = candles.sort_index(kind="stable")
+
+    return candles[~candles.index.duplicated()]
+
+
+def windows(frames, start, end, chunk: timedelta):
+
+    """
+        Re-slices time ordered frames into the non-empty chunk long windows from start, rows outside start..end are dropped
+    """
+
+    pending = []
+    window_end = start + chunk
+
+    for frame in frames:
+        frame = frame[(frame.index >= start) & (frame.index < end)]
+
+        while len(frame) > 0:
+            cut = frame.index.searchsorted(window_end)
+            if cut == len(frame):
+                pending.append(frame)
+                break
+
+            # a row past the window closes it, the next window is the one of that row
+            pending.append(frame.iloc[:cut])
+            window = pd.concat(pending)
+            if len(window) > 0:
+                yield window
+            pending = []
+            frame = frame.iloc[cut:]
+            window_end = window_end + chunk * ((frame.index[0] - window_end) // chunk + 1)
+
+    if pending:
+        yield pd.concat(pending)
+
+
+class CandleSource(ABC):
+
+    @abstractmethod
+    def candles(self, instrument, date_f, date_t) -> pd.DataFrame:
+
+        """
+            The candles of instrument with date_f <= time < date_t in the common schema
+        """
+
+    def iter_candles(self, instrument, date_f, date_t, chunk = timedelta(days=1)):
+
+        """
+            The candles of date_f to date_t as one frame per chunk of time, chunks without candles are skipped
+        """
+
+        start, end = naive_utc(date_f), naive_utc(date_t)
+        while start < end:
+            stop = min(start + chunk, end)
+            df = self.candles(instrument, start, stop)
+            if len(df) > 0:
+                yield df
+            start = stop
+
+    def fetch(self, instruments, date_f, date_t, workers = 4) -> dict:
+
+        """
+            instrument -> candles of every instrument, fetched by workers threads
+        """
+
+        if len(instruments) <= 1:
+            return {instrument: self.candles(instrument, date_f, date_t) for instrument in instruments}
+
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="sources") as executor:
+            return dict(zip(instruments, executor.map(lambda instrument: self.candles(instrument, date_f, date_t), instruments)))
+
+
+class OandaSource(CandleSource):
+
+    def __init__(self, api, granularity = "S30", store: CandleStore = None):
+
+        # api is an OandaApi, store keeps the complete days of S30 candles so they are downloaded once
+        self.api = api
+        self.granularity = granularity
+        self.store = store
+
+    def candles(self, instrument, date_f, date_t) -> pd.DataFrame:
+
+        date_f, date_t = naive_utc(date_f).tz_localize("UTC"), naive_utc(date_t).tz_localize("UTC")
+
+        if self.store is not None and self.granularity == "S30":
+            df = self.api.get_stored_price_candles(instrument, date_f, date_t, self.store)
+        else:
+            df = self.api.get_price_candles_between(instrument, date_f, date_t, self.granularity)
+
+        df = conform(df)
+        return df[df.index < date_t.tz_localize(None)]
+
+
+class YFinanceSource(CandleSource):
+
+    def __init__(self, interval = "1m"):
+
+        # yfinance is optional, only this source needs it
+        from api.yfinance_api import yfinanceApi
+
+        self.api = yfinanceApi()
+        self.interval = interval
+
+    def candles(self, instrument, date_f, date_t) -> pd.DataFrame:
+
+        date_f, date_t = naive_utc(date_f).tz_localize("UTC"), naive_utc(date_t).tz_localize("UTC")
+        df = conform(self.api.get_price_candles_between(instrument, date_f, date_t, self.interval))
+        return df[(df.index >= date_f.tz_localize(None)) & (df.index < date_t.tz_localize(None))]
+
+
+class CsvSource(CandleSource):
+
+    def __init__(self, directory, chunk_rows = 500_000):
+
+        # the files are read chunk_rows rows at a time and must be in time order
+        self.directory = directory
+        self.chunk_rows = chunk_rows
+
+    def file_name(self, instrument) -> str:
+        return os.path.join(self.directory, f"{instrument}.csv")
+
+    def read_chunks(self, instrument):
+
+        file_name = self.file_name(instrument)
+        if not os.path.exists(file_name):
+            logger.warning(f"No candles file {file_name}")
+            return
+
+        reader = pd.read_csv(file_name, usecols=lambda column: column in ["time", *COLUMNS], chunksize=self.chunk_rows)
+        for chunk in reader:
+            chunk.index = pd.to_datetime(chunk.pop("time"), format="ISO8601", utc=True)
+            yield conform(chunk)
+
+    def candles(self, instrument, date_f, date_t) -> pd.DataFrame:
+
+        start, end = naive_utc(date_f), naive_utc(date_t)
+
+        frames = []
+        for chunk in self.read_chunks(instrument):
+            if len(chunk) > 0 and chunk.index[0] >= end:
+                break
+            frames.append(chunk[(chunk.index >= start) & (chunk.index < end)])
+
+        frames = [frame for frame in frames if len(frame) > 0]
+        return pd.concat(frames) if frames else empty_candles()
+
+    def iter_candles(self, instrument, date_f, date_t, chunk = timedelta(days=1)):
+
+        # one pass over the file instead of one per chunk
+        start, end = naive_utc(date_f), naive_utc(date_t)
+        yield from windows(self.read_chunks(instrument), start, end, chunk)
+
+
+class ParquetSource(CandleSource):
+
+    def __init__(self, directory):
+
+        # only the day files of a range are opened, see CandleStore.read
+        self.store = CandleStore(directory)
+
+    def candles(self, instrument, date_f, date_t) -> pd.DataFrame:
+        return conform(self.store.read(instrument, naive_utc(date_f), naive_utc(date_t)))
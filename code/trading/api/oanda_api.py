@@ -2,26 +2,167 @@ import configparser
 import json
 import logging
 import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
 from pathlib import Path
 
+import numpy as np
 import pandas as pd
 import requests
-from dateutil import parser
 
 file = Path(__file__).resolve()
 parent, root = file.parent, file.parents[1]
 sys.path.append(str(root))
 
+from api.request_scheduler import CANDLES, ORDER, POSITION, RequestScheduler, RetryPolicy
 from dom.order import Order
 from utils import utils
+from utils.candle_cache import CandleCache
+from utils.candle_store import CandleStore
+from utils.ticks import Tick, decode_price, parse_time_ns
 
 logger = logging.getLogger()
 
+# OANDA returns at most 5000 candles per request
+max_candles = 5000
+granularity_seconds = dict(S5=5, S10=10, S15=15, S30=30, M1=60, M2=120, M4=240, M5=300, M10=600, M15=900, M30=1800,
+                           H1=3600, H2=7200, H3=10800, H4=14400, H6=21600, H8=28800, H12=43200, D=86400)
+
+
+def candle_chunks(date_f, date_t, granularity="S30", count = max_candles, aligned = False) -> list:
+
+    """
+        Splits date_f to date_t into (from, to) ranges of at most count candles.
+        aligned puts the boundaries on a grid from the epoch, so overlapping ranges share their chunks and the
+        candle cache can serve them: the first chunk may start before date_f and the last one end after date_t.
+    """
+
+    # one candle less, so a chunk stays under the cap when the candle at its "to" time is included too
+    step = timedelta(seconds=granularity_seconds[granularity] * (count - 1))
+
+    if aligned:
+        date_f = pd.Timestamp(date_f).floor(step)
+
+    chunks = []
+    while date_f < date_t:
+        chunks.append((date_f, date_f + step if aligned else min(date_f + step, date_t)))
+        date_f = date_f + step
+
+    return chunks
+
+
+def utc_timestamp(t) -> pd.Timestamp:
+
+    # naive times are taken as UTC
+    t = pd.Timestamp(t)
+    return t.tz_localize("UTC") if t.tz is None else t.tz_convert("UTC")
+
+
+def convert_candles(data, ohlc = False) -> pd.DataFrame:
+
+    """
+        OANDA candles to a frame indexed by their naive UTC time: volume, close (the mid close), bid and ask (the
+        bid and ask closes) for the prices in the candles. ohlc adds open, high, low and bid_o, bid_h, bid_l, ask_o ...
+        Every column is read into an array in one pass over the candles, the times are parsed in bulk.
+    """
+
+    count = len(data)
+
+    stamps = [candle['time'] for candle in data]
+    if all(stamp.endswith("Z") for stamp in stamps):
+        # UTC RFC 3339 times with nanoseconds, numpy parses them in C once the Z is gone
+        times = np.array([stamp[:-1] for stamp in stamps], dtype="datetime64[ns]")
+    else:
+        times = pd.to_datetime(stamps, format="ISO8601", utc=True).tz_localize(None).to_numpy()
+
+    columns = dict(volume=np.fromiter((candle['volume'] for candle in data), dtype=np.int64, count=count))
+
+    for price in [price for price in ['mid', 'bid', 'ask'] if price in data[0]]:
+        names = dict(o="open", h="high", l="low", c="close") if price == 'mid' else dict(o=f"{price}_o", h=f"{price}_h", l=f"{price}_l", c=price)
+        for field in (["o", "h", "l", "c"] if ohlc else ["c"]):
+            columns[names[field]] = np.fromiter((float(candle[price][field]) for candle in data), dtype=np.float64, count=count)
+
+    return pd.DataFrame(columns, index=pd.DatetimeIndex(times, name="time"))
+
+
+def account_hosts(section) -> tuple:
+
+    """
+        The REST and the streaming host of the [oanda] config section
+    """
+
+    if section['account_type'] == 'live':
+        hostname = "https://api-fxtrade.oanda.com/v3"
+        stream_hostname = "https://stream-fxtrade.oanda.com/v3"
+    else:
+        hostname = "https://api-fxpractice.oanda.com/v3"
+        stream_hostname = "https://stream-fxpractice.oanda.com/v3"
+
+    # lets a local stand-in server (unit/oanda_stub.py) replace OANDA
+    return section.get('hostname', hostname), section.get('stream_hostname', stream_hostname)
+
+
+def order_data(order: Order, client_id = None) -> dict:
+
+    data = dict(
+        order=dict(
+            units=str(order.units),
+            instrument=order.instrument,
+            type="MARKET",
+            positionFill="DEFAULT",
+            timeInForce="FOK"
+        )
+    )
+
+    if order.sl is not None:
+        stopLossOnFill = dict(price=str(order.sl))
+        data['order']['stopLossOnFill'] = stopLossOnFill
+
+    if order.tp is not None:
+        takeProfitOnFill = dict(price=str(order.tp))
+        data['order']['takeProfitOnFill'] = takeProfitOnFill
+
+    if client_id is not None:
+        data['order']['clientExtensions'] = dict(id=client_id)
+
+    return data
+
+
+def order_result(ok, response) -> dict:
+
+    # rejected orders come back with an error status
+    if ok or 'orderRejectTransaction' in response:
+        result = None
+        if 'orderRejectTransaction' in response:
+            result = response.get('orderRejectTransaction')
+        elif 'orderFillTransaction' in response:
+            result = response.get('orderFillTransaction')
+        elif 'orderCreateTransaction' in response:
+            result = response.get('orderCreateTransaction')
+
+        return result
+
+    return None
+
+
+def position_snapshot(ok, data) -> tuple:
+
+    units = 0
+    last_transaction_id = None
+    if ok and "position" in data:
+        long_units = data["position"]["long"]["units"] # type: ignore
+        short_units = data["position"]["short"]["units"] # type: ignore
+        units = round(float(long_units) + float(short_units), 0)
+        last_transaction_id = int(data.get("lastTransactionID", 0))
+
+    return units, last_transaction_id
+
 
 class OandaApi:
 
     def __init__(self, config_file):
+        # the streams' long lived connections, every other request goes through the shared scheduler
         self.session = requests.Session()
 
         self.config = configparser.ConfigParser()
@@ -29,13 +170,7 @@ class OandaApi:
         self.access_token = self.config['oanda']['access_token']
         self.account_id = self.config['oanda']['account_id']
         self.account_type = self.config['oanda']['account_type']
-
-        if self.account_type == 'live':
-            self.hostname = "https://api-fxtrade.oanda.com/v3"
-            self.stream_hostname = "https://stream-fxtrade.oanda.com/v3"
-        else:
-            self.hostname = "https://api-fxpractice.oanda.com/v3"
-            self.stream_hostname = "https://stream-fxpractice.oanda.com/v3"
+        self.hostname, self.stream_hostname = account_hosts(self.config['oanda'])
 
         self.SECURE_HEADER = {
             "Authorization": f"Bearer {self.access_token}",
@@ -43,7 +178,36 @@ class OandaApi:
         }
 
         self.session.headers.update(self.SECURE_HEADER)
+
+        # every OandaApi of the account in the process shares the rate limit, the connection pool and the
+        # priority queue, orders go before position requests before candle downloads. See request_scheduler.py
+        self.scheduler = RequestScheduler.shared(
+            (self.hostname, self.access_token),
+            headers=self.SECURE_HEADER,
+            rate=self.config['oanda'].getfloat('request_rate', 100),
+            burst=self.config['oanda'].getint('request_burst', 20),
+            pool_size=self.config['oanda'].getint('request_pool', 10),
+            policies={
+                POSITION: RetryPolicy(self.config['oanda'].getint('position_retries', 2)),
+                CANDLES: RetryPolicy(self.config['oanda'].getint('candle_retries', 3))
+            }
+        )
         self.stop_stream = False
+        self.stop_transactions = False
+
+        # OANDA sends a heartbeat every 5 seconds on both streams, a longer silence means the connection is dead
+        self.stream_timeout = self.config['oanda'].getfloat('stream_timeout', 20)
+
+        # a trading.utils.latency.LatencyRecorder, set by the Trader
+        self.latency = None
+
+        # historical candles are downloaded in chunks by candle_workers threads
+        self.candle_workers = self.config['oanda'].getint('candle_workers', 4)
+
+        # the complete candles of from/to requests are kept on disk, "None" to disable. See candle_cache.py
+        cache_dir = self.config['oanda'].get('candle_cache', "../../data/candle_cache")
+        self.candle_cache = None if cache_dir == "None" else CandleCache(
+            cache_dir, max_bytes=self.config['oanda'].getint('candle_cache_mb', 1024) * 1024 * 1024)
 
     def get_latest_price_candles(self, pair_name) -> pd.DataFrame:
 
@@ -55,104 +219,215 @@ class OandaApi:
             count=utils.ticker_data_size
         )
 
-        ok, data = self.__make_request(url, params=params)
+        ok, data = self.__make_request(url, params=params, priority=CANDLES)
 
         if ok and 'candles' in data:
-            # logger.info(f"Candles: {data['candles']}")
-            df = self.__convert_to_df(data['candles'])
-            df = df.set_index('time')
-            df.index = df.index.tz_localize(None)
-            return df
+            return self.__candles_frame(data['candles'])
         else:
             print("ERROR fetch_candles()", params, data)
             return None
 
 
 
-    def get_price_candles(self, pair_name, days = 0, hours = 0, minutes = 0, seconds = 0):
+    def get_price_candles_since(self, pair_name, date_f) -> pd.DataFrame:
+
+        # candles from date_f on, up to and including the forming one like get_latest_price_candles
+        url = f"instruments/{pair_name}/candles"
+        params = dict(
+            granularity="S30",
+            price="MBA",
+            count=utils.ticker_data_size
+        )
+        params["from"] = datetime.strftime(date_f, "%Y-%m-%dT%H:%M:%SZ")
+
+        ok, data = self.__make_request(url, params=params, priority=CANDLES)
+
+        if ok and 'candles' in data:
+            return self.__candles_frame(data['candles'])
+        else:
+            print("ERROR fetch_candles()", params, data)
+            return None
+
+    def get_price_candles(self, pair_name, days = 0, hours = 0, minutes = 0, seconds = 0, store: CandleStore = None):
 
         now = datetime.now(tz=timezone.utc)
         now = now - timedelta(seconds=now.second, microseconds=now.microsecond)
         past = now - timedelta(days=days, hours=hours, minutes=minutes, seconds=seconds)
 
-        df = pd.DataFrame()
+        if store is not None:
+            return self.get_stored_price_candles(pair_name, past, now, store)
 
-        if days == 0:
-            logger.debug(f"Getting price candles for {pair_name} from {past} to {now}")
-            data_t: pd.DataFrame = self.__fetch_candles(date_f=past, date_t=now, pair_name=pair_name, granularity="S30", price="MBA")
-            df = self.__convert_to_df(data_t)
-        else:
-            for i in range(0, days):
+        return self.get_price_candles_between(pair_name, past, now)
+
+    def get_price_candles_between(self, pair_name, date_f, date_t, granularity="S30", ohlc = False) -> pd.DataFrame:
+
+        """
+            Candles from date_f to date_t, downloaded concurrently in chunks under the 5000 candles cap.
+            ohlc adds the open, high and low columns, see convert_candles.
+        """
+
+        # with the cache the chunks are aligned, the same ones for every range that covers them
+        aligned = self.candle_cache is not None
+        chunks = candle_chunks(date_f, date_t, granularity, aligned=aligned)
+        logger.debug(f"Getting price candles for {pair_name} from {date_f} to {date_t} in {len(chunks)} requests")
 
-                start_d = past + timedelta(days=i)
-                end_d = start_d + timedelta(days=1)
+        results = self.fetch_candle_chunks(pair_name, chunks, granularity, until=date_t)
+        failed = [chunk for chunk, candles in zip(chunks, results) if candles is None]
+        if failed:
+            raise Exception(f"Failed to fetch {pair_name} candles from {failed[0][0]} to {failed[0][1]} and {len(failed) - 1} more ranges")
 
-                logger.debug(f"Getting price candles for {pair_name} from {start_d} to {end_d}")
-                data_t: pd.DataFrame = self.__fetch_candles(date_f=start_d, date_t=end_d, pair_name=pair_name, granularity="S30", price="MBA")
-                df_t = self.__convert_to_df(data_t)
-                df = pd.concat([df, df_t])
+        # converted once, chunks share the candle at their boundary when "to" is inclusive
+        df = self.__candles_frame([candle for candles in results for candle in candles], ohlc)
+        df = df[~df.index.duplicated()]
 
-        df = df.set_index('time')
-        df.index = df.index.tz_localize(None)
+        if aligned:
+            # the first aligned chunk starts before date_f
+            start = pd.Timestamp(date_f)
+            df = df[df.index >= (start if start.tz is None else start.tz_convert(None))]
 
         return df
 
-    def place_order(self, order: Order):
+    def fetch_candle_chunks(self, pair_name, chunks, granularity="S30", price="MBA", until = None) -> list:
 
-        url = f"accounts/{self.account_id}/orders"
+        """
+            The candles of every (date_f, date_t) chunk in the order of the chunks, None for the ones that failed.
+            Nothing after until is requested, chunks that end later are cached as still open.
+        """
 
-        data = dict(
-            order=dict(
-                units=str(order.units),
-                instrument=order.instrument,
-                type="MARKET",
-                positionFill="DEFAULT",
-                timeInForce="FOK"
-            )
-        )
+        fetch = lambda chunk: self.__fetch_candles(pair_name, chunk[0], chunk[1], granularity, price, until)
+
+        if len(chunks) <= 1:
+            return [fetch(chunk) for chunk in chunks]
+
+        with ThreadPoolExecutor(max_workers=self.candle_workers, thread_name_prefix="candles") as executor:
+            return list(executor.map(fetch, chunks))
+
+    def get_stored_price_candles(self, pair_name, date_f, date_t, store: CandleStore) -> pd.DataFrame:
+
+        """
+            Candles from date_f to date_t. The complete days come from the store, the ones it does not have yet
+            are fetched and stored first. The current day is fetched every time and not stored.
+        """
+
+        today = datetime.combine(date_t.date(), datetime.min.time(), tzinfo=timezone.utc)
+
+        missing = store.missing_days(pair_name, date_f.date(), today.date() - timedelta(days=1))
+        if missing:
+            logger.info(f"Fetching {len(missing)} missing days of {pair_name} candles")
+            self.store_days(pair_name, missing, store)
+
+        df = store.read(pair_name, date_f.replace(tzinfo=None), min(today, date_t).replace(tzinfo=None))
 
-        if order.sl is not None:
-            stopLossOnFill = dict(price=str(order.sl))
-            data['order']['stopLossOnFill'] = stopLossOnFill
+        if date_t > today:
+            current = self.get_price_candles_between(pair_name, max(today, date_f), date_t)
+            df = pd.concat([df, current]) if len(df) > 0 else current
 
-        if order.tp is not None:
-            takeProfitOnFill = dict(price=str(order.tp))
-            data['order']['takeProfitOnFill'] = takeProfitOnFill
+        return df
+
+    def store_days(self, pair_name, days, store: CandleStore):
+
+        # one request per UTC day, 2880 S30 candles at most, the days that came back are stored even if others failed
+        day_start = lambda day: datetime.combine(day, datetime.min.time(), tzinfo=timezone.utc)
+        results = self.fetch_candle_chunks(pair_name, [(day_start(day), day_start(day) + timedelta(days=1)) for day in days])
+
+        failed = []
+        for day, candles in zip(days, results):
+            if candles is None:
+                failed.append(day)
+            else:
+                store.write_day(pair_name, day, self.__candles_frame(candles))
+
+        if failed:
+            raise Exception(f"Failed to fetch {pair_name} candles for {', '.join(str(day) for day in failed)}")
+
+    def __candles_frame(self, data, ohlc = False) -> pd.DataFrame:
+
+        if data is None:
+            return None
+
+        if len(data) == 0:
+            return pd.DataFrame(columns=["volume", "close", "bid", "ask"], index=pd.DatetimeIndex([], name="time"))
+
+        return convert_candles(data, ohlc)
+
+    def place_order(self, order: Order, client_id = None):
+
+        """
+            Returns the fill, reject or create transaction, None if OANDA did not answer.
+            client_id goes into clientExtensions, so an order can be looked up with get_order(f"@{client_id}")
+        """
+
+        url = f"accounts/{self.account_id}/orders"
 
         ok, response = self.__make_request(
-            url, verb="post", data=data, code=201)
-
-        if ok:
-            result = None
-            if 'orderRejectTransaction' in response:
-                result = response.get('orderRejectTransaction')
-            elif 'orderFillTransaction' in response:
-                result = response.get('orderFillTransaction')
-            elif 'orderCreateTransaction' in response:
-                result = response.get('orderCreateTransaction')
-            
-            return result
-        
-        return None
+            url, verb="post", data=order_data(order, client_id), code=201, priority=ORDER)
 
+        return order_result(ok, response)
+
+
+    def get_order(self, order_specifier):
+
+        # order_specifier is an order id or @client_id
+        url = f"accounts/{self.account_id}/orders/{order_specifier}"
+        ok, data = self.__make_request(url, verb="get", code=200, priority=ORDER)
+        if ok and "order" in data:
+            return data["order"]
+
+        return None
 
     def get_position(self, instrument): 
 
-        units = 0
+        units, _ = self.get_position_snapshot(instrument)
+        return units
+
+    def get_position_snapshot(self, instrument):
+
+        """
+            Returns the position units and the id of the last transaction they include, the id is None if the request failed
+        """
+
         url = f"accounts/{self.account_id}/positions/{instrument}"
-        ok, data = self.__make_request(url, verb="get", code=200)
-        if ok and "position" in data:
-            long_units = data["position"]["long"]["units"] # type: ignore
-            short_units = data["position"]["short"]["units"] # type: ignore
-            # logger.info (f"Currently have position: {instrument} | long_units: {long_units} | short_units: {short_units}")
-            units = round(float(long_units) + float(short_units), 0)
+        ok, data = self.__make_request(url, verb="get", code=200, priority=POSITION)
 
-        return units
+        return position_snapshot(ok, data)
 
     def stop_streaming(self):
         self.stop_stream = True
+        self.stop_transactions = True
+
+    def stream_transactions(self, callback, on_connect=None, stop=None):
+
+        self.stop_transactions = False
+
+        url = f"accounts/{self.account_id}/transactions/stream"
+        response = self.session.request(url=f"{self.stream_hostname}/{url}", method = "get", stream=True, timeout=(10, self.stream_timeout))
+        response.raise_for_status()
+
+        # the stream only carries new transactions, on_connect is the place to take a snapshot of the current state
+        if on_connect:
+            on_connect()
+
+        count = 0
+        # chunk_size=None hands over every chunk as it arrives, transactions are rare and must not wait for a full buffer
+        for line in response.iter_lines(chunk_size=None):
+            if line:
+                data = json.loads(line.decode('utf-8'))
+                if data.get("type") != "HEARTBEAT":
+                    count += 1
+                    callback(data)
 
-    def stream_prices(self, instrument, callback=None, stop=None):
+            if self.stop_transactions or stop is not None and count >= stop:
+                break
+
+        response.close()
+        return
+
+    def stream_prices(self, instrument, callback=None, stop=None, on_connect=None):
+
+        """
+            Returns True if the stream was stopped (stop_streaming or stop ticks), False if the server ended it.
+            A stream silent for longer than stream_timeout raises a requests ConnectionError.
+        """
 
         self.stop_stream = False
 
@@ -160,63 +435,60 @@ class OandaApi:
         params = dict(instruments=instrument, snapshot=True)
 
         # Make the request
-        response = self.session.request(url=f"{self.stream_hostname}/{url}", method = "get", params=params, stream=True)
+        response = self.session.request(url=f"{self.stream_hostname}/{url}", method = "get", params=params, stream=True, timeout=(10, self.stream_timeout))
+        response.raise_for_status()
+
+        # ticks are not read before on_connect returns, the place to fill the gap since the last connection
+        if on_connect:
+            on_connect()
 
         # Handle the streaming response
-        result = self.__handle_response(response, callback, stop)
+        try:
+            return self.__handle_response(response, callback, stop)
+        finally:
+            response.close()
 
-        return result
-    def __on_success(self, **kwargs):
+    def __on_success(self, tick: Tick):
         
-        print(f"Instrument: {kwargs.get('instrument')} | Time: {kwargs.get('time')} | \
-            Bid: {kwargs.get('bid')} | \
-                Ask: {kwargs.get('ask')} | \
-                    Status: {kwargs.get('status')}")
+        print(f"Instrument: {tick.instrument} | Time: {tick.time_ns} | \
+            Bid: {tick.bid} | \
+                Ask: {tick.ask} | \
+                    Status: {tick.status}")
 
-    def __handle_response(self, response, callback, stop):
+    def __handle_response(self, response, callback, stop) -> bool:
 
         count = 0
-        for line in response.iter_lines():
-            if line:
-                data = json.loads(line.decode('utf-8'))
-                # print (data)
-                if data.get("type") == "PRICE":
-                    count += 1
-                    instrument = data["instrument"]
-                    time = data["time"]
-                    bid = float(data["closeoutBid"])
-                    ask = float(data["closeoutAsk"])
-                    status = data["status"]                    
-                    if callback and status:
-                        callback(instrument=instrument, time=time, bid=bid, ask=ask, status=status)
-                    else:
-                        self.__on_success(instrument=instrument, time=time, bid=bid, ask=ask, status=status)
-                
-                    if self.stop_stream or stop is not None and count >= stop:
-                        break
+        latency = self.latency
+        # decode_price skips heartbeats and hands over a Tick with the time as int64 ns
+        for line in response.iter_lines(chunk_size=None):
+            received = time.perf_counter_ns()
+            tick = decode_price(line, received)
+            if tick is not None:
+                count += 1
+                if latency is not None:
+                    latency.since("decode", received)
+                if callback and tick.status:
+                    callback(tick)
+                else:
+                    self.__on_success(tick)
+            
+            # checked on heartbeats too, so stop_streaming takes effect on a quiet stream
+            if self.stop_stream or stop is not None and count >= stop:
+                return True
 
-        return
+        return self.stop_stream
 
-    def __make_request(self, url, verb='get', code=200, params=None, data=None, headers=None):
+    def __make_request(self, url, verb='get', code=200, params=None, data=None, headers=None, priority=POSITION):
         full_url = f"{self.hostname}/{url}"
 
+        if verb not in ["get", "post", "put"]:
+            return False, {'error': 'verb not found'}
+
         if data is not None:
             data = json.dumps(data)
 
         try:
-            response = None
-            if verb == "get":
-                response = self.session.get(
-                    full_url, params=params, data=data, headers=headers)
-            if verb == "post":
-                response = self.session.post(
-                    full_url, params=params, data=data, headers=headers)
-            if verb == "put":
-                response = self.session.put(
-                    full_url, params=params, data=data, headers=headers)
-
-            if response == None:
-                return False, {'error': 'verb not found'}
+            response = self.scheduler.request(verb, full_url, priority=priority, params=params, data=data, headers=headers)
 
             if response.status_code == code:
                 return True, response.json()
@@ -224,9 +496,52 @@ class OandaApi:
                 return False, response.json()
 
         except Exception as error:
+            # no answer after the retries, or not json
+            logger.warning(f"{verb.upper()} {url} failed: {error!r}")
             return False, {'Exception': error}
 
-    def __fetch_candles(self, pair_name, date_f, date_t, granularity="S30", price="MBA") -> pd.DataFrame:
+    def __fetch_candles(self, pair_name, date_f, date_t, granularity="S30", price="MBA", until = None) -> list:
+
+        """
+            The candles from date_f to date_t, or to until when that comes first. With the cache the complete
+            candles of the range are read from disk and only the ones after them are requested.
+        """
+
+        if self.candle_cache is None:
+            return self.__request_candles(pair_name, date_f, date_t if until is None else min(date_t, until), granularity, price)
+
+        # naive times are UTC, like the candle times
+        date_f, date_t = utc_timestamp(date_f), utc_timestamp(date_t)
+        date_u = date_t if until is None else min(date_t, utc_timestamp(until))
+
+        key = self.candle_cache.key(pair_name, granularity, price, date_f, date_t)
+        entry = self.candle_cache.get(key)
+        cached = [] if entry is None else entry["candles"]
+
+        # the still forming tail, from the candle after the last complete one
+        last_ns = parse_time_ns(cached[-1]["time"]) if cached else None
+        tail_f = date_f if last_ns is None else pd.Timestamp(last_ns + granularity_seconds[granularity] * 1_000_000_000, tz="UTC")
+        if (entry is not None and entry["closed"]) or tail_f >= date_u:
+            return [candle for candle in cached if parse_time_ns(candle["time"]) < date_u.value]
+
+        fresh = self.__request_candles(pair_name, tail_f, date_u, granularity, price)
+        if fresh is None:
+            return None
+
+        candles = cached + [candle for candle in fresh if last_ns is None or parse_time_ns(candle["time"]) > last_ns]
+
+        complete = 0
+        while complete < len(candles) and candles[complete].get("complete", False):
+            complete = complete + 1
+
+        # closed: nothing in the range can change anymore
+        closed = complete == len(candles) and date_u == date_t and date_t <= pd.Timestamp.now(tz="UTC")
+        if complete > len(cached) or closed:
+            self.candle_cache.put(key, candles[:complete], closed)
+
+        return candles
+
+    def __request_candles(self, pair_name, date_f, date_t, granularity="S30", price="MBA") -> list:
 
         url = f"instruments/{pair_name}/candles"
         params = dict(
@@ -238,46 +553,15 @@ class OandaApi:
         params["from"] = datetime.strftime(date_f, date_format)
         params["to"] = datetime.strftime(date_t, date_format)
 
-        ok, data = self.__make_request(url, params=params)
+        # retried by the scheduler's candles policy
+        ok, data = self.__make_request(url, params=params, priority=CANDLES)
 
         if ok and 'candles' in data:
-            # logger.info(f"Candles: {data['candles']}")
             return data['candles']
         else:
             print("ERROR fetch_candles()", params, data)
             return None
 
-    def __convert_to_df(self, data):
-
-        if data is None:
-            return None
-
-        if len(data) == 0:
-            return pd.DataFrame()
-
-        prices = ['mid', 'bid', 'ask']
-
-        final_data = []
-        for candle in data:
-            # if not candle["complete"]:
-            #     continue
-            
-            new_dict = {}
-            new_dict['time'] = parser.parse(candle['time'])
-            new_dict['volume'] = candle['volume']
-            
-            for p in prices:
-                if p in candle:
-                    new_dict[f"{p}"] = float(candle[p]["c"])
-                    # if p == 'mid':
-                    #     new_dict[f"{p}_o"] = float(candle[p]["o"])
-
-            final_data.append(new_dict)
-
-        df = pd.DataFrame.from_dict(final_data)
-        df.rename(columns={"mid": "close"}, inplace=True)
-        return df
-
 if __name__ == "__main__":
     api = OandaApi("../../../config/oanda.cfg")
     api.stream_prices(instrument="EUR_USD", stop = 5)
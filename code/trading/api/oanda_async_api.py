@@ -0,0 +1,431 @@
+import asyncio
+import configparser
+import json
+import logging
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+import aiohttp
+import pandas as pd
+
+file = Path(__file__).resolve()
+parent, root = file.parent, file.parents[1]
+sys.path.append(str(root))
+
+from api.oanda_api import account_hosts, candle_chunks, convert_candles, order_data, order_result, position_snapshot
+from api.request_scheduler import CANDLES, ORDER, POSITION, RequestQueue, RetryPolicy, retry_statuses
+from dom.order import Order
+from utils import utils
+from utils.ticks import decode_price
+
+logger = logging.getLogger()
+
+"""
+asyncio counterpart of OandaApi: price and transaction streams, candles, positions and orders as coroutines on one
+event loop, so a process can stream and trade many instruments without a thread per stream.
+
+It reads the same oanda config. Requests go through AsyncRequestScheduler, the loop's transport for the
+RequestQueue policy RequestScheduler uses too: the same token bucket, priorities, retry policies and counters,
+with an aiohttp connection pool of request_pool keep-alive connections. The streams have their own session, they hold their connections for hours.
+Open the sessions with `async with AsyncOandaApi(config_file) as api:` or open() / close() on the loop.
+BlockingOandaApi makes its requests for the code that expects OandaApi's blocking calls and runs off the loop.
+"""
+
+
+class AsyncRequestScheduler(RequestQueue):
+
+    def __init__(self, session: aiohttp.ClientSession, rate = 100, burst = 20, pool_size = 10, policies = None):
+
+        super().__init__(rate, burst, pool_size, policies)
+        self.session = session
+
+        # everything runs on the loop thread, waiters only need to be woken when the queue or the pool changes
+        self.change = asyncio.Event()
+
+    async def request(self, verb, url, priority = POSITION, **kwargs) -> tuple:
+
+        """
+            Returns the status and the json body (None if it is not json) of the response, raises the last
+            exception when every attempt failed without one. kwargs go to aiohttp.ClientSession.request.
+        """
+
+        attempt = 0
+
+        while True:
+
+            status = None
+            data = None
+            retry_after = None
+            error = None
+
+            await self.wait_for_turn(priority)
+            try:
+                async with self.session.request(verb, url, **kwargs) as response:
+                    status = response.status
+                    retry_after = response.headers.get("Retry-After")
+                    try:
+                        data = await response.json(content_type=None)
+                    except ValueError:
+                        data = None
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                error = e
+            finally:
+                self.done()
+                self.changed()
+
+            delay = self.retry_delay(priority, attempt, error is not None or status in retry_statuses, retry_after)
+            if delay is None:
+                if error is not None:
+                    raise error
+                return status, data
+
+            attempt = attempt + 1
+            logger.warning(f"Retrying {verb.upper()} {url} in {delay:.1f}s, attempt {attempt + 1}: {error or status}")
+            await asyncio.sleep(delay)
+
+    async def wait_for_turn(self, priority):
+
+        ticket = self.enqueue(priority)
+        self.changed()
+
+        while True:
+            wait = self.turn(ticket)
+            if wait == 0:
+                break
+            await self.wait_for_change(wait)
+
+        self.changed()
+
+    def changed(self):
+
+        # wakes every waiter, each checks whether it is its turn
+        self.change.set()
+        self.change = asyncio.Event()
+
+    async def wait_for_change(self, timeout = None):
+
+        try:
+            await asyncio.wait_for(self.change.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+
+class AsyncOandaApi():
+
+    def __init__(self, config_file):
+
+        self.config = configparser.ConfigParser()
+        self.config.read(config_file)
+        self.access_token = self.config['oanda']['access_token']
+        self.account_id = self.config['oanda']['account_id']
+        self.hostname, self.stream_hostname = account_hosts(self.config['oanda'])
+
+        self.SECURE_HEADER = {
+            "Authorization": f"Bearer {self.access_token}",
+            "Content-Type": "application/json"
+        }
+
+        self.stream_timeout = self.config['oanda'].getfloat('stream_timeout', 20)
+        self.request_pool = self.config['oanda'].getint('request_pool', 10)
+
+        # a trading.utils.latency.LatencyRecorder, set by the Trader
+        self.latency = None
+
+        # created on the loop by open()
+        self.session: aiohttp.ClientSession = None
+        self.stream_session: aiohttp.ClientSession = None
+        self.scheduler: AsyncRequestScheduler = None
+
+        # one per stream kind, set by stop_streaming and never cleared: a stream that reconnects after a stop stays stopped
+        self.prices_stopped = asyncio.Event()
+        self.transactions_stopped = asyncio.Event()
+
+    async def open(self):
+
+        self.session = aiohttp.ClientSession(headers=self.SECURE_HEADER, connector=aiohttp.TCPConnector(limit=self.request_pool, keepalive_timeout=60),
+                                             timeout=aiohttp.ClientTimeout(total=None, connect=10, sock_read=30))
+        self.stream_session = aiohttp.ClientSession(headers=self.SECURE_HEADER, connector=aiohttp.TCPConnector(limit=0),
+                                                    timeout=aiohttp.ClientTimeout(total=None, connect=10, sock_read=self.stream_timeout))
+        self.scheduler = AsyncRequestScheduler(
+            self.session,
+            rate=self.config['oanda'].getfloat('request_rate', 100),
+            burst=self.config['oanda'].getint('request_burst', 20),
+            pool_size=self.request_pool,
+            policies={
+                POSITION: RetryPolicy(self.config['oanda'].getint('position_retries', 2)),
+                CANDLES: RetryPolicy(self.config['oanda'].getint('candle_retries', 3))
+            }
+        )
+        return self
+
+    async def close(self):
+
+        for session in [self.session, self.stream_session]:
+            if session is not None:
+                await session.close()
+
+    async def __aenter__(self):
+        return await self.open()
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def get_latest_price_candles(self, pair_name) -> pd.DataFrame:
+
+        url = f"accounts/{self.account_id}/candles/latest"
+        params = dict(
+            instrument=pair_name,
+            granularity="S30",
+            price="MBA",
+            count=utils.ticker_data_size
+        )
+
+        ok, data = await self.__make_request(url, params=params, priority=CANDLES)
+
+        if ok and 'candles' in data:
+            return self.__candles_frame(data['candles'])
+        else:
+            logger.error(f"ERROR fetch_candles() {params} {data}")
+            return None
+
+    async def get_price_candles_since(self, pair_name, date_f) -> pd.DataFrame:
+
+        # candles from date_f on, up to and including the forming one like get_latest_price_candles
+        url = f"instruments/{pair_name}/candles"
+        params = dict(
+            granularity="S30",
+            price="MBA",
+            count=utils.ticker_data_size
+        )
+        params["from"] = datetime.strftime(date_f, "%Y-%m-%dT%H:%M:%SZ")
+
+        ok, data = await self.__make_request(url, params=params, priority=CANDLES)
+
+        if ok and 'candles' in data:
+            return self.__candles_frame(data['candles'])
+        else:
+            logger.error(f"ERROR fetch_candles() {params} {data}")
+            return None
+
+    async def get_price_candles_between(self, pair_name, date_f, date_t, granularity="S30", ohlc = False) -> pd.DataFrame:
+
+        """
+            Candles from date_f to date_t in chunks under the 5000 candles cap, all requested at once,
+            the scheduler decides how many are in flight
+        """
+
+        chunks = candle_chunks(date_f, date_t, granularity)
+        results = await asyncio.gather(*(self.__fetch_candles(pair_name, f, t, granularity) for f, t in chunks))
+
+        failed = [chunk for chunk, candles in zip(chunks, results) if candles is None]
+        if failed:
+            raise Exception(f"Failed to fetch {pair_name} candles from {failed[0][0]} to {failed[0][1]} and {len(failed) - 1} more ranges")
+
+        df = self.__candles_frame([candle for candles in results for candle in candles], ohlc)
+        return df[~df.index.duplicated()]
+
+    def __candles_frame(self, data, ohlc = False) -> pd.DataFrame:
+
+        if len(data) == 0:
+            return pd.DataFrame(columns=["volume", "close", "bid", "ask"], index=pd.DatetimeIndex([], name="time"))
+
+        return convert_candles(data, ohlc)
+
+    async def place_order(self, order: Order, client_id = None):
+
+        """
+            Returns the fill, reject or create transaction, None if OANDA did not answer. See OandaApi.place_order
+        """
+
+        url = f"accounts/{self.account_id}/orders"
+        ok, response = await self.__make_request(url, verb="post", data=order_data(order, client_id), code=201, priority=ORDER)
+
+        return order_result(ok, response)
+
+    async def get_order(self, order_specifier):
+
+        # order_specifier is an order id or @client_id
+        url = f"accounts/{self.account_id}/orders/{order_specifier}"
+        ok, data = await self.__make_request(url, verb="get", code=200, priority=ORDER)
+        if ok and "order" in data:
+            return data["order"]
+
+        return None
+
+    async def get_position(self, instrument):
+
+        units, _ = await self.get_position_snapshot(instrument)
+        return units
+
+    async def get_position_snapshot(self, instrument):
+
+        url = f"accounts/{self.account_id}/positions/{instrument}"
+        ok, data = await self.__make_request(url, verb="get", code=200, priority=POSITION)
+
+        return position_snapshot(ok, data)
+
+    def stop_streaming(self):
+        self.prices_stopped.set()
+        self.transactions_stopped.set()
+
+    async def stream_transactions(self, callback, on_connect=None, stop=None):
+
+        """
+            callback(transaction) for every transaction but heartbeats, on_connect is awaited before the first one
+        """
+
+        if self.transactions_stopped.is_set():
+            return
+
+        url = f"{self.stream_hostname}/accounts/{self.account_id}/transactions/stream"
+        async with self.stream_session.get(url) as response:
+            response.raise_for_status()
+
+            if on_connect:
+                await on_connect()
+
+            count = 0
+            async for line in response.content:
+                line = line.strip()
+                if line:
+                    data = json.loads(line)
+                    if data.get("type") != "HEARTBEAT":
+                        count += 1
+                        callback(data)
+
+                if self.transactions_stopped.is_set() or stop is not None and count >= stop:
+                    break
+
+    async def stream_prices(self, instrument, callback, stop=None, on_connect=None) -> bool:
+
+        """
+            callback(tick) for every PRICE line, an awaitable it returns is awaited before the next line. Returns True
+            if the stream was stopped (stop_streaming or stop ticks), False if the server ended it. A stream silent for
+            longer than stream_timeout raises asyncio.TimeoutError.
+        """
+
+        if self.prices_stopped.is_set():
+            return True
+
+        url = f"{self.stream_hostname}/accounts/{self.account_id}/pricing/stream"
+        async with self.stream_session.get(url, params=dict(instruments=instrument, snapshot="true")) as response:
+            response.raise_for_status()
+
+            # ticks are not read before on_connect is done, the place to fill the gap since the last connection
+            if on_connect:
+                await on_connect()
+
+            count = 0
+            latency = self.latency
+            async for line in response.content:
+                received = time.perf_counter_ns()
+                tick = decode_price(line.strip(), received)
+                if tick is not None:
+                    count += 1
+                    if latency is not None:
+                        latency.since("decode", received)
+                    if tick.status:
+                        pending = callback(tick)
+                        if pending is not None:
+                            await pending
+
+                    # lines already buffered are read without giving the loop back, a burst must not starve the other tasks
+                    if count % 64 == 0:
+                        await asyncio.sleep(0)
+
+                if self.prices_stopped.is_set() or stop is not None and count >= stop:
+                    return True
+
+        return self.prices_stopped.is_set()
+
+    async def __make_request(self, url, verb='get', code=200, params=None, data=None, priority=POSITION):
+
+        full_url = f"{self.hostname}/{url}"
+
+        if data is not None:
+            data = json.dumps(data)
+        if params is not None:
+            params = {name: str(value) for name, value in params.items()}
+
+        try:
+            status, response = await self.scheduler.request(verb, full_url, priority=priority, params=params, data=data)
+            if response is None:
+                return False, {'error': f'status {status}, the body is not json'}
+
+            return status == code, response
+
+        except Exception as error:
+            logger.warning(f"{verb.upper()} {url} failed: {error!r}")
+            return False, {'Exception': error}
+
+    async def __fetch_candles(self, pair_name, date_f, date_t, granularity="S30", price="MBA"):
+
+        url = f"instruments/{pair_name}/candles"
+        date_format = "%Y-%m-%dT%H:%M:%SZ"
+        params = dict(granularity=granularity, price=price)
+        params["from"] = datetime.strftime(date_f, date_format)
+        params["to"] = datetime.strftime(date_t, date_format)
+
+        ok, data = await self.__make_request(url, params=params, priority=CANDLES)
+
+        if ok and 'candles' in data:
+            return data['candles']
+        else:
+            logger.error(f"ERROR fetch_candles() {params} {data}")
+            return None
+
+
+class BlockingOandaApi():
+
+    """
+        The blocking OandaApi calls of the strategies and warm starts, made by an AsyncOandaApi: each call runs on
+        the loop, through its scheduler and connection pool, and blocks the calling thread until it is done. So
+        the asyncio Trader has one client and one request budget. start() on the loop, call from other threads.
+    """
+
+    def __init__(self, api: AsyncOandaApi):
+
+        self.api = api
+        self.loop: asyncio.AbstractEventLoop = None
+        # set by the Trader like OandaApi's, the requests are timed by the AsyncOandaApi
+        self.latency = None
+
+    def start(self):
+
+        self.loop = asyncio.get_running_loop()
+        return self
+
+    def call(self, coroutine):
+
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is self.loop:
+            coroutine.close()
+            raise RuntimeError("BlockingOandaApi called on its own event loop, await the AsyncOandaApi instead")
+
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result()
+
+    def get_latest_price_candles(self, pair_name) -> pd.DataFrame:
+        return self.call(self.api.get_latest_price_candles(pair_name))
+
+    def get_price_candles_since(self, pair_name, date_f) -> pd.DataFrame:
+        return self.call(self.api.get_price_candles_since(pair_name, date_f))
+
+    def place_order(self, order: Order, client_id = None):
+        return self.call(self.api.place_order(order, client_id))
+
+    def get_order(self, order_specifier):
+        return self.call(self.api.get_order(order_specifier))
+
+    def get_position(self, instrument):
+        return self.call(self.api.get_position(instrument))
+
+    def get_position_snapshot(self, instrument):
+        return self.call(self.api.get_position_snapshot(instrument))
+
+    def stop_streaming(self):
+        self.api.stop_streaming()
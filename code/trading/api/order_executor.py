@@ -0,0 +1,222 @@
+import asyncio
+import logging
+import queue
+import sys
+import threading
+import time
+from concurrent.futures import Future
+from itertools import count
+from pathlib import Path
+
+file = Path(__file__).resolve()
+parent, root = file.parent, file.parents[1]
+sys.path.append(str(root))
+
+from api.oanda_api import OandaApi
+from dom.order import Order
+
+logger = logging.getLogger()
+
+"""
+Submits orders on a dedicated thread, so the strategy thread never waits on the network.
+
+Every order gets a clientExtensions id before its first attempt. When an attempt gets no answer (timeout,
+dropped connection) the order is looked up by that id before it is sent again, so a retry never places
+the same order twice. OrderAttempts holds that policy once, OrderExecutor (a thread) and AsyncOrderExecutor
+(the asyncio Trader's loop) only make the calls it asks for.
+"""
+
+
+class OrderAttempts():
+
+    def __init__(self, retries = 3, backoff = 0.5, latency = None):
+
+        self.latency = latency
+        self.retries = retries
+        self.backoff = backoff
+        self.sequence = count(1)
+
+    def client_id(self, order: Order) -> str:
+        return f"{order.instrument}-{time.time_ns()}-{next(self.sequence)}"
+
+    def attempts(self, order: Order, client_id):
+
+        """
+            The attempts of one order as a generator of the calls the executor makes, each call's result is sent
+            back in: ("sleep", seconds), ("get_order", order_specifier), ("place_order", client_id).
+            Returns the transaction, raises when no attempt got an answer.
+        """
+
+        for attempt in range(self.retries + 1):
+
+            if attempt > 0:
+                yield "sleep", self.backoff * 2 ** (attempt - 1)
+                # the last attempt got no answer, it may still have reached OANDA
+                placed = yield "get_order", f"@{client_id}"
+                if placed is not None:
+                    logger.info(f"Order {client_id} was placed by an earlier attempt, state: {placed.get('state')}")
+                    return placed
+
+            start = time.perf_counter_ns()
+            result = yield "place_order", client_id
+            if self.latency is not None:
+                self.latency.since(f"{order.instrument}.order_http", start)
+            if result is not None:
+                return result
+
+            logger.warning(f"No answer placing order {client_id}, attempt: {attempt + 1}")
+
+        raise Exception(f"Order {client_id} not placed after {self.retries + 1} attempts")
+
+
+class OrderExecutor(OrderAttempts):
+
+    def __init__(self, api: OandaApi, retries = 3, backoff = 0.5, latency = None):
+
+        super().__init__(retries, backoff, latency)
+        self.api = api
+        self.orders = queue.Queue()
+        self.thread: threading.Thread = None
+
+    def start(self):
+
+        self.thread = threading.Thread(target=self.run, name="order_executor", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self, timeout = 60):
+
+        # orders queued before stop are still submitted
+        self.orders.put(None)
+        if self.thread is not None:
+            self.thread.join(timeout)
+
+    def submit(self, order: Order, callback = None) -> Future:
+
+        """
+            Queues the order and returns at once. The future's result is the transaction returned by
+            OandaApi.place_order, callback(future) runs on the executor thread when it is done.
+        """
+
+        future = Future()
+        if callback is not None:
+            future.add_done_callback(callback)
+
+        self.orders.put((order, self.client_id(order), future))
+        return future
+
+    def run(self):
+
+        while True:
+            item = self.orders.get()
+            if item is None:
+                break
+
+            order, client_id, future = item
+            if not future.set_running_or_notify_cancel():
+                continue
+
+            try:
+                future.set_result(self.place(order, client_id))
+            except Exception as e:
+                logger.error(f"Order {client_id} failed: {order}")
+                logger.exception(e)
+                future.set_exception(e)
+
+    def place(self, order: Order, client_id):
+
+        steps = self.attempts(order, client_id)
+        result = None
+
+        while True:
+            try:
+                call, argument = steps.send(result)
+            except StopIteration as done:
+                return done.value
+
+            if call == "sleep":
+                time.sleep(argument)
+                result = None
+            elif call == "get_order":
+                result = self.api.get_order(argument)
+            else:
+                result = self.api.place_order(order=order, client_id=argument)
+
+
+class AsyncOrderExecutor(OrderAttempts):
+
+    """
+        OrderExecutor for the asyncio Trader: every order is a task on the event loop making the calls of
+        OrderAttempts against api.oanda_async_api.AsyncOandaApi. start() on the loop before the first submit.
+    """
+
+    def __init__(self, api, retries = 3, backoff = 0.5, latency = None):
+
+        super().__init__(retries, backoff, latency)
+        self.api = api
+        self.tasks = set()
+        self.loop: asyncio.AbstractEventLoop = None
+
+    def start(self):
+
+        self.loop = asyncio.get_running_loop()
+        return self
+
+    def submit(self, order: Order, callback = None) -> Future:
+
+        """
+            Same contract as OrderExecutor.submit, callable from any thread. callback(future) runs on the loop
+            when the order is done.
+        """
+
+        future = Future()
+        if callback is not None:
+            future.add_done_callback(callback)
+
+        self.loop.call_soon_threadsafe(self.create_task, order, self.client_id(order), future)
+        return future
+
+    def create_task(self, order: Order, client_id, future: Future):
+
+        task = self.loop.create_task(self.run(order, client_id, future))
+        # the loop only keeps weak references to its tasks
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def run(self, order: Order, client_id, future: Future):
+
+        if not future.set_running_or_notify_cancel():
+            return
+
+        try:
+            future.set_result(await self.place(order, client_id))
+        except Exception as e:
+            logger.error(f"Order {client_id} failed: {order}")
+            logger.exception(e)
+            future.set_exception(e)
+
+    async def place(self, order: Order, client_id):
+
+        steps = self.attempts(order, client_id)
+        result = None
+
+        while True:
+            try:
+                call, argument = steps.send(result)
+            except StopIteration as done:
+                return done.value
+
+            if call == "sleep":
+                await asyncio.sleep(argument)
+                result = None
+            elif call == "get_order":
+                result = await self.api.get_order(argument)
+            else:
+                result = await self.api.place_order(order=order, client_id=argument)
+
+    async def stop(self):
+
+        # the orders submitted before stop: give their call_soon_threadsafe a turn, then wait for them
+        await asyncio.sleep(0)
+        if self.tasks:
+            await asyncio.gather(*self.tasks, return_exceptions=True)
@@ -0,0 +1,254 @@
+import heapq
+import logging
+import threading
+import time
+from itertools import count
+
+import requests
+
+logger = logging.getLogger()
+
+"""
+One request layer for every OandaApi of a process, see RequestScheduler.shared. The policy is RequestQueue's,
+RequestScheduler is its thread based transport and oanda_async_api.AsyncRequestScheduler its asyncio one.
+
+A request runs on the caller's thread once it is at the head of the queue, a connection is free and the token
+bucket has a token: at most rate requests a second on average, burst at once. The queue is ordered by priority,
+so an order never waits behind a history download: ORDER before POSITION before CANDLES, first come first served
+within a priority. The connections are one keep-alive pool sized to the requests that can be in flight together.
+
+Failed requests (connection errors, timeouts, 429 and 5xx) are retried with exponential backoff as the retry
+policy of their priority allows, each retry queues again. Orders are not retried here: OrderExecutor retries
+them itself after looking them up by their client id.
+"""
+
+ORDER, POSITION, CANDLES = 0, 1, 2
+priority_names = {ORDER: "order", POSITION: "position", CANDLES: "candles"}
+
+retry_statuses = {429, 500, 502, 503, 504}
+
+
+class TokenBucket():
+
+    def __init__(self, rate, burst):
+
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def take(self) -> float:
+
+        """
+            Takes a token and returns 0, or returns the seconds until there is one. rate 0 is no limit.
+        """
+
+        if self.rate <= 0:
+            return 0
+
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+        if self.tokens >= 1:
+            self.tokens = self.tokens - 1
+            return 0
+
+        return (1 - self.tokens) / self.rate
+
+
+class RetryPolicy():
+
+    def __init__(self, retries = 0, backoff = 0.5, max_backoff = 8):
+
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+
+    def delay(self, attempt, retry_after = None) -> float:
+
+        # OANDA says how long to wait on a 429
+        if retry_after is not None and retry_after.isdigit():
+            return float(retry_after)
+
+        return min(self.backoff * 2 ** (attempt - 1), self.max_backoff)
+
+
+class RequestQueue():
+
+    """
+        The scheduling policy RequestScheduler and the asyncio AsyncRequestScheduler share: the token bucket, the
+        priority queue, the pool limit, the retry policies and the counters. It never waits or sends anything, the
+        schedulers call it under their own lock (or on their loop) and do the waiting and the sending.
+    """
+
+    def __init__(self, rate = 100, burst = 20, pool_size = 10, policies = None):
+
+        self.bucket = TokenBucket(rate, burst)
+        self.pool_size = pool_size
+        self.policies = {ORDER: RetryPolicy(0), POSITION: RetryPolicy(2), CANDLES: RetryPolicy(3)}
+        self.policies.update(policies or {})
+
+        self.waiting = []
+        self.sequence = count()
+        self.throttled_tickets = set()
+
+        # queued: waiting for their turn, in_flight: sent and not answered, throttled: had to wait for a token
+        self.queued: int = 0
+        self.in_flight: int = 0
+        self.sent = {priority: 0 for priority in priority_names}
+        self.throttled = {priority: 0 for priority in priority_names}
+        self.retried = {priority: 0 for priority in priority_names}
+        self.failed = {priority: 0 for priority in priority_names}
+
+    def enqueue(self, priority) -> tuple:
+
+        # the ticket of a request, the head of the queue may have changed
+        ticket = (priority, next(self.sequence))
+        heapq.heappush(self.waiting, ticket)
+        self.queued = self.queued + 1
+        return ticket
+
+    def turn(self, ticket) -> float:
+
+        """
+            0 when it is ticket's turn, the request is then taken off the queue and counted in flight.
+            Otherwise the seconds until a token, or None when other requests go first or the pool is full.
+        """
+
+        if self.waiting[0] != ticket or self.in_flight >= self.pool_size:
+            return None
+
+        priority = ticket[0]
+        wait = self.bucket.take()
+        if wait > 0:
+            if ticket not in self.throttled_tickets:
+                self.throttled_tickets.add(ticket)
+                self.throttled[priority] = self.throttled[priority] + 1
+            return wait
+
+        self.throttled_tickets.discard(ticket)
+        heapq.heappop(self.waiting)
+        self.queued = self.queued - 1
+        self.in_flight = self.in_flight + 1
+        self.sent[priority] = self.sent[priority] + 1
+        return 0
+
+    def done(self):
+        self.in_flight = self.in_flight - 1
+
+    def retry_delay(self, priority, attempt, failed, retry_after = None) -> float:
+
+        """
+            The seconds before the next attempt of a request that failed (no response, 429 or 5xx) on its
+            attempt-th retry, None when the request is over: it did not fail, or its policy has no retries left.
+        """
+
+        if not failed:
+            return None
+
+        policy = self.policies[priority]
+        if attempt >= policy.retries:
+            self.failed[priority] = self.failed[priority] + 1
+            return None
+
+        self.retried[priority] = self.retried[priority] + 1
+        return policy.delay(attempt + 1, retry_after)
+
+    def counters(self) -> dict:
+
+        counters = dict(queued=self.queued, in_flight=self.in_flight)
+        for name, values in [("sent", self.sent), ("throttled", self.throttled), ("retried", self.retried), ("failed", self.failed)]:
+            counters.update({f"{name}_{priority_names[priority]}": value for priority, value in values.items()})
+        return counters
+
+
+class RequestScheduler(RequestQueue):
+
+    schedulers = {}
+    schedulers_lock = threading.Lock()
+
+    def __init__(self, headers = None, rate = 100, burst = 20, pool_size = 10, timeout = (10, 30), policies = None):
+
+        super().__init__(rate, burst, pool_size, policies)
+        self.timeout = timeout
+
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, pool_block=True)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update(headers or {})
+
+        self.condition = threading.Condition()
+
+    @classmethod
+    def shared(cls, key, **settings) -> "RequestScheduler":
+
+        """
+            The scheduler of key (OandaApi uses the host and the access token), created with settings by the first caller
+        """
+
+        with cls.schedulers_lock:
+            scheduler = cls.schedulers.get(key)
+            if scheduler is None:
+                scheduler = cls.schedulers[key] = cls(**settings)
+            return scheduler
+
+    def request(self, verb, url, priority = POSITION, **kwargs) -> requests.Response:
+
+        """
+            Sends the request when its turn comes and returns the response, raises the last exception when every
+            attempt failed without one. kwargs go to requests.Session.request.
+        """
+
+        kwargs.setdefault("timeout", self.timeout)
+        attempt = 0
+
+        while True:
+
+            response = None
+            error = None
+
+            self.wait_for_turn(priority)
+            try:
+                response = self.session.request(verb, url, **kwargs)
+            except requests.RequestException as e:
+                error = e
+            finally:
+                with self.condition:
+                    self.done()
+                    self.condition.notify_all()
+
+            with self.condition:
+                failed = error is not None or response.status_code in retry_statuses
+                delay = self.retry_delay(priority, attempt, failed, None if response is None else response.headers.get("Retry-After"))
+
+            if delay is None:
+                if error is not None:
+                    raise error
+                return response
+
+            attempt = attempt + 1
+            logger.warning(f"Retrying {verb.upper()} {url} in {delay:.1f}s, attempt {attempt + 1}: {error or response.status_code}")
+            time.sleep(delay)
+
+    def wait_for_turn(self, priority):
+
+        with self.condition:
+            ticket = self.enqueue(priority)
+            self.condition.notify_all()
+
+            # None waits for a change of the queue or the pool, a higher priority request that queues meanwhile
+            # wakes a throttled one up and goes first
+            while True:
+                wait = self.turn(ticket)
+                if wait == 0:
+                    break
+                self.condition.wait(wait)
+
+            self.condition.notify_all()
+
+    def counters(self) -> dict:
+
+        with self.condition:
+            return super().counters()
@@ -27,8 +27,10 @@ class yfinanceApi:
         print("Init")
     
     def __format(self, df: pd.DataFrame) -> pd.DataFrame:
-        df = df.drop(columns=["Open", "High", "Low", "Dividends", "Stock Splits"])
-        df.rename(columns={"Close": "close"})
+        # currencies have no dividends or splits
+        df = df.drop(columns=["Open", "High", "Low", "Dividends", "Stock Splits"], errors="ignore")
+        df = df.rename(columns={"Close": "close", "Volume": "volume"})
+        df.index.name = "time"
         return df
 
     def get_latest_price_candles(self, instrument) -> pd.DataFrame:
@@ -43,32 +45,31 @@ class yfinanceApi:
 
     def get_price_candles(self, instrument, days = 1):
 
-        start = datetime.now()
-        end = start - timedelta(days=days)
+        end = datetime.now(tz=timezone.utc)
+        return self.get_price_candles_between(instrument, end - timedelta(days=days), end)
 
-        
-        df = pd.DataFrame()
-        ticker = yf.Ticker(instrument)
+    def get_price_candles_between(self, instrument, date_f, date_t, interval = "1m") -> pd.DataFrame:
 
-        if days == 1:
-            logger.debug(f"Getting price candles for {instrument} from {start} to {end}")
-            df = ticker.history(start=start.strftime('%Y-%m-%d'), end=end.strftime('%Y-%m-%d'), interval="1m")
-        else:
-            for i in range(0, days):
+        """
+            Candles from date_f to date_t, Yahoo serves the minute intervals at most 7 days per request
+        """
 
-                start = end
-                end = start + timedelta(days=i+1)
-                if end.weekday() < 5:
-                    logger.debug(f"Getting price candles for {instrument} from {start} to {end}")
-                    df_t = ticker.history(start=start.strftime('%Y-%m-%d'), end=end.strftime('%Y-%m-%d'), interval="1m")
+        step = timedelta(days=7) if interval.endswith("m") else date_t - date_f
+        ticker = yf.Ticker(instrument)
 
-                    if not df_t.empty:
-                        df = pd.concat([df, df_t])
+        frames = []
+        while date_f < date_t:
+            end = min(date_f + step, date_t)
+            logger.debug(f"Getting price candles for {instrument} from {date_f} to {end}")
+            df_t = ticker.history(start=date_f, end=end, interval=interval)
+            if not df_t.empty:
+                frames.append(df_t)
+            date_f = end
 
-        if not df.empty:
-            df = self.__format(df)
+        if not frames:
+            return pd.DataFrame()
 
-        return df
+        return self.__format(pd.concat(frames))
 
 
 
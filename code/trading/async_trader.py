@@ -0,0 +1,330 @@
+import argparse
+import asyncio
+import logging
+import os
+import sys
+from pathlib import Path
+
+file = Path(__file__).resolve()
+parent, root = file.parent, file.parents[1]
+sys.path.append(str(root))
+
+from trading.api.oanda_async_api import AsyncOandaApi, BlockingOandaApi
+from trading.api.order_executor import AsyncOrderExecutor
+from trading.trading_bot import InstrumentFeed, Reconnects, Trader
+
+logger = logging.getLogger()
+
+"""
+The Trader on one asyncio event loop instead of a thread per concern.
+
+The price streams (one connection per instruments_per_stream instruments), the transactions stream, the position
+checks, the orders and the snapshot and latency reports are tasks on the loop, against AsyncOandaApi. Feeds,
+strategies, the position book and new_price_ticker are the Trader's own, the stream tasks call new_price_ticker
+with every tick.
+
+There is no OandaApi: the Trader's api is a BlockingOandaApi, the strategies' get_position fallback while the
+transactions stream is down, the orders a replay places synchronously and the candles of a warm start are requests
+of the AsyncOandaApi too, under its one rate limit. The callers wait for them off the loop.
+
+The strategies run in a worker thread, one evaluation at a time like the Trader's strategy thread: they may
+block on those requests, and the loop keeps reading ticks meanwhile. The feed lock keeps the tick store and
+the indicators consistent between the two, as between the Trader's threads. Their orders go to
+AsyncOrderExecutor, which hands them over to the loop. A replay evaluates the requests of every tick before the
+stream reads the next one, so it makes the same decisions as the Trader's.
+"""
+
+
+class AsyncTrader(Trader):
+
+    def __init__(self, conf_file, pair_file, trading_strategy, unit_test = False, incremental = True, snapshot_dir = None, journal_dir = None, replay = False,
+                 instruments_per_stream = 20):
+
+        super().__init__(conf_file, pair_file, trading_strategy, unit_test=unit_test, incremental=incremental, snapshot_dir=snapshot_dir,
+                         journal_dir=journal_dir, replay=replay)
+
+        self.async_api.latency = self.latency
+        self.instruments_per_stream = instruments_per_stream
+
+        # the stream tasks do not evaluate, see on_price_tick
+        self.evaluate_inline = False
+
+        # created on the loop by run()
+        self.loop: asyncio.AbstractEventLoop = None
+        self.stopped: asyncio.Event = None
+        self.evaluation_requested: asyncio.Event = None
+
+    def create_api(self, conf_file):
+
+        # no OandaApi: the blocking calls of the strategies and warm starts are made on the loop by the AsyncOandaApi
+        self.async_api = AsyncOandaApi(conf_file)
+        return BlockingOandaApi(self.async_api)
+
+    def create_executor(self):
+        return AsyncOrderExecutor(self.async_api, latency=self.latency)
+
+    def start_trading(self, stop_after = None):
+
+        logger.info("\n" + 100 * "-")
+        logger.info ("Started New Trading Session")
+        self.terminate = False
+
+        if self.journal is not None and not self.replay:
+            self.journal.start()
+
+        asyncio.run(self.run(stop_after))
+
+        if self.journal is not None and not self.replay:
+            self.journal.close()
+
+        self.terminate_session("Finished Replay Session" if self.replay else "Finished Trading Session")
+
+    async def run(self, stop_after = None):
+
+        self.loop = asyncio.get_running_loop()
+        self.stopped = asyncio.Event()
+        self.evaluation_requested = asyncio.Event()
+
+        async with self.async_api:
+
+            self.api.start()
+            self.executor.start()
+            await self.warm_up()
+
+            instruments = list(self.feeds)
+            tasks = [self.stream_prices(instruments[i:i + self.instruments_per_stream], stop_after)
+                     for i in range(0, len(instruments), self.instruments_per_stream)]
+
+            if not self.replay:
+                tasks.append(self.track_positions())
+                tasks.append(self.every(5 * 60, self.reconcile_all))
+                tasks.append(self.refresh_strategies(stop_after))
+                if self.snapshot_dir is not None:
+                    tasks.append(self.every(60, self.save_snapshot))
+                tasks.append(self.every(5 * 60, self.dump_latency))
+
+            await asyncio.gather(*tasks)
+            await self.executor.stop()
+
+    async def warm_up(self):
+
+        feeds = [feed for feed in self.feeds.values() if not await asyncio.to_thread(self.restore_snapshot, feed)]
+
+        # every instrument's candles at once
+        candles = await asyncio.gather(*(self.async_api.get_latest_price_candles(pair_name=feed.instrument) for feed in feeds))
+        for feed, feed_candles in zip(feeds, candles):
+            feed.warm_up(feed_candles)
+
+        with self.evaluation:
+            self.streaming = True
+            # decide on the warm up data right away instead of waiting for the first bar to close
+            for feed in self.feeds.values():
+                self.request_evaluation(feed, "warmed up")
+
+    async def stream_prices(self, instruments, stop_after = None):
+
+        reconnects = Reconnects()
+
+        while not self.terminate:
+
+            reconnects.connecting()
+
+            try:
+                logger.info (f"Start Stream: {', '.join(instruments)}")
+                on_connect = lambda: self.on_prices_connect_async(instruments)
+                if await self.async_api.stream_prices(",".join(instruments), self.on_price_tick, stop=stop_after, on_connect=on_connect):
+                    self.stop_trading()
+                    break
+                logger.warning("Price stream ended by the server")
+
+            except Exception as e:
+                logger.error(f"Error in stream_prices: {', '.join(instruments)}")
+                logger.exception(e)
+
+            if self.terminate:
+                break
+
+            backoff = reconnects.next_backoff()
+            if backoff is None:
+                self.stop_trading()
+                break
+
+            logger.info(f"Reconnecting price stream in {backoff}s, attempt {reconnects.attempt}")
+            await self.sleep(backoff)
+
+    def on_price_tick(self, tick):
+
+        self.new_price_ticker(tick)
+
+        # a replay evaluates what the tick requested before the stream reads the next one
+        if self.replay:
+            feeds = self.wait_for_evaluation(timeout=0)
+            if feeds:
+                return self.evaluate_all(feeds)
+
+        return None
+
+    async def evaluate_all(self, feeds):
+
+        for feed, received_ns in feeds:
+            await asyncio.to_thread(self.evaluate, feed, received_ns)
+            if self.terminate:
+                break
+
+    async def on_prices_connect_async(self, instruments):
+
+        # see Trader.on_prices_connect
+        if self.replay:
+            return
+
+        for instrument in instruments:
+            feed = self.feeds[instrument]
+            if await self.backfill(feed) > 0:
+                with self.evaluation:
+                    self.request_evaluation(feed, "backfilled")
+
+    async def backfill(self, feed: InstrumentFeed) -> int:
+
+        # InstrumentFeed.backfill with the candles requests on the loop
+        steps = feed.backfill_steps()
+        try:
+            date_f = next(steps)
+            while True:
+                date_f = steps.send(await self.async_api.get_price_candles_since(pair_name=feed.instrument, date_f=date_f))
+        except StopIteration as done:
+            return done.value
+
+    def request_evaluation(self, feed: InstrumentFeed, reason, received_ns = 0):
+
+        super().request_evaluation(feed, reason, received_ns)
+        if self.evaluation_requested is not None:
+            self.evaluation_requested.set()
+
+    async def refresh_strategies(self, stop_after = None):
+
+        while not self.terminate:
+
+            await self.wait_for(self.evaluation_requested, 10)
+            self.evaluation_requested.clear()
+
+            # ticks keep coming in while the strategies run
+            await self.evaluate_all(self.wait_for_evaluation(timeout=0))
+
+            if stop_after is not None and self.exec_counter > stop_after:
+                self.stop_trading()
+
+    async def track_positions(self):
+
+        # see Trader.track_positions
+        reconnects = Reconnects(backoff=5, max_backoff=5, held=None)
+
+        while not self.terminate:
+            try:
+                logger.info ("Start Transactions Stream")
+                await self.async_api.stream_transactions(callback=self.positions.on_transaction, on_connect=self.on_transactions_connect_async)
+
+            except Exception as e:
+                logger.exception(f"Error in track_positions: {e!r}")
+                if reconnects.next_backoff() is None:
+                    break
+
+            finally:
+                self.positions.streaming = False
+
+            await self.sleep(5)
+
+    async def on_transactions_connect_async(self):
+
+        # fills from now on arrive on the stream, take the snapshot they apply to
+        await self.reconcile_all()
+        self.positions.streaming = True
+
+    async def reconcile_all(self):
+
+        snapshots = await asyncio.gather(*(self.async_api.get_position_snapshot(instrument) for instrument in self.feeds))
+        for instrument, (units, last_transaction_id) in zip(self.feeds, snapshots):
+            self.positions.reconcile(instrument, units, last_transaction_id)
+
+    async def every(self, seconds, function):
+
+        # function is called every seconds until trading stops, coroutines are awaited
+        while not self.terminate:
+            await self.sleep(seconds)
+            if self.terminate:
+                break
+            try:
+                result = function()
+                if asyncio.iscoroutine(result):
+                    await result
+            except Exception as e:
+                logger.error(f"Exception occurred in {function.__name__}")
+                logger.exception(e)
+
+    def stop_trading(self):
+
+        super().stop_trading()
+        if self.loop is None:
+            return
+
+        # the strategies stop trading from their worker thread, the events belong to the loop
+        try:
+            on_loop = asyncio.get_running_loop() is self.loop
+        except RuntimeError:
+            on_loop = False
+
+        if on_loop:
+            self.wake_up()
+        else:
+            self.loop.call_soon_threadsafe(self.wake_up)
+
+    def wake_up(self):
+
+        self.stopped.set()
+        self.evaluation_requested.set()
+
+    async def sleep(self, seconds):
+
+        # like asyncio.sleep, but returns as soon as trading stops
+        await self.wait_for(self.stopped, seconds)
+
+    async def wait_for(self, event: asyncio.Event, timeout):
+
+        try:
+            await asyncio.wait_for(event.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    def request_counters(self) -> dict:
+
+        return self.async_api.scheduler.counters() if self.async_api.scheduler is not None else {}
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('trading_strategy', type=str, nargs='+', help='trading_strategy, pairs.ini sections')
+    parser.add_argument('--snapshot_dir', type = str, default=None, help='Save and warm start from snapshots in this directory, the sessions are pickles: only use a directory no one else writes to')
+    parser.add_argument('--journal_dir', type = str, default=None, help='Record every streamed tick to this directory')
+    parser.add_argument('--incremental', choices=['True', 'False', 'true', 'false'], default="True", type = str, help='Update indicators per closed bar instead of recalculating them every refresh')
+    parser.add_argument('--instruments_per_stream', type = int, default=20, help='Instruments per price stream connection')
+    args = parser.parse_args()
+
+    config_file = os.path.abspath(path="../../config/oanda.cfg")
+    print (f"oanda config file: {config_file}")
+    if os.path.exists(config_file) == False:
+        print(f"Config file does not exist: {config_file}")
+        exit(1)
+
+    trader = AsyncTrader(
+        conf_file=config_file,
+        pair_file="pairs.ini",
+        trading_strategy=args.trading_strategy,
+        unit_test=False,
+        incremental=(args.incremental in ['True', 'true']),
+        snapshot_dir=(None if args.snapshot_dir is None else os.path.abspath(args.snapshot_dir)),
+        journal_dir=(None if args.journal_dir is None else os.path.abspath(args.journal_dir)),
+        instruments_per_stream=args.instruments_per_stream
+    )
+    trader.start_trading()
+
+# python async_trader.py EUR_USD#1 EUR_USD#2 EUR_GBP
@@ -0,0 +1,93 @@
+import logging
+import threading
+import time
+
+logger = logging.getLogger()
+
+"""
+Local copy of the account positions, kept current from the OANDA transactions stream.
+
+Every ORDER_FILL (market orders, stop loss / take profit triggers, position closeouts) carries the signed units it
+filled, so the net position of an instrument is the sum of its fills. Transaction ids are increasing, which lets
+the book skip fills it has already seen and ignore REST snapshots older than what the stream already delivered.
+
+"""
+class Position_Book():
+
+    def __init__(self):
+
+        self.units = {}
+        self.reconciled = {}
+        self.last_transaction_id: int = 0
+        # fills applied from order responses before the stream delivered them
+        self.applied = {}
+        self.streaming: bool = False
+        self.lock = threading.Lock()
+
+    def on_transaction(self, transaction: dict):
+
+        transaction_id = int(transaction.get("id", 0))
+
+        with self.lock:
+            if transaction_id <= self.last_transaction_id:
+                return
+            self.last_transaction_id = transaction_id
+
+            if transaction_id in self.applied:
+                del self.applied[transaction_id]
+                return
+
+            if transaction.get("type") == "ORDER_FILL":
+                self.__add_fill(transaction)
+
+    def apply_fill(self, transaction: dict):
+
+        """
+            Applies the ORDER_FILL of an order response right away, the stream copy of it is skipped later.
+            Does not move last_transaction_id, older transactions may still be on their way on the stream.
+        """
+
+        transaction_id = int(transaction.get("id", 0))
+
+        with self.lock:
+            if transaction.get("type") != "ORDER_FILL" or transaction_id <= self.last_transaction_id or transaction_id in self.applied:
+                return
+            self.applied[transaction_id] = (transaction["instrument"], float(transaction["units"]))
+            self.__add_fill(transaction)
+
+    def __add_fill(self, transaction: dict):
+
+        instrument = transaction["instrument"]
+        units = round(self.units.get(instrument, 0) + float(transaction["units"]), 0)
+        self.units[instrument] = units
+        logger.info(f"Position update from {transaction.get('reason')} fill: {instrument} | units: {units}")
+
+    def reconcile(self, instrument, units, last_transaction_id):
+
+        with self.lock:
+            if last_transaction_id is None:
+                return
+            if last_transaction_id < self.last_transaction_id:
+                # the stream already applied newer transactions than this snapshot
+                return
+
+            # fills applied from order responses after the snapshot are not in it yet
+            self.applied = {i: fill for i, fill in self.applied.items() if i > last_transaction_id}
+            units = round(units + sum(fill[1] for fill in self.applied.values() if fill[0] == instrument), 0)
+
+            if self.units.get(instrument, 0) != units:
+                logger.warning(f"Position out of sync: {instrument} | book: {self.units.get(instrument, 0)} | account: {units}")
+
+            self.units[instrument] = units
+            self.last_transaction_id = last_transaction_id
+            self.reconciled[instrument] = time.monotonic()
+
+    def is_current(self, instrument) -> bool:
+
+        # fills are only seen while the stream is up, and the book needs one snapshot to start from
+        return self.streaming and instrument in self.reconciled
+
+    def get_units(self, instrument):
+
+        with self.lock:
+            return self.units.get(instrument, 0)
@@ -1,4 +1,6 @@
 import logging
+import os
+import pickle
 from datetime import datetime, timedelta, timezone
 from tabulate import tabulate
 from pathlib import Path
@@ -106,4 +108,17 @@ class Trading_Session():
     def to_pickle(self, file_name):
         import pandas as pd
         df=pd.DataFrame(self.trades, columns = self.columns)
-        df.to_pickle(file_name)
\ No newline at end of file
+        df.to_pickle(file_name)
+
+    def save(self, file_name):
+
+        # the whole session (trades, open trade, P&L) so a restarted bot continues where it stopped
+        with open(f"{file_name}.tmp", "wb") as f:
+            pickle.dump(self, f)
+        os.replace(f"{file_name}.tmp", file_name)
+
+    @staticmethod
+    def load(file_name):
+
+        with open(file_name, "rb") as f:
+            return pickle.load(f)
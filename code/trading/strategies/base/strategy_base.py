@@ -2,6 +2,7 @@ import configparser
 import json
 import logging
 import sys
+from concurrent.futures import Future
 from pathlib import Path
 
 import pandas as pd
@@ -12,9 +13,14 @@ parent, root = file.parent, file.parents[1]
 sys.path.append(str(root))
 
 from trading.api.oanda_api import OandaApi
+from trading.api.order_executor import OrderExecutor
 from trading.dom.order import Order
+from trading.dom.position_book import Position_Book
 from trading.dom.trade import Trade_Action
 from trading.dom.trading_session import Trading_Session
+from trading.utils.async_logging import Lazy, log_event
+from trading.utils.clock import Clock
+from trading.utils.stream_indicators import StreamingIndicators
 
 logger = logging.getLogger()
 
@@ -29,6 +35,7 @@ class TradingStrategyBase():
         super().__init__()
 
         self.api:OandaApi = api
+        self.trading_strategy = trading_strategy
         self.unit_test = unit_test
         self.backtest = False
 
@@ -52,6 +59,16 @@ class TradingStrategyBase():
         self.long_trading = config.getboolean(trading_strategy, 'long_trading')
         self.keep_trade_open_time = config.getint(trading_strategy, 'keep_trade_open_time')
         self.data: pd.DataFrame = None
+        self.indicators = None
+        self.positions: Position_Book = None
+        # set by the live Trader, orders are then submitted and reported on the executor thread
+        self.executor: OrderExecutor = None
+        self.pending_order: Future = None
+        # set by the live Trader: a LatencyRecorder and the arrival (perf_counter_ns) of the tick being evaluated
+        self.latency = None
+        self.tick_received_ns: int = 0
+        # a replay swaps in a clock that follows the recorded ticks
+        self.clock: Clock = Clock()
 
         self.trading_session = Trading_Session(self.instrument)
 
@@ -78,7 +95,7 @@ class TradingStrategyBase():
 
 
         order = Order(
-            instrument = trade_action.trading_strategy,
+            instrument = trade_action.instrument,
             price = trade_action.price,
             trade_units = trade_action.units,
             sl_price = sl_price,
@@ -93,6 +110,14 @@ class TradingStrategyBase():
 
         logger.info(f"Submitting Order: {order}")
         if not self.unit_test:        
+
+            if self.executor is not None:
+                # keep the indicators of this decision for the report, it is written when the order is done
+                recent = self.recent_indicator_rows(8)
+                received = self.tick_received_ns
+                self.pending_order = self.executor.submit(order, callback=lambda future: self.order_done(future, recent, received))
+                return
+
             # result = self.api.create_order(order=order)
             result = self.api.place_order(order=order)
             self.report_trade(result)
@@ -103,15 +128,71 @@ class TradingStrategyBase():
         
         return
 
-    def report_trade(self, order):
+    def order_pending(self) -> bool:
+        return self.pending_order is not None and not self.pending_order.done()
+
+    def order_done(self, future: Future, recent, received_ns = 0):
+
+        # runs on the executor thread
+        if self.latency is not None and received_ns:
+            self.latency.since(f"{self.trading_strategy}.tick_to_order", received_ns)
+
+        if future.exception() is not None:
+            return
 
+        result = future.result()
+        if self.positions is not None:
+            # the position is current before the next decision, the stream copy of the fill is skipped
+            self.positions.apply_fill(result)
+
+        self.report_trade(result, recent)
+        if "rejectReason" in result:
+            logger.error(f"Order was not filled: {result['type']}, reason: {result['rejectReason']}")
+
+    def report_trade(self, order, recent = None):
+
+        if recent is None:
+            recent = self.recent_indicator_rows(8)
+
+        # the indicator table and the order json are formatted on the log writer thread
         logger.info("\n" + 100 * "-" + "\n")
         logger.info("")
-        logger.info("\n" + self.data[-8:].to_string(header=True))
+        logger.info("\n%s", Lazy(self.indicators_string, recent))
         logger.info("")
-        logger.info(json.dumps(order, indent=2))
+        logger.info("%s", Lazy(json.dumps, order, indent=2))
         logger.info("\n" + 100 * "-" + "\n")
 
+        if order is not None:
+            log_event("order", strategy=self.trading_strategy, instrument=order.get("instrument", self.instrument), type=order.get("type"),
+                      id=order.get("id"), units=order.get("units"), price=order.get("price"), pl=order.get("pl"),
+                      reason=order.get("reason"), reject_reason=order.get("rejectReason"))
+
+    def recent_indicators(self, rows) -> pd.DataFrame:
+
+        # the live Trader keeps indicators in a StreamingIndicators instance instead of self.data
+        if self.indicators is not None:
+            return self.indicators.to_frame().tail(rows)
+
+        return self.data.tail(rows)
+
+    def recent_indicator_rows(self, rows):
+
+        # cheap to take on the decision path, indicator_frame turns it into the recent_indicators frame
+        if self.indicators is not None:
+            return self.indicators.recent_rows(rows)
+
+        return self.data.tail(rows).copy()
+
+    def indicator_frame(self, recent) -> pd.DataFrame:
+
+        if isinstance(recent, pd.DataFrame):
+            return recent
+
+        return StreamingIndicators.rows_to_frame(recent)
+
+    def indicators_string(self, recent) -> str:
+        return self.indicator_frame(recent).to_string(header=True)
+
     def terminate(self):
 
         self.trading_session.print_trades()
@@ -1,11 +1,15 @@
 from trading.utils.tech_indicators import (
-    count_sma_crossover, calculate_rsi, calculate_slope, calculate_ema)
+    count_sma_crossover, rolling_window_ema, rolling_window_rsi,
+    rolling_window_slope)
 from trading.strategies.base.strategy_base import TradingStrategyBase
 from trading.utils import utils
+from trading.utils.async_logging import Lazy
 import logging
 import sys
 from datetime import datetime, timezone
+from functools import lru_cache
 from pathlib import Path
+from types import SimpleNamespace
 import pandas as pd
 from tabulate import tabulate
 
@@ -16,6 +20,17 @@ sys.path.append(str(root))
 
 logger = logging.getLogger()
 
+
+# strptime is the most expensive part of a decision, these strings repeat for every bar
+@lru_cache(maxsize=16)
+def parse_time_of_day(text):
+    return datetime.strptime(text, '%H:%M:%S').time()
+
+
+@lru_cache(maxsize=16)
+def parse_trade_time(text):
+    return datetime.strptime(text, utils.date_format).replace(tzinfo=None)
+
 """
 Go Long (buy) when the ask price is below the low Bollinger Band and close trade (sell) when the bid price above the SMA
 
@@ -57,8 +72,8 @@ class TradingStrategyCalc(TradingStrategyBase):
         df["std_dev_mean"] = df["std_dev"].rolling(period_short).mean(numeric_only=True)
         df["sma_short"] = df["close"].rolling(period_short).mean(numeric_only=True)
         df["sma_long"] = df["close"].rolling(period_long).mean(numeric_only=True)
-        df['ema_short'] = df["close"].rolling(period_short).apply(lambda x: calculate_ema(S=x))
-        df['ema_short_slope'] = df["ema_short"].rolling(period_short).apply(lambda x: calculate_slope(x))
+        df['ema_short'] = rolling_window_ema(df["close"].values, period_short)
+        df['ema_short_slope'] = rolling_window_slope(df["ema_short"].values, period_short)
 
         df["bb_lower"] = df["sma_long"] - df["std_dev"] * std_dev
         df["bb_upper"] = df["sma_long"] + df["std_dev"] * std_dev
@@ -84,12 +99,6 @@ class TradingStrategyCalc(TradingStrategyBase):
         # df["price_diff"] = df["close"].diff()
         # df['volatility'] = df['price_diff'].rolling(window=period_short).std()
 
-        # MACD
-        # df["ema_long"] = df["close"].rolling(period_long).apply(lambda x: calculate_ema(S=x))
-        # df['ema_long_slope'] = df["ema_long"].rolling(period_long).apply(lambda x: calculate_slope(x))
-
-        # df['ema_short_slope'] = df["ema_short"].rolling(period_short).apply(lambda x: calculate_slope(x))
-
         # Momentum
         # df["price_momentum_long"] = df["price_diff"].rolling(period_long).sum()
         # df["price_momentum_long_min"] = df['price_momentum_long'].rolling(period_long).min()
@@ -101,17 +110,12 @@ class TradingStrategyCalc(TradingStrategyBase):
 
 
         # RSI
-        # df["rsi_long"] = df["close"].rolling(period_long).apply(lambda x: calculate_rsi(x, period_long))
-        # df["rsi_long_prev"] = df.rsi_long.shift()
-        # df["rsi_long_max"] = df['rsi_long'].rolling(period_long).max()
-        # df["rsi_long_min"] = df['rsi_long'].rolling(period_long).min()
-
-        df["rsi_short"] = df["close"].rolling(period_short).apply(lambda x: calculate_rsi(x, period_short))
+        df["rsi_short"] = rolling_window_rsi(df["close"].values, period_short, period_short)
         # df["rsi_short_prev"] = df["rsi_short"].shift()
         df["rsi_short_max"] = df["rsi_short"].rolling(period_short).max()
         df["rsi_short_min"] = df["rsi_short"].rolling(period_short).min()
         df["rsi_short_pct_change"] = df["rsi_short"].pct_change(fill_method=None)
-        df['rsi_short_ema'] = df["rsi_short"].rolling(period_short).apply(lambda x: calculate_ema(S=x))
+        df['rsi_short_ema'] = rolling_window_ema(df["rsi_short"].values, period_short)
 
         # df["rsi_short_pct_change_max"] = df.rsi_short_pct_change.rolling(period_short).max()
         # df["rsi_short_pct_change_min"] = df.rsi_short_pct_change.rolling(period_short).min()
@@ -121,11 +125,6 @@ class TradingStrategyCalc(TradingStrategyBase):
         # df["rsi_momentum_" + str(period) + "_max"] = df["rsi_momentum_" + str(period)].rolling(period).max()
         # df["rsi_momentum_" + str(period) + "_min"] = df["rsi_momentum_" + str(period)].rolling(period).min()
 
-        # df['rsi_ema'] = df["rsi"].rolling(period).apply(lambda x: calculate_ema(S = x, span = period))
-        # df['rsi_ema_slope'] = df["rsi_ema"].rolling(period).apply(lambda x: calculate_slope(x))
-        # df["rsi_ema_slope_max"] = df['rsi_ema_slope'].rolling(period).max()
-        # df["rsi_ema_slope_min"] = df['rsi_ema_slope'].rolling(period).min()
-
         # df["greater_sma"] = df["sma_long"] - df["close"]
         # df["greater_sma"] = df["greater_sma"].apply(lambda x: 1 if x > 0 else -1 if x < 0 else 0)
         # df["sma_crossover"] = df["greater_sma"].rolling(period_short).apply(lambda x: count_sma_crossover(x))
@@ -144,6 +143,9 @@ class TradingStrategyCalc(TradingStrategyBase):
 
         if row is None:
             row = self.data.iloc[-1]
+
+        # rows from StreamingIndicators are dicts carrying their time, DataFrame rows are named by the index
+        self.candle_time = row["time"] if "time" in row else row.name
     
         self.ask = row["ask"]
         self.bid = row["bid"]
@@ -218,11 +220,24 @@ class TradingStrategyCalc(TradingStrategyBase):
         if not self.backtest and "status" in row:
             self.trading = row["status"] == "tradeable"
 
+    # the attributes set_strategy_indicators takes from a column of another name
+    indicator_columns = {"price": "close", "price_std": "std_dev", "bb_low": "bb_lower", "bb_high": "bb_upper"}
+
+    def indicator_arrays(self, columns) -> SimpleNamespace:
+
+        """
+            columns (indicator name -> array) under the strategy's attribute names as well, so a condition written
+            against the strategy's attributes can be evaluated over whole columns
+        """
+
+        renamed = {attribute: columns[column] for attribute, column in self.indicator_columns.items() if column in columns}
+        return SimpleNamespace(**{**columns, **renamed})
        
        
     def print_indicators(self):
 
-        logger.info("\n" + self.data.tail(5).to_string(header=True))
+        # the rows are taken here, the table is formatted on the log writer thread
+        logger.info("\n%s", Lazy(self.indicators_string, self.recent_indicator_rows(5)))
         # price_data = [[self.ask, self.bid, self.price, round(self.price_std, 6)]]
         # price_headers = ["ASK PRICE", "BID PRICE", "MID PRICE", "PRICE STD"]
         # logger.info("\n" + tabulate(price_data, headers=price_headers) + "\n")
@@ -261,7 +276,7 @@ class TradingStrategyCalc(TradingStrategyBase):
 
     def is_trading_time(self, date_time) -> bool:
 
-        logger.debug(f"Date time: {date_time}")
+        logger.debug("Date time: %s", date_time)
 
         day = date_time.weekday()
         hour = date_time.hour
@@ -269,8 +284,8 @@ class TradingStrategyCalc(TradingStrategyBase):
         if day == 4 and hour >= 20:
             return False
 
-        pause_from_dt = datetime.combine(date_time, datetime.strptime(self.pause_start, '%H:%M:%S').time())
-        pause_to_dt = datetime.combine(date_time, datetime.strptime(self.pause_end, '%H:%M:%S').time())
+        pause_from_dt = datetime.combine(date_time, parse_time_of_day(self.pause_start))
+        pause_to_dt = datetime.combine(date_time, parse_time_of_day(self.pause_end))
 
         if pause_from_dt < date_time < pause_to_dt:
             return False
@@ -283,7 +298,7 @@ class TradingStrategyCalc(TradingStrategyBase):
 
         if len(self.trading_session.trades) > 0:
             date_time_s = self.trading_session.trades[-1][0]
-            date_time = datetime.strptime(date_time_s, utils.date_format).replace(tzinfo=None)
+            date_time = parse_trade_time(date_time_s)
 
         return date_time
 
@@ -1,8 +1,10 @@
 from trading.utils.errors import PauseTradingException
 from trading.strategies.base.strategy_calc import TradingStrategyCalc
 from trading.dom.trade import Trade_Action
+from trading.utils.async_logging import log_event
 import logging
 import sys
+import time
 from datetime import datetime, timedelta
 from pathlib import Path
 
@@ -26,21 +28,33 @@ class TradingStrategyExec(TradingStrategyCalc):
 
     def execute_strategy(self):
 
-        trading_time = datetime.utcnow()
+        trading_time = self.clock.utcnow()
         
         if not self.backtest:
             if not self.trading:
                 logger.info("Skip strategy execution, ticker trading status is not tradeable")
                 return
 
-            last_candle_time = self.data.index[-1]
+            last_candle_time = self.candle_time
             if (trading_time - last_candle_time) > timedelta(days = 0, hours = 0, minutes=0, seconds=45):
                 logger.info(f"Skip strategy execution, ticker data is too stale: {last_candle_time}")
                 return
 
-        self.trading_session.have_units = self.api.get_position(instrument = self.instrument)
-        logger.debug(f"Have {self.trading_session.have_units} positions of {self.instrument}")
+        if self.order_pending():
+            logger.info("Skip strategy execution, the last order is not done yet")
+            return
+
+        if self.positions is not None and self.positions.is_current(self.instrument):
+            self.trading_session.have_units = self.positions.get_units(self.instrument)
+        else:
+            self.trading_session.have_units = self.api.get_position(instrument = self.instrument)
+        logger.debug("Have %s positions of %s", self.trading_session.have_units, self.instrument)
+        start = time.perf_counter_ns()
         trade_action = self.determine_trade_action(trading_time)
+        if self.latency is not None:
+            self.latency.since(f"{self.trading_strategy}.determine_trade_action", start)
+            if self.tick_received_ns:
+                self.latency.since(f"{self.trading_strategy}.tick_to_decision", self.tick_received_ns)
 
         if trade_action is not None:
             # logger.info(f"trade_action: {trade_action}")
@@ -63,21 +77,23 @@ class TradingStrategyExec(TradingStrategyCalc):
 
         if have_units != 0:
 
-            logger.debug(f"Have {have_units} positions, checking for stop loss")
+            logger.debug("Have %s positions, checking for stop loss", have_units)
             if self.trading_session.open_trade:
                 trade = self.check_for_sl(trading_time, have_units)
 
                 if trade is None:
-                    logger.debug(f"Have {have_units} positions, checking if need to close a trade")
+                    logger.debug("Have %s positions, checking if need to close a trade", have_units)
                     trade = self.check_if_need_close_trade(trading_time)
 
         if trade is None and have_units == 0:
 
-            logger.debug(f"Have {have_units} positions, checking if need to open a new trade")
+            logger.debug("Have %s positions, checking if need to open a new trade", have_units)
             trade = self.check_if_need_open_trade(trading_time)
             
         if trade is not None:
             self.trading_session.add_trade(trade_action=trade, date_time=trading_time)
+            log_event("trade", strategy=self.trading_strategy, instrument=trade.instrument, time=trading_time, units=trade.units,
+                      price=trade.price, open_trade=trade.open_trade, sl_trade=trade.sl_trade, pl=self.trading_session.pl)
         
         return trade
             
@@ -85,6 +101,15 @@ class TradingStrategyExec(TradingStrategyCalc):
     def check_if_need_open_trade(self, trading_time):
         pass
 
+    def entry_candidates(self, columns):
+
+        """
+            Optional, for the backtest engine: a boolean array over the bars of columns (indicator name -> array),
+            False where check_if_need_open_trade can not open a trade. None means any bar can.
+        """
+
+        return None
+
 
     def reverse_down(self):
         return self.rsi_short_pct_change < 0 and (self.ema_short_slope < 0 or self.price < self.ema_short)
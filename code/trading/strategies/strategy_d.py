@@ -20,6 +20,13 @@ Go Short (sell) when the bid price is above the high Bollinger Band and close tr
 
 """
 class TradingStrategy(TradingStrategyExec):
+
+    # entry thresholds, see entry_conditions
+    min_std_dev_mean = 0.00025
+    rsi_pct_change = 0.3
+    rsi_high = 70
+    rsi_low = 30
+
     def __init__(self, trading_strategy, pair_file, api = None, unit_test = False):
         super().__init__(trading_strategy=trading_strategy, pair_file=pair_file, api = api, unit_test = unit_test)
 
@@ -29,22 +36,38 @@ class TradingStrategy(TradingStrategyExec):
         if not self.is_trading_time(trading_time) or self.stop_trading:
             return
 
-        
-        if 0.00025 < self.std_dev_mean < self.price_std:
+        long, short = self.entry_conditions(self)
+
+        if long and self.rsi_short == self.rsi_short_max:
+                if not self.backtest:
+                    logger.info(f"Go Long - Buy {self.units_to_trade} units at ask price: {self.ask}")
+                return Trade_Action(self.instrument, self.units_to_trade, self.ask, True, False)
+
+        elif short and self.rsi_short == self.rsi_short_min:
+                if not self.backtest:
+                    logger.info(f"Go Short - Sell {self.units_to_trade} units at ask price: {self.bid}")
+                return Trade_Action(self.instrument, -self.units_to_trade, self.bid, True, False)
+
+
+    def entry_conditions(self, bar):
 
-            if self.sma_long < self.price < self.bb_high \
-                and self.rsi_short_pct_change > 0.3 and self.rsi_short == self.rsi_short_max > 70 and self.ema_short > self.sma_short:
-                    if not self.backtest:
-                        logger.info(f"Go Long - Buy {self.units_to_trade} units at ask price: {self.ask}")
-                    return Trade_Action(self.instrument, self.units_to_trade, self.ask, True, False)
+        """
+            (long, short), the entry conditions of check_if_need_open_trade but the rsi being at its extreme.
+            bar is the strategy or indicator_arrays of whole columns, so & and | instead of and and or.
+        """
 
+        volatile = (self.min_std_dev_mean < bar.std_dev_mean) & (bar.std_dev_mean < bar.price_std)
+        long = volatile & (bar.sma_long < bar.price) & (bar.price < bar.bb_high) & (bar.rsi_short_pct_change > self.rsi_pct_change) \
+            & (bar.rsi_short_max > self.rsi_high) & (bar.ema_short > bar.sma_short)
+        short = volatile & (bar.sma_long > bar.price) & (bar.price > bar.bb_low) & (bar.rsi_short_pct_change < -self.rsi_pct_change) \
+            & (bar.rsi_short_min < self.rsi_low) & (bar.ema_short < bar.sma_short)
+        return long, short
 
-            elif self.sma_long > self.price > self.bb_low \
-                and self.rsi_short_pct_change < -0.3 and self.rsi_short == self.rsi_short_min < 30 and self.ema_short < self.sma_short:
-                    if not self.backtest:
-                        logger.info(f"Go Short - Sell {self.units_to_trade} units at ask price: {self.bid}")
-                    return Trade_Action(self.instrument, -self.units_to_trade, self.bid, True, False)
+    def entry_candidates(self, columns):
 
+        # the raw rsi columns let through every bar their rounded values do
+        long, short = self.entry_conditions(self.indicator_arrays(columns))
+        return long | short
 
     def check_if_need_close_trade(self, trading_time):
 
@@ -20,6 +20,13 @@ Go Short (sell) when the bid price is above the high Bollinger Band and close tr
 
 """
 class TradingStrategy(TradingStrategyExec):
+
+    # entry thresholds, see entry_conditions
+    min_std_dev_mean = 0.001
+    min_price_std = 0.00125
+    rsi_high = 75
+    rsi_low = 25
+
     def __init__(self, trading_strategy, pair_file, api = None, unit_test = False):
         super().__init__(trading_strategy=trading_strategy, pair_file=pair_file, api = api, unit_test = unit_test)
 
@@ -29,16 +36,33 @@ class TradingStrategy(TradingStrategyExec):
         if not self.is_trading_time(trading_time) or self.stop_trading:
             return
 
-        
-        if self.std_dev_mean > 0.001 and self.price_std > 0.00125:
+        long, short = self.entry_conditions(self)
+
+        if long and self.reverse_up():
+                if not self.backtest:
+                    logger.info(f"Go Long - Buy {self.units_to_trade} units at ask price: {self.ask}")
+                return Trade_Action(self.instrument, self.units_to_trade, self.ask, True, False)
+
+        elif short and self.reverse_down():
+                if not self.backtest:
+                    logger.info(f"Go Short - Sell {self.units_to_trade} units at ask price: {self.bid}")
+                return Trade_Action(self.instrument, -self.units_to_trade, self.bid, True, False)
+
+
+    def entry_conditions(self, bar):
+
+        """
+            (long, short), the entry conditions of check_if_need_open_trade but the reversal.
+            bar is the strategy or indicator_arrays of whole columns, so & and | instead of and and or.
+        """
 
-            if self.price_min < self.bb_low and self.rsi_short_min < 25 and self.reverse_up():
-                    if not self.backtest:
-                        logger.info(f"Go Long - Buy {self.units_to_trade} units at ask price: {self.ask}")
-                    return Trade_Action(self.instrument, self.units_to_trade, self.ask, True, False)
+        volatile = (bar.std_dev_mean > self.min_std_dev_mean) & (bar.price_std > self.min_price_std)
+        long = volatile & (bar.price_min < bar.bb_low) & (bar.rsi_short_min < self.rsi_low)
+        short = volatile & (bar.price_max > bar.bb_high) & (bar.rsi_short_max > self.rsi_high)
+        return long, short
 
-            elif self.price_max > self.bb_high and self.rsi_short_max > 75 and self.reverse_down():
-                    if not self.backtest:
-                        logger.info(f"Go Short - Sell {self.units_to_trade} units at ask price: {self.bid}")
-                    return Trade_Action(self.instrument, -self.units_to_trade, self.bid, True, False)
+    def entry_candidates(self, columns):
 
+        # the raw rsi columns let through every bar their rounded values do
+        long, short = self.entry_conditions(self.indicator_arrays(columns))
+        return long | short
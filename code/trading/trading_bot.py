@@ -1,8 +1,6 @@
-from collections import deque
 import argparse
 import configparser
 import logging
-import logging.handlers as handlers
 import os
 import sys
 import threading
@@ -17,18 +15,281 @@ parent, root = file.parent, file.parents[1]
 sys.path.append(str(root))
 
 from trading.api.oanda_api import OandaApi
+from trading.api.order_executor import OrderExecutor
+from trading.dom.position_book import Position_Book
+from trading.dom.trading_session import Trading_Session
 from trading.strategies.base.strategy_exec import TradingStrategyExec
 from trading.utils import utils
+from trading.utils.async_logging import log_event, start_logging
+from trading.utils.clock import Clock, ReplayClock
+from trading.utils.latency import LatencyRecorder
+from trading.utils.stream_indicators import StreamingIndicators
+from trading.utils.tick_journal import TickJournal
+from trading.utils.tick_store import TickStore
+from trading.utils.ticks import Tick
 
 
 logger = logging.getLogger()
 
+
+class Reconnects():
+
+    """
+        Backoff between the connections of a stream: backoff * 2 ** (attempt - 1) seconds up to max_backoff.
+        A connection that held for longer than held seconds starts the attempts over, None means give up.
+    """
+
+    def __init__(self, backoff = 1, max_backoff = 60, max_attempts = 30, held = 60):
+
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.max_attempts = max_attempts
+        self.held = held
+        self.attempt: int = 0
+        self.connected = None
+
+    def connecting(self):
+        self.connected = time.monotonic()
+
+    def next_backoff(self) -> float:
+
+        if self.held is not None and self.connected is not None and time.monotonic() - self.connected > self.held:
+            self.attempt = 0
+        self.attempt = self.attempt + 1
+
+        if self.attempt > self.max_attempts:
+            return None
+        return min(self.backoff * 2 ** (self.attempt - 1), self.max_backoff)
+
+
+class InstrumentFeed():
+
+    """
+        Bars and indicators of one instrument, shared by every strategy trading it.
+        The Trader lock guards the tick store and the indicators: the stream thread writes them, the strategy thread reads them.
+    """
+
+    def __init__(self, instrument, lock, incremental = True, latency: LatencyRecorder = None):
+
+        self.instrument = instrument
+        self.lock = lock
+        self.incremental = incremental
+        self.latency = latency if latency is not None else LatencyRecorder()
+        self.stages = {stage: f"{instrument}.{stage}" for stage in ["append", "bar_close", "wakeup", "calc_indicators", "set_strategy_indicators"]}
+        self.ticker_data = TickStore()
+        self.indicators = StreamingIndicators()
+        self.strategies = []
+
+        self.price_move_trigger = 0
+        self.evaluation_pending = False
+        self.last_evaluation_price = None
+        # arrival of the tick that requested the pending evaluation, 0 if it was not a tick
+        self.evaluation_received_ns: int = 0
+
+    def add_strategy(self, strategy: TradingStrategyExec, price_move_trigger = 0):
+
+        self.strategies.append(strategy)
+        if self.incremental:
+            strategy.indicators = self.indicators
+
+        # the most sensitive strategy decides when intra-bar moves trigger an evaluation
+        if price_move_trigger and (not self.price_move_trigger or price_move_trigger < self.price_move_trigger):
+            self.price_move_trigger = price_move_trigger
+
+    def warm_up(self, candles: pd.DataFrame):
+
+        with self.lock:
+            self.ticker_data.add_candles(candles, status="NA")
+
+            if self.incremental:
+                # the last candle is still forming, live ticks keep updating it until the next bar starts
+                for n in range(self.ticker_data.bar_count - len(candles), self.ticker_data.bar_count - 1):
+                    self.indicators.update(*self.ticker_data.bar(n))
+
+        logger.info(f"{self.instrument} warmed up with {len(candles)} candles")
+
+    def warm_start(self, file_name, api: OandaApi) -> bool:
+
+        """
+            Restores the bars saved by save_snapshot and fetches only the candles since the last one.
+            Returns False if there is no snapshot or it is too old to be closed with one candles request.
+        """
+
+        if not os.path.exists(file_name):
+            return False
+
+        bars = TickStore.read_bars(file_name)
+        if bars["time"].size == 0:
+            return False
+
+        last_bar_time = pd.Timestamp(int(bars["time"][-1]))
+        now = datetime.now(tz=timezone.utc).replace(tzinfo=None)
+        if now - last_bar_time > timedelta(seconds=utils.ticker_data_size * utils.bar_size_ns / 1e9):
+            logger.info(f"{self.instrument} snapshot is too old: {last_bar_time}")
+            return False
+
+        candles = api.get_price_candles_since(pair_name=self.instrument, date_f=last_bar_time + timedelta(seconds=utils.bar_size_ns / 1e9))
+        if candles is None:
+            return False
+
+        with self.lock:
+            self.ticker_data.add_bars(bars)
+            self.ticker_data.add_candles(candles, status="NA")
+
+            if self.incremental:
+                # replaying the bars rebuilds the indicator state, the last bar is the forming one as in warm_up
+                for n in range(max(0, self.ticker_data.bar_count - self.ticker_data.bar_capacity), self.ticker_data.bar_count - 1):
+                    self.indicators.update(*self.ticker_data.bar(n))
+
+        logger.info(f"{self.instrument} warm started with {bars['time'].size} bars from {last_bar_time} and {len(candles)} new candles")
+        return True
+
+    def save_snapshot(self, file_name):
+
+        with self.lock:
+            self.ticker_data.save_bars(file_name)
+
+    def backfill(self, api: OandaApi) -> int:
+
+        """
+            Fetches the candles from the forming bar on, so ticks missed while the stream was down do not leave
+            a hole in the bars. Returns the number of bars closed by the backfill.
+        """
+
+        steps = self.backfill_steps()
+        try:
+            date_f = next(steps)
+            while True:
+                date_f = steps.send(api.get_price_candles_since(pair_name=self.instrument, date_f=date_f))
+        except StopIteration as done:
+            return done.value
+
+    def backfill_steps(self):
+
+        """
+            backfill as a generator of the candles requests: yields the date_f of each one and is sent its candles,
+            returns the number of bars closed. AsyncTrader makes the same requests on its loop.
+        """
+
+        start = date_f = self.backfill_start()
+        if date_f is None:
+            return 0
+
+        closed: int = 0
+
+        while True:
+            candles = yield date_f
+            if candles is None:
+                raise Exception(f"Failed to backfill {self.instrument} candles from {date_f}")
+
+            closed = closed + self.add_backfill(candles)
+
+            # one request returns up to ticker_data_size candles, a longer outage takes a few
+            if len(candles) < utils.ticker_data_size:
+                break
+            date_f = candles.index[-1]
+
+        logger.info(f"{self.instrument} backfilled {closed} bars from {start}")
+        return closed
+
+    def backfill_start(self):
+
+        # the time of the forming bar, the backfill starts there. None before the warm up
+        with self.lock:
+            last_bar = self.ticker_data.last_bar()
+
+        return None if last_bar is None else last_bar[0]
+
+    def add_backfill(self, candles: pd.DataFrame) -> int:
+
+        # returns the number of bars the candles closed
+        with self.lock:
+            forming = self.ticker_data.bar_count - 1
+            self.ticker_data.add_candles(candles, status="NA")
+
+            if self.incremental:
+                for n in range(forming, self.ticker_data.bar_count - 1):
+                    self.indicators.update(*self.ticker_data.bar(n))
+
+            return self.ticker_data.bar_count - 1 - forming
+
+    def add_tick(self, time_ns, bid, ask, status):
+
+        """
+            Called by the stream thread with the lock held, returns the reason to evaluate the strategies or None
+        """
+
+        closed_bar = self.ticker_data.add_tick(time_ns, bid, ask, status)
+        if closed_bar is not None:
+            if self.incremental:
+                self.indicators.update(*closed_bar)
+            return "bar closed"
+
+        if self.price_move_trigger and self.last_evaluation_price \
+                and abs((ask + bid)/2 - self.last_evaluation_price) >= self.price_move_trigger * self.last_evaluation_price:
+            return "price moved"
+
+        return None
+
+    def set_strategy_indicators(self) -> bool:
+
+        """
+            Calculates the indicators once and hands them to every strategy, returns False if there is not enough data yet
+        """
+
+        if self.incremental:
+
+            if self.ticker_data.bar_count == 0 or not self.indicators.ready:
+                logger.info(f"Skip strategy execution, {self.indicators.count} {self.instrument} bars are not enough to calculate indicators")
+                return False
+
+            start = time.perf_counter_ns()
+            with self.lock:
+                row = self.indicators.preview(*self.ticker_data.last_bar())
+                self.last_evaluation_price = row["close"]
+            self.latency.since(self.stages["calc_indicators"], start)
+
+            start = time.perf_counter_ns()
+            for strategy in self.strategies:
+                strategy.set_strategy_indicators(row)
+            self.latency.since(self.stages["set_strategy_indicators"], start)
+
+        else:
+
+            # strategy.data outlives the lock, the stream thread keeps writing the bar buffer: take a copy
+            with self.lock:
+                ticker_data_df = self.ticker_data.bars_frame(utils.ticker_data_size, copy=True)
+
+            if len(ticker_data_df) < utils.ticker_data_size:
+                logger.info(f"Skip strategy execution, {len(ticker_data_df)} {self.instrument} ticker data size is too small")
+                return False
+
+            logger.debug("Ticker data: %s", ticker_data_df)
+            start = time.perf_counter_ns()
+            lead = self.strategies[0]
+            lead.data = ticker_data_df
+            lead.calc_indicators()
+            self.latency.since(self.stages["calc_indicators"], start)
+
+            start = time.perf_counter_ns()
+            for strategy in self.strategies:
+                strategy.data = lead.data
+                strategy.set_strategy_indicators()
+            self.last_evaluation_price = lead.price
+            self.latency.since(self.stages["set_strategy_indicators"], start)
+
+        return True
+
+
 class Trader():
-    def __init__(self, conf_file, pair_file, trading_strategy, unit_test = False):
+    def __init__(self, conf_file, pair_file, trading_strategy, unit_test = False, incremental = True, snapshot_dir = None, journal_dir = None, replay = False):
 
-        self.init_logs(name=trading_strategy, unit_test=unit_test)
+        # one process can run several pairs.ini sections, they share one price stream and one feed per instrument
+        self.trading_strategies = [trading_strategy] if isinstance(trading_strategy, str) else list(trading_strategy)
 
-        self.api = OandaApi(conf_file)
+        self.init_logs(name="_".join(self.trading_strategies), unit_test=unit_test)
+
+        self.api = self.create_api(conf_file)
         self.streaming = False
 
 
@@ -39,9 +300,76 @@ class Trader():
         # self.start = config.get(self.strategy.instrument, 'start')
         # self.end = config.get(self.strategy.instrument, 'end')
 
-        self.ticker_data_deque = None
+        self.ticker_data_lock = threading.Lock()
         self.stop_loss_count = 0
-        
+        self.exec_counter: int = 0
+        self.error_counter: int = 0
+
+        # a replay (unit/replay.py) runs the strategies inline on the stream thread and places orders synchronously,
+        # so a run over the same ticks makes the same decisions at any speed. Its clock follows the ticks.
+        self.replay = replay
+        self.clock = ReplayClock() if replay else Clock()
+        # new_price_ticker runs the evaluations a tick requested before it returns
+        self.evaluate_inline = replay
+
+        # incremental mode updates the indicators once per closed 30s bar instead of
+        # running calc_indicators over the whole bar window on every refresh
+        self.incremental = incremental
+
+        # the stream thread wakes the strategy thread when a 30s bar closes or the price moves
+        # more than price_move_trigger (a fraction of the price) since the last evaluation
+        self.evaluation = threading.Condition(self.ticker_data_lock)
+
+        # positions come from the transactions stream, the strategies fall back to get_position while it is down
+        self.positions = Position_Book()
+
+        # tick to order latency per stage, dumped to the log and a json file next to it
+        self.latency = LatencyRecorder()
+        self.api.latency = self.latency
+
+        # orders are placed and reported on their own thread, the strategy thread only queues them
+        self.executor = self.create_executor()
+
+        # bars and trading sessions are saved here, so a restart only fetches the candles it missed. Off by default,
+        # the sessions are unpickled on start up and a pickle can run code: the directory must be the Trader's own
+        self.snapshot_dir = snapshot_dir
+        if snapshot_dir is not None:
+            os.makedirs(snapshot_dir, exist_ok=True)
+
+        # optional record of every streamed tick, for replaying real sessions
+        self.journal = TickJournal(journal_dir) if journal_dir is not None else None
+
+        self.strategies = []
+        self.feeds = {}
+
+        for trading_strategy in self.trading_strategies:
+
+            strategy = self.load_strategy(config, trading_strategy, pair_file, unit_test)
+            strategy.positions = self.positions
+            strategy.executor = None if replay else self.executor
+            strategy.latency = self.latency
+            strategy.clock = self.clock
+            self.strategies.append(strategy)
+
+            feed = self.feeds.get(strategy.instrument)
+            if feed is None:
+                feed = InstrumentFeed(strategy.instrument, self.ticker_data_lock, incremental, self.latency)
+                self.feeds[strategy.instrument] = feed
+            feed.add_strategy(strategy, config.getfloat(trading_strategy, 'price_move_trigger', fallback=0))
+
+        today = datetime.now(tz=timezone.utc).date()
+
+        # self.from_dt = datetime.combine(today, datetime.strptime(self.start, '%H:%M:%S').time())
+        # self.to_dt = datetime.combine(today, datetime.strptime(self.end, '%H:%M:%S').time())
+        # if self.to_dt < self.from_dt:
+        #     self.to_dt = self.to_dt + timedelta(days=1)
+
+        self.terminate = False
+
+        super().__init__()
+
+    def load_strategy(self, config, trading_strategy, pair_file, unit_test) -> TradingStrategyExec:
+
         class_ = None
         strategy = config.get(trading_strategy, 'strategy')
 
@@ -56,35 +384,29 @@ class Trader():
             raise Exception(f"Strategy not found for {trading_strategy}")
 
         logger.info(f"Running:{class_} strategy")
-        self.strategy: TradingStrategyExec  = class_(trading_strategy=trading_strategy, pair_file=pair_file, api = self.api, unit_test = unit_test)
-        logger.info(f"Trading Strategy: {self.strategy}")
+        strategy: TradingStrategyExec  = class_(trading_strategy=trading_strategy, pair_file=pair_file, api = self.api, unit_test = unit_test)
+        logger.info(f"Trading Strategy: {strategy}")
 
-        today = datetime.now(tz=timezone.utc).date()
+        return strategy
 
-        # self.from_dt = datetime.combine(today, datetime.strptime(self.start, '%H:%M:%S').time())
-        # self.to_dt = datetime.combine(today, datetime.strptime(self.end, '%H:%M:%S').time())
-        # if self.to_dt < self.from_dt:
-        #     self.to_dt = self.to_dt + timedelta(days=1)
 
-        self.terminate = False
+    def init_logs(self, name, unit_test = False):
 
-        super().__init__()
+        # the stream and strategy threads only queue log records, a listener thread formats and writes them
+        day = datetime.now(tz=timezone.utc).strftime('%m-%d')
+        log_file = os.path.join("../../logs/trading", f"{name}_{day}_app.log")
+        events_file = os.path.join("../../logs/trading", f"{name}_{day}_events.jsonl")
+        self.log_listener = start_logging(log_file, events_file, level=(logging.DEBUG if unit_test else logging.INFO))
 
+        self.latency_file = os.path.join("../../logs/trading", f"{name}_latency.json")
 
-    def init_logs(self, name, unit_test = False):
+    def create_api(self, conf_file):
 
-        
-        if unit_test:
-            logger.setLevel(logging.DEBUG)            
-        else:
-            logger.setLevel(logging.INFO)
+        # the one client of the streams, the strategies and the orders, so they share one request budget
+        return OandaApi(conf_file)
 
-        formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s', utils.date_format)
-
-        log_file = os.path.join("../../logs/trading", f"{name}_{datetime.now(tz=timezone.utc).strftime('%m-%d')}_app.log")
-        log_handler = handlers.RotatingFileHandler(log_file, maxBytes=1024*1024, backupCount=5)
-        log_handler.setFormatter(formatter)
-        logger.addHandler(log_handler)
+    def create_executor(self):
+        return OrderExecutor(self.api, latency=self.latency)
 
 
     def start_trading(self, stop_after = None):
@@ -94,46 +416,174 @@ class Trader():
         self.terminate = False
 
         treads = []
-        # treads.append(threading.Thread(target=self.check_positions, args=(1 * 60,)))
+        if self.replay:
+            self.start_streaming(stop_after)
+            self.terminate_session("Finished Replay Session")
+            return
+
+        treads.append(threading.Thread(target=self.track_positions))
+        treads.append(threading.Thread(target=self.check_positions, args=(5 * 60,)))
         # # treads.append(threading.Thread(target=self.check_trading_time, args=(1 * 60,)))
         treads.append(threading.Thread(target=self.start_streaming, args=(stop_after,)))
         treads.append(threading.Thread(target=self.refresh_strategy, args=(10,stop_after)))
+        if self.snapshot_dir is not None:
+            treads.append(threading.Thread(target=self.save_snapshots, args=(60,)))
+        treads.append(threading.Thread(target=self.report_latency, args=(5 * 60,)))
 
 
+        self.executor.start()
+        if self.journal is not None:
+            self.journal.start()
+
+        # no need to stagger the threads, the strategy thread waits for the stream to request an evaluation
         for t in treads:
             t.start()
-            time.sleep(5)
         
         for t in treads:
             t.join()
 
+        self.executor.stop()
+        if self.journal is not None:
+            self.journal.close()
+
         self.terminate_session("Finished Trading Session")
 
     
     def start_streaming(self, stop_after = None):
 
-        # self.ticker_data_deque.extend(self.api.get_latest_price_candles(pair_name=self.strategy.instrument).drop(columns=["mid_o", "volume"]).to_records())
-        candles = self.api.get_latest_price_candles(pair_name=self.strategy.instrument)
-        candles["status"] = "NA"
-        self.ticker_data_deque = deque(maxlen=utils.ticker_data_size * 500, iterable = candles.drop(columns={"volume"}).reset_index().values.tolist())
-        self.streaming = True
-        i: int = 0
+        for instrument, feed in self.feeds.items():
+            if not self.restore_snapshot(feed):
+                feed.warm_up(self.api.get_latest_price_candles(pair_name=instrument))
+
+        with self.evaluation:
+            self.streaming = True
+            # decide on the warm up data right away instead of waiting for the first bar to close
+            for feed in self.feeds.values():
+                self.request_evaluation(feed, "warmed up")
+        reconnects = Reconnects()
 
         while not self.terminate:
 
+            reconnects.connecting()
+
             try:
-                logger.info ("Start Stream")
-                self.api.stream_prices(instrument=self.strategy.instrument, stop = stop_after, callback=self.new_price_ticker)
-                self.terminate = True
-                break
+                logger.info (f"Start Stream: {', '.join(self.feeds)}")
+                # one connection for all instruments, new_price_ticker demultiplexes the ticks
+                if self.api.stream_prices(instrument=",".join(self.feeds), stop = stop_after, callback=self.new_price_ticker, on_connect=self.on_prices_connect):
+                    self.stop_trading()
+                    break
+                logger.warning("Price stream ended by the server")
 
             except Exception as e:
                 logger.error(f"Error in start_streaming")
                 logger.exception(e)
-                i = i + 1
-                if i > 30:
-                    self.terminate = True
-                    break
+
+            if self.terminate:
+                break
+
+            backoff = reconnects.next_backoff()
+            if backoff is None:
+                self.stop_trading()
+                break
+
+            logger.info(f"Reconnecting price stream in {backoff}s, attempt {reconnects.attempt}")
+            self.wait(backoff)
+
+    def on_prices_connect(self):
+
+        # the stream only carries ticks from now on, candles cover the time since the last tick.
+        # A replay stream resumes where it stopped, there is no gap and its candles would race the streamed ticks.
+        if self.replay:
+            return
+
+        for feed in self.feeds.values():
+            if feed.backfill(self.api) > 0:
+                with self.evaluation:
+                    self.request_evaluation(feed, "backfilled")
+
+    def stop_trading(self):
+
+        with self.evaluation:
+            self.terminate = True
+            self.evaluation.notify_all()
+
+        self.api.stop_streaming()
+
+    def wait(self, timeout):
+
+        # like time.sleep, but returns as soon as trading stops
+        with self.evaluation:
+            self.evaluation.wait_for(lambda: self.terminate, timeout=timeout)
+
+    def request_evaluation(self, feed: InstrumentFeed, reason, received_ns = 0):
+
+        # called by the stream thread while it holds ticker_data_lock
+        logger.debug("Evaluation requested: %s %s", feed.instrument, reason)
+        if not feed.evaluation_pending:
+            feed.evaluation_received_ns = received_ns
+        feed.evaluation_pending = True
+        self.evaluation.notify()
+
+    def wait_for_evaluation(self, timeout) -> list:
+
+        # returns the feeds with a pending evaluation and the arrival of the tick that requested it
+        with self.evaluation:
+            self.evaluation.wait_for(lambda: self.terminate or any(feed.evaluation_pending for feed in self.feeds.values()), timeout=timeout)
+            if self.terminate:
+                return []
+            requested = [(feed, feed.evaluation_received_ns) for feed in self.feeds.values() if feed.evaluation_pending]
+            for feed, _ in requested:
+                feed.evaluation_pending = False
+
+        return requested
+
+    def snapshot_file(self, name):
+        return os.path.join(self.snapshot_dir, name)
+
+    def restore_snapshot(self, feed: InstrumentFeed) -> bool:
+
+        if self.snapshot_dir is None:
+            return False
+
+        try:
+            if not feed.warm_start(self.snapshot_file(f"{feed.instrument}_bars.npz"), self.api):
+                return False
+
+            for trading_strategy, strategy in zip(self.trading_strategies, self.strategies):
+                session_file = self.snapshot_file(f"{trading_strategy}_session.pcl")
+                if strategy.instrument == feed.instrument and os.path.exists(session_file):
+                    strategy.trading_session = Trading_Session.load(session_file)
+                    logger.info(f"{trading_strategy} trading session restored, trades: {len(strategy.trading_session.trades)}")
+
+        except Exception as e:
+            logger.error(f"Error restoring {feed.instrument} snapshot")
+            logger.exception(e)
+            return False
+
+        return True
+
+    def save_snapshot(self):
+
+        if self.snapshot_dir is None or not self.streaming:
+            return
+
+        for instrument, feed in self.feeds.items():
+            feed.save_snapshot(self.snapshot_file(f"{instrument}_bars.npz"))
+
+        for trading_strategy, strategy in zip(self.trading_strategies, self.strategies):
+            strategy.trading_session.save(self.snapshot_file(f"{trading_strategy}_session.pcl"))
+
+        logger.debug("Snapshot saved")
+
+    def save_snapshots(self, refresh = 60):
+
+        while not self.terminate:
+            self.wait(refresh)
+            try:
+                self.save_snapshot()
+            except Exception as e:
+                logger.error("Exception occurred in save_snapshots")
+                logger.exception(e)
 
     def stop_streaming(self):
 
@@ -169,75 +619,98 @@ class Trader():
 
     def refresh_strategy(self, refresh = 10, stop_after=99999999999999999999999999):
 
-        error_counter: int = 0
-        exec_counter: int = 0
-
         while not self.terminate:
-            time.sleep(refresh)
+
+            # refresh only bounds the wait, the strategies run when the stream requests an evaluation
+            feeds = self.wait_for_evaluation(timeout=refresh)
+            if not feeds:
+                continue
+
+            if not self.streaming:
+                logger.info("Skip strategy execution, streaming has not started")
+                continue
 
             logger.debug("Refreshing Strategy")
 
-            try:
+            for feed, received_ns in feeds:
+                self.evaluate(feed, received_ns)
+                if self.terminate:
+                    break
 
-                ticker_data_df = None
+            if stop_after is not None and self.exec_counter > stop_after:
+                self.terminate = True
+                break
 
-                if self.streaming:
+            # time.sleep(refresh)
 
-                    ticker_data_list = list(self.ticker_data_deque)
-                    ticker_data_df = pd.DataFrame(ticker_data_list, columns=["time", "close", "bid", "ask", "status"])
-                    ticker_data_df = ticker_data_df.set_index('time')
-                    ticker_data_df.index = ticker_data_df.index.tz_localize(None)
-                    ticker_data_df = ticker_data_df.resample("30s").last()
-                    ticker_data_df = ticker_data_df.tail(utils.ticker_data_size)
-                    ticker_data_df.dropna(inplace = True)
-                else:
-                    ticker_data_df = self.api.get_latest_price_candles(pair_name=self.strategy.instrument)
+    def evaluate(self, feed: InstrumentFeed, received_ns = 0):
 
-                if ticker_data_df.size < utils.ticker_data_size:
-                    logger.info(f"Skip strategy execution, {ticker_data_df.size} ticker data size is too small")
-                    continue
+        # runs the strategies of one instrument, on the strategy thread or inline on the stream thread in a replay
+        try:
 
+            if received_ns:
+                self.latency.since(feed.stages["wakeup"], received_ns)
+
+            # indicators are calculated once per instrument and shared by its strategies
+            if not feed.set_strategy_indicators():
+                return
+
+            for strategy in feed.strategies:
+                strategy.tick_received_ns = received_ns
+                strategy.execute_strategy()
+            self.exec_counter = self.exec_counter + 1
+
+            if self.exec_counter % 50 == 0:
+                logger.info ("Heartbeat... %s", self.exec_counter)
+                log_event("heartbeat", instrument=feed.instrument, evaluations=self.exec_counter, errors=self.error_counter,
+                          bars=feed.ticker_data.bar_count, price=feed.last_evaluation_price, requests=self.request_counters())
+                for strategy in feed.strategies:
+                    strategy.print_indicators()
+
+            # try:
+            #     self.strategy.execute_strategy()
+            # except PauseTradingException as e:
+            #     logger.info(f"Caught Stop Loss Error. Continue Traiding...")
+            #     self.stop_loss_count = self.stop_loss_count + 1
+                # time.sleep(2 * 60 * 60)
+                
+                # if self.stop_loss_count > 2:
+                #     logger.error(f"Stop Loss Count > 2. Terminating Trading")
+                #     self.terminate = True
+
+        except Exception as e:
+            logger.error(f"Exception occurred in refresh_strategy: {feed.instrument}")
+            logger.exception(e)
+            self.error_counter = self.error_counter + 1                
+            if self.error_counter > 10:
+                logger.error(f"Too many errors: {self.error_counter}")
+                # the next two lines are redundant, but I am leaving them in place
+                self.terminate = True
 
-                logger.debug(f"Ticker data: {ticker_data_df}")
-                self.strategy.data = ticker_data_df
-                self.strategy.calc_indicators()                
-                self.strategy.set_strategy_indicators()
-                self.strategy.execute_strategy()
-                exec_counter = exec_counter + 1
 
-                if exec_counter % 50 == 0:
-                    logger.info (f"Heartbeat... {exec_counter}")
-                    self.strategy.print_indicators()
-            
-                if stop_after is not None and exec_counter > stop_after:
-                    self.terminate = True
-                    break
-                # try:
-                #     self.strategy.execute_strategy()
-                # except PauseTradingException as e:
-                #     logger.info(f"Caught Stop Loss Error. Continue Traiding...")
-                #     self.stop_loss_count = self.stop_loss_count + 1
-                    # time.sleep(2 * 60 * 60)
-                    
-                    # if self.stop_loss_count > 2:
-                    #     logger.error(f"Stop Loss Count > 2. Terminating Trading")
-                    #     self.terminate = True
+    def report_latency(self, refresh = 300):
 
-            except Exception as e:
-                logger.error("Exception occurred in refresh_strategy")
-                logger.exception(e)
-                error_counter = error_counter + 1                
-                if error_counter > 10:
-                    logger.error(f"Too many errors: {error_counter}")
-                    # the next two lines are redundant, but I am leaving them in place
-                    self.terminate = True
-                    break
+        while not self.terminate:
+            self.wait(refresh)
+            self.dump_latency()
 
-            # time.sleep(refresh)
+    def dump_latency(self):
 
+        try:
+            logger.info("Latency:\n" + self.latency.to_string())
+            logger.info(f"Requests: {self.request_counters()}")
+            self.latency.write_json(self.latency_file)
+        except Exception as e:
+            logger.error("Error writing latency")
+            logger.exception(e)
+
+    def request_counters(self) -> dict:
+        return self.api.scheduler.counters()
 
     def check_positions(self, refresh = 300): 
 
+        # periodic reconciliation of the position book with the account, in case the stream missed something
+
         i: int = 0
         print_logs: int = 0
 
@@ -246,69 +719,122 @@ class Trader():
 
                 logger.debug("Check Positions")
 
-                units = self.api.get_position(instrument = self.strategy.instrument)
-                if not units == self.strategy.trading_session.have_units:
-                    self.strategy.trading_session.have_units = units
+                for instrument in self.feeds:
+                    units = self.reconcile_positions(instrument)
 
-                if print_logs % 5 == 0:
-                    logger.info(f"Instrument: {self.strategy.instrument}, Units: {units}")
+                    if print_logs % 5 == 0:
+                        logger.info(f"Instrument: {instrument}, Units: {units}")
 
                 print_logs = print_logs + 1
-                time.sleep(refresh)
+                self.wait(refresh)
 
             except Exception as e:
                 logger.error("Exception occurred in check_positions")
                 logger.exception(e)
                 i = i + 1
                 if i > 20:
-                    self.terminate = True
+                    self.stop_trading()
                     break
-                time.sleep(5)
+                self.wait(5)
+
+    def reconcile_positions(self, instrument):
+
+        units, last_transaction_id = self.api.get_position_snapshot(instrument = instrument)
+        self.positions.reconcile(instrument, units, last_transaction_id)
+
+        return units
+
+    def track_positions(self):
+
+        # every 5 seconds, 30 failures at most
+        reconnects = Reconnects(backoff=5, max_backoff=5, held=None)
+
+        while not self.terminate:
+            try:
+                logger.info ("Start Transactions Stream")
+                self.api.stream_transactions(callback=self.positions.on_transaction, on_connect=self.on_transactions_connect)
+
+            except Exception as e:
+                logger.exception(f"Error in track_positions: {e!r}")
+                if reconnects.next_backoff() is None:
+                    break
+
+            finally:
+                self.positions.streaming = False
+
+            self.wait(5)
+
+    def on_transactions_connect(self):
+
+        # fills from now on arrive on the stream, take the snapshot they apply to
+        for instrument in self.feeds:
+            self.reconcile_positions(instrument)
+        self.positions.streaming = True
         
  
-    def new_price_ticker(self, **kwargs):
+    def new_price_ticker(self, tick: Tick):
 
-        instrument = kwargs.get('instrument')
-        date_time = kwargs.get('time')
-        ask = kwargs.get('ask')
-        # ask_liquidity = kwargs.get('ask_liquidity')
-        bid = kwargs.get('bid')
-        # bid_liquidity = kwargs.get('bid_liquidity')
-        status = kwargs.get('status')
+        instrument, time_ns, bid, ask, status, received_ns = tick
 
-        if not (instrument and time and bid and ask and status):
+        if not (instrument and time_ns and bid and ask and status):
             logger.error(f"Invalid instrument price values!!!")
-            logger.error(f"Instrument: {instrument} | Time: {date_time} | Bid: {bid} | Ask: {ask} | Status: {status}")
+            logger.error(f"Instrument: {instrument} | Time: {time_ns} | Bid: {bid} | Ask: {ask} | Status: {status}")
             return
         
-        logger.debug(f"Instrument: {instrument} | Time: {date_time} | Bid: {bid} | Ask: {ask} | Status: {status}")
+        logger.debug("Instrument: %s | Time: %s | Bid: %s | Ask: %s | Status: %s", instrument, time_ns, bid, ask, status)
 
-         # 2023-12-19T13:28:35.194571445Z
-        pd_timestamp: pd.Timestamp = pd.to_datetime(date_time).replace(tzinfo=None)
-        
-        recent_tick = [pd_timestamp, (ask + bid)/2, bid, ask, status]
-        self.ticker_data_deque.append(recent_tick)
+        if self.journal is not None:
+            self.journal.record(instrument, time_ns, bid, ask, status)
 
-        minute: int = pd_timestamp.minute
-        second: int = pd_timestamp.second
+        feed = self.feeds.get(instrument)
+        if feed is None:
+            logger.warning(f"Price ticker for an instrument not traded: {instrument}")
+            return
+
+        if self.replay:
+            self.clock.set(time_ns)
+
+        with self.ticker_data_lock:
+            start = time.perf_counter_ns()
+            reason = feed.add_tick(time_ns, bid, ask, status)
+            if reason is not None:
+                self.request_evaluation(feed, reason, received_ns)
+        self.latency.since(feed.stages["bar_close" if reason == "bar closed" else "append"], start)
 
-        if minute in [0, 15, 30, 45] and second == 0:
-            logger.info(f"Heartbeat: instrument: {self.strategy.instrument} | ask: {ask} | bid: {bid} | status: {status}")
+        if self.evaluate_inline:
+            for feed, received_ns in self.wait_for_evaluation(timeout=0):
+                self.evaluate(feed, received_ns)
+
+        # minute 0, 15, 30 or 45 and second 0
+        if time_ns // 1_000_000_000 % 900 == 0:
+            logger.info("Heartbeat: instrument: %s | ask: %s | bid: %s | status: %s", instrument, ask, bid, status)
+            log_event("price_heartbeat", instrument=instrument, time_ns=time_ns, bid=bid, ask=ask, status=status)
  
   
         
     def terminate_session(self, cause):
         # self.stop_stream = True
         logger.info (cause)
+        self.dump_latency()
+
+        try:
+            self.save_snapshot()
+        except Exception as e:
+            logger.error("Error saving snapshot")
+            logger.exception(e)
 
-        self.strategy.terminate()
+        for strategy in self.strategies:
+            strategy.terminate()
 
 
     
 if __name__ == "__main__":
 
     parser = argparse.ArgumentParser()
-    parser.add_argument('trading_strategy', type=str, help='trading_strategy')
+    parser.add_argument('trading_strategy', type=str, nargs='+', help='trading_strategy, several pairs.ini sections share one price stream')
+    parser.add_argument('--snapshot_dir', type = str, default=None, help='Save and warm start from snapshots in this directory, the sessions are pickles: only use a directory no one else writes to')
+    parser.add_argument('--journal_dir', type = str, default=None, help='Record every streamed tick to this directory')
+    parser.add_argument('--incremental', choices=['True', 'False', 'true', 'false'], default="True", type = str, help='Update indicators per closed bar instead of recalculating them every refresh')
     args = parser.parse_args()
 
     config_file = os.path.abspath(path="../../config/oanda.cfg")
@@ -321,8 +847,13 @@ if __name__ == "__main__":
         conf_file=config_file,
         pair_file="pairs.ini",
         trading_strategy=args.trading_strategy,
-        unit_test=False
+        unit_test=False,
+        incremental=(args.incremental in ['True', 'true']),
+        snapshot_dir=(None if args.snapshot_dir is None else os.path.abspath(args.snapshot_dir)),
+        journal_dir=(None if args.journal_dir is None else os.path.abspath(args.journal_dir))
     )
     trader.start_trading()
     
 # python trading_bot.py EUR_USD
+# python trading_bot.py EUR_USD#1 EUR_USD#2
+# python trading_bot.py EUR_USD#1 EUR_USD#2 --snapshot_dir ../../snapshots
@@ -0,0 +1,119 @@
+import atexit
+import json
+import logging
+import logging.handlers as handlers
+import queue
+from datetime import datetime, timezone
+
+from trading.utils import utils
+
+"""
+Logging that never waits on the disk.
+
+The root logger only gets a QueueHandler: a log call puts the record on a queue and returns, a QueueListener thread
+formats it and writes the rotating log file. Unlike the standard QueueHandler the record is not formatted on the
+calling thread either, so an expensive argument (a Lazy, a DataFrame) is only turned into text by the writer.
+Arguments must therefore not change after the call: pass values or snapshots, not live buffers.
+
+Trade and heartbeat events go to the "events" logger as one JSON object per line in a file next to the log,
+see log_event.
+"""
+
+events_logger = logging.getLogger("events")
+events_logger.propagate = False
+
+listeners = []
+
+
+class Lazy():
+
+    """
+        Defers an expensive log argument: logger.info("%s", Lazy(json.dumps, order, indent=2))
+        calls json.dumps only if the record is written, and then on the writer thread.
+    """
+
+    __slots__ = ("function", "args", "kwargs")
+
+    def __init__(self, function, *args, **kwargs):
+        self.function = function
+        self.args = args
+        self.kwargs = kwargs
+
+    def __str__(self):
+        return str(self.function(*self.args, **self.kwargs))
+
+
+class DeferredQueueHandler(handlers.QueueHandler):
+
+    def prepare(self, record):
+
+        # tracebacks and stacks refer to frames that are gone by the time the writer gets to them
+        if record.exc_info or record.stack_info:
+            return super().prepare(record)
+
+        return record
+
+
+class JsonLinesFormatter(logging.Formatter):
+
+    def format(self, record):
+
+        event = dict(time=datetime.fromtimestamp(record.created, tz=timezone.utc).strftime(utils.date_format), event=record.msg)
+        event.update(getattr(record, "fields", {}))
+        return json.dumps(event, default=str)
+
+
+def log_event(event, **fields):
+
+    """
+        Writes {"time": ..., "event": event, **fields} to the events file, fields are serialized on the writer thread
+    """
+
+    if events_logger.handlers:
+        events_logger.info(event, extra=dict(fields=fields))
+
+
+def start_logging(log_file, events_file = None, level = logging.INFO, max_bytes = 1024*1024, backup_count = 5) -> handlers.QueueListener:
+
+    """
+        Routes the root logger, and the events logger if events_file is given, through one queue and one writer thread
+    """
+
+    records = queue.SimpleQueue()
+
+    log_handler = handlers.RotatingFileHandler(log_file, maxBytes=max_bytes, backupCount=backup_count)
+    log_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s', utils.date_format))
+    log_handler.addFilter(lambda record: record.name != events_logger.name)
+    file_handlers = [log_handler]
+
+    root = logging.getLogger()
+    root.setLevel(level)
+    root.addHandler(DeferredQueueHandler(records))
+
+    if events_file is not None:
+        events_handler = handlers.RotatingFileHandler(events_file, maxBytes=max_bytes, backupCount=backup_count)
+        events_handler.setFormatter(JsonLinesFormatter())
+        events_handler.addFilter(lambda record: record.name == events_logger.name)
+        file_handlers.append(events_handler)
+
+        events_logger.setLevel(logging.INFO)
+        events_logger.addHandler(DeferredQueueHandler(records))
+
+    listener = handlers.QueueListener(records, *file_handlers)
+    listener.start()
+    listeners.append(listener)
+
+    return listener
+
+
+def stop_logging():
+
+    # writes out what is still queued, registered to run at exit
+    while listeners:
+        listener = listeners.pop()
+        listener.stop()
+        for handler in listener.handlers:
+            handler.close()
+
+
+atexit.register(stop_logging)
@@ -0,0 +1,115 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+
+import pandas as pd
+
+logger = logging.getLogger()
+
+"""
+Disk cache of OANDA candles requests, one JSON file per request: <directory>/<key[:2]>/<key>.json, key is the
+sha256 of (instrument, granularity, price, from, to).
+
+An entry holds the complete candles of its range in time order and whether the range is closed, all its candles
+complete and its "to" in the past. OandaApi serves a closed entry without a request and for an open one only
+fetches the candles after the last complete one, the still forming tail.
+
+The cache is kept under max_bytes by evicting the least recently used entries, a hit touches the file so its
+modification time is the last use.
+"""
+
+
+class CandleCache():
+
+    def __init__(self, directory, max_bytes = 1024 * 1024 * 1024):
+
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+        # file -> size of every entry, read from the directory on first use
+        self.sizes = None
+        self.lock = threading.Lock()
+
+    def key(self, instrument, granularity, price, date_f, date_t) -> str:
+
+        # pd.Timestamp, so a datetime and a Timestamp of the same time give the same key
+        request = [instrument, granularity, price, pd.Timestamp(date_f).isoformat(), pd.Timestamp(date_t).isoformat()]
+        return hashlib.sha256(json.dumps(request).encode()).hexdigest()
+
+    def path(self, key) -> str:
+        return os.path.join(self.directory, key[:2], f"{key}.json")
+
+    def get(self, key) -> dict:
+
+        """
+            The entry of key, dict(candles=[...], closed=bool), None when it is not cached
+        """
+
+        file_name = self.path(key)
+        try:
+            with open(file_name) as f:
+                entry = json.load(f)
+            os.utime(file_name)
+            return entry
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as error:
+            logger.warning(f"Ignoring unreadable candle cache entry {file_name}: {error!r}")
+            return None
+
+    def put(self, key, candles, closed):
+
+        file_name = self.path(key)
+        os.makedirs(os.path.dirname(file_name), exist_ok=True)
+
+        # replaced atomically, the candle download threads may read it meanwhile
+        tmp_name = f"{file_name}.{threading.get_ident()}.tmp"
+        with open(tmp_name, "w") as f:
+            json.dump(dict(candles=candles, closed=closed), f, separators=(",", ":"))
+        os.replace(tmp_name, file_name)
+
+        with self.lock:
+            sizes = self.entry_sizes()
+            sizes[file_name] = os.path.getsize(file_name)
+            self.evict(sizes)
+
+    def entry_sizes(self) -> dict:
+
+        if self.sizes is None:
+            self.sizes = {}
+            for folder, _, names in os.walk(self.directory):
+                for name in names:
+                    if name.endswith(".json"):
+                        file_name = os.path.join(folder, name)
+                        self.sizes[file_name] = os.path.getsize(file_name)
+        return self.sizes
+
+    def size(self) -> int:
+
+        with self.lock:
+            return sum(self.entry_sizes().values())
+
+    def evict(self, sizes):
+
+        total = sum(sizes.values())
+        if total <= self.max_bytes:
+            return
+
+        def last_used(file_name):
+            try:
+                return os.path.getmtime(file_name)
+            except OSError:
+                return 0
+
+        for file_name in sorted(sizes, key=last_used):
+            if total <= self.max_bytes:
+                break
+            total = total - sizes.pop(file_name)
+            try:
+                os.remove(file_name)
+            except FileNotFoundError:
+                pass
+            logger.debug(f"Evicted candle cache entry {file_name}")
@@ -0,0 +1,92 @@
+import importlib.util
+import logging
+import os
+from datetime import date, datetime, timedelta
+
+import pandas as pd
+
+logger = logging.getLogger()
+
+"""
+Local store of historical candles, one Parquet file per instrument per UTC day: <directory>/<instrument>/<YYYY-MM-DD>.parquet
+
+Only complete days are stored, so a stored day never has to be fetched again: OandaApi.get_price_candles asks
+missing_days which ones to download and writes them with write_day. read picks the day files of a time range
+(the partition pruning) and reads each with a time filter that pyarrow pushes down to the row groups.
+Days without candles (weekends, holidays) are stored as empty files, so they are not fetched again either.
+"""
+
+COLUMNS = ["volume", "close", "bid", "ask"]
+
+
+def require_pyarrow():
+
+    # pyarrow is in requirements.txt, pandas' own error does not say what needs it
+    if importlib.util.find_spec("pyarrow") is None:
+        raise ImportError("The candle store reads and writes Parquet files with pyarrow: pip install pyarrow.")
+
+
+class CandleStore():
+
+    def __init__(self, directory):
+
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def partition(self, instrument, day: date) -> str:
+        return os.path.join(self.directory, instrument, f"{day.isoformat()}.parquet")
+
+    def days(self, instrument) -> set:
+
+        folder = os.path.join(self.directory, instrument)
+        if not os.path.isdir(folder):
+            return set()
+
+        return {date.fromisoformat(name[:-len(".parquet")]) for name in os.listdir(folder) if name.endswith(".parquet")}
+
+    def missing_days(self, instrument, start: date, end: date) -> list:
+
+        """
+            The days from start to end, both included, that are not stored
+        """
+
+        stored = self.days(instrument)
+        return [start + timedelta(days=i) for i in range((end - start).days + 1) if start + timedelta(days=i) not in stored]
+
+    def write_day(self, instrument, day: date, candles: pd.DataFrame):
+
+        # callers only write days that are over, the file is replaced atomically so a reader never sees half of it
+        if candles is None or len(candles) == 0:
+            candles = pd.DataFrame({column: pd.Series(dtype="float64") for column in COLUMNS}, index=pd.DatetimeIndex([], name="time"))
+
+        require_pyarrow()
+        file_name = self.partition(instrument, day)
+        os.makedirs(os.path.dirname(file_name), exist_ok=True)
+        candles.to_parquet(file_name + ".tmp", engine="pyarrow", index=True)
+        os.replace(file_name + ".tmp", file_name)
+
+    def read(self, instrument, start: datetime, end: datetime) -> pd.DataFrame:
+
+        """
+            The stored candles with start <= time < end, times are naive UTC
+        """
+
+        start, end = pd.Timestamp(start), pd.Timestamp(end)
+        stored = self.days(instrument)
+
+        frames = []
+        day = start.date()
+        while day <= end.date():
+            if day in stored:
+                require_pyarrow()
+                frames.append(pd.read_parquet(self.partition(instrument, day), engine="pyarrow",
+                                              filters=[("time", ">=", start), ("time", "<", end)]))
+            day = day + timedelta(days=1)
+
+        frames = [frame for frame in frames if len(frame) > 0]
+        if not frames:
+            return pd.DataFrame(columns=COLUMNS, index=pd.DatetimeIndex([], name="time"))
+
+        # the candle at midnight can be in both days' files
+        df = pd.concat(frames).sort_index(kind="stable")
+        return df[~df.index.duplicated()]
@@ -0,0 +1,28 @@
+from datetime import datetime, timezone
+
+"""
+Where the strategies get the current time from.
+
+Live trading uses the system clock. A replay runs recorded ticks faster than real time, so its clock follows
+the time of the last tick instead, which keeps the staleness and trading hours checks meaningful.
+"""
+
+
+class Clock():
+
+    def utcnow(self) -> datetime:
+        # naive UTC, like the bar times
+        return datetime.now(tz=timezone.utc).replace(tzinfo=None)
+
+
+class ReplayClock(Clock):
+
+    def __init__(self, time_ns = 0):
+        self.time_ns = time_ns
+
+    def set(self, time_ns):
+        if time_ns > self.time_ns:
+            self.time_ns = time_ns
+
+    def utcnow(self) -> datetime:
+        return datetime.fromtimestamp(self.time_ns / 1e9, tz=timezone.utc).replace(tzinfo=None)
@@ -0,0 +1,135 @@
+import json
+import os
+import threading
+import time
+
+"""
+Latency histograms for the live pipeline, from a tick arriving on the stream to the order response.
+
+Histogram buckets are log-linear like HdrHistogram: values below 2 * 2^sub_bucket_bits ns get their own bucket,
+larger ones keep sub_bucket_bits + 1 significant bits (< 1% error with 7 bits). Recording is one index
+calculation and a list increment, so it can stay enabled on the tick path.
+"""
+
+
+class LatencyHistogram():
+
+    def __init__(self, sub_bucket_bits=7, max_shift=40):
+
+        self.sub_bucket_bits = sub_bucket_bits
+        self.sub_bucket_count = 1 << sub_bucket_bits
+        self.counts = [0] * (self.sub_bucket_count * (max_shift + 2))
+        self.count: int = 0
+        self.total: int = 0
+        self.min: int = None
+        self.max: int = 0
+
+    def index(self, value) -> int:
+
+        if value < 2 * self.sub_bucket_count:
+            return value
+        shift = value.bit_length() - self.sub_bucket_bits - 1
+        # sub_bucket_count * (shift + 1) + (value >> shift) - sub_bucket_count
+        return (shift << self.sub_bucket_bits) + (value >> shift)
+
+    def value(self, index) -> int:
+
+        # lowest value of a bucket
+        if index < 2 * self.sub_bucket_count:
+            return index
+        shift = index // self.sub_bucket_count - 1
+        return (index % self.sub_bucket_count + self.sub_bucket_count) << shift
+
+    def record(self, value: int):
+
+        if value < 0:
+            value = 0
+        index = self.index(value)
+        if index >= len(self.counts):
+            index = len(self.counts) - 1
+        self.counts[index] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+        if self.min is None or value < self.min:
+            self.min = value
+
+    def percentile(self, p) -> int:
+
+        if self.count == 0:
+            return 0
+
+        rank = max(1, int(round(p / 100 * self.count)))
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen = seen + count
+            if seen >= rank:
+                return min(self.value(index), self.max)
+
+        return self.max
+
+    def summary(self) -> dict:
+
+        return dict(
+            count=self.count,
+            mean=self.total / self.count if self.count else 0,
+            min=self.min or 0,
+            p50=self.percentile(50),
+            p90=self.percentile(90),
+            p99=self.percentile(99),
+            p999=self.percentile(99.9),
+            max=self.max
+        )
+
+
+class LatencyRecorder():
+
+    """
+        Named histograms in nanoseconds. Stages are free form names, the Trader uses
+        "<instrument>.<stage>" for the stream and indicator stages and "<strategy>.<stage>" per strategy.
+    """
+
+    def __init__(self):
+
+        self.histograms = {}
+        self.lock = threading.Lock()
+        self.started = time.time()
+
+    @staticmethod
+    def now() -> int:
+        return time.perf_counter_ns()
+
+    def record(self, stage, value_ns):
+
+        histogram = self.histograms.get(stage)
+        if histogram is None:
+            with self.lock:
+                histogram = self.histograms.setdefault(stage, LatencyHistogram())
+
+        # every stage is recorded from one thread only, the lock only guards adding stages against summary()
+        histogram.record(value_ns)
+
+    def since(self, stage, start_ns):
+
+        # records the time from start_ns (a perf_counter_ns value) until now
+        self.record(stage, time.perf_counter_ns() - start_ns)
+
+    def summary(self) -> dict:
+
+        with self.lock:
+            return {stage: histogram.summary() for stage, histogram in sorted(self.histograms.items())}
+
+    def to_string(self) -> str:
+
+        lines = [f"{'stage':<48}{'count':>10}{'p50 us':>12}{'p90 us':>12}{'p99 us':>12}{'p99.9 us':>12}{'max us':>12}"]
+        for stage, s in self.summary().items():
+            lines.append(f"{stage:<48}{s['count']:>10}{s['p50'] / 1e3:>12.1f}{s['p90'] / 1e3:>12.1f}{s['p99'] / 1e3:>12.1f}{s['p999'] / 1e3:>12.1f}{s['max'] / 1e3:>12.1f}")
+        return "\n".join(lines)
+
+    def write_json(self, file_name):
+
+        data = dict(started=self.started, written=time.time(), unit="ns", stages=self.summary())
+        with open(f"{file_name}.tmp", "w") as f:
+            json.dump(data, f, indent=2)
+        os.replace(f"{file_name}.tmp", file_name)
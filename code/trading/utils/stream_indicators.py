@@ -0,0 +1,455 @@
+import math
+from collections import deque
+
+import pandas as pd
+
+"""
+Incremental versions of the indicators built by TradingStrategyCalc.calc_indicators.
+
+Every indicator keeps a small amount of running state and is updated once per closed bar in O(1).
+preview() answers "what would the indicators be if this (still forming) bar closed now" without
+touching the state, which is what the live strategy evaluates between bar closes.
+
+Windows follow the pandas rolling semantics used by calc_indicators: a value is NaN until the
+window is full and while the window holds a NaN.
+"""
+
+NAN = float("nan")
+
+
+class RollingWindow():
+    # Running mean and sample standard deviation (Welford add/remove) over the last `size` values
+
+    def __init__(self, size, resync=1000):
+        self.size = size
+        self.resync = resync
+        self.values = deque()
+        self.nan_count: int = 0
+        self.n: int = 0
+        self.mean: float = 0
+        self.m2: float = 0
+        self.updates: int = 0
+
+    @staticmethod
+    def __add(n, mean, m2, x):
+        n = n + 1
+        delta = x - mean
+        mean = mean + delta / n
+        m2 = m2 + delta * (x - mean)
+        return n, mean, m2
+
+    @staticmethod
+    def __remove(n, mean, m2, x):
+        if n == 1:
+            return 0, 0.0, 0.0
+        n = n - 1
+        new_mean = mean - (x - mean) / n
+        m2 = m2 - (x - mean) * (x - new_mean)
+        return n, new_mean, m2
+
+    def update(self, x):
+
+        self.values.append(x)
+        if math.isnan(x):
+            self.nan_count = self.nan_count + 1
+        else:
+            self.n, self.mean, self.m2 = self.__add(self.n, self.mean, self.m2, x)
+
+        if len(self.values) > self.size:
+            old = self.values.popleft()
+            if math.isnan(old):
+                self.nan_count = self.nan_count - 1
+            else:
+                self.n, self.mean, self.m2 = self.__remove(self.n, self.mean, self.m2, old)
+
+        # removing values slowly accumulates rounding error, rebuild the sums from the window now and then
+        self.updates = self.updates + 1
+        if self.updates % self.resync == 0:
+            self.__recalc()
+
+    def __recalc(self):
+
+        self.n, self.mean, self.m2 = 0, 0.0, 0.0
+        for x in self.values:
+            if not math.isnan(x):
+                self.n, self.mean, self.m2 = self.__add(self.n, self.mean, self.m2, x)
+
+    def __state(self, x=None):
+
+        if x is None:
+            return len(self.values), self.nan_count, self.n, self.mean, self.m2
+
+        length, nan_count, n, mean, m2 = len(self.values) + 1, self.nan_count, self.n, self.mean, self.m2
+        if math.isnan(x):
+            nan_count = nan_count + 1
+        else:
+            n, mean, m2 = self.__add(n, mean, m2, x)
+
+        if length > self.size:
+            length = length - 1
+            old = self.values[0]
+            if math.isnan(old):
+                nan_count = nan_count - 1
+            else:
+                n, mean, m2 = self.__remove(n, mean, m2, old)
+
+        return length, nan_count, n, mean, m2
+
+    def get_mean(self, x=None):
+
+        length, nan_count, n, mean, _ = self.__state(x)
+        if length < self.size or nan_count > 0:
+            return NAN
+        return mean
+
+    def get_std(self, x=None):
+
+        length, nan_count, n, _, m2 = self.__state(x)
+        if length < self.size or nan_count > 0 or n < 2:
+            return NAN
+        return math.sqrt(max(m2, 0) / (n - 1))
+
+
+class RollingExtreme():
+    # Rolling max (or min) over the last `size` values with a monotonic deque
+
+    def __init__(self, size, find_max=True):
+        self.size = size
+        self.sign = 1 if find_max else -1
+        self.seq: int = 0
+        self.last_nan: int = -size
+        self.candidates = deque()
+
+    def update(self, x):
+
+        if math.isnan(x):
+            self.last_nan = self.seq
+        else:
+            key = self.sign * x
+            while self.candidates and self.candidates[-1][1] <= key:
+                self.candidates.pop()
+            self.candidates.append((self.seq, key))
+
+        self.seq = self.seq + 1
+        while self.candidates and self.candidates[0][0] <= self.seq - 1 - self.size:
+            self.candidates.popleft()
+
+    def get(self, x=None):
+
+        seq = self.seq if x is None else self.seq + 1
+        if seq < self.size or self.last_nan > seq - 1 - self.size or (x is not None and math.isnan(x)):
+            return NAN
+
+        first = seq - self.size
+        best = None
+        for i, key in self.candidates:
+            if i >= first:
+                best = key
+                break
+
+        if x is not None and (best is None or self.sign * x >= best):
+            best = self.sign * x
+
+        return NAN if best is None else self.sign * best
+
+
+class DecayingWindowSum():
+    # Sum of the last `size` values weighted by decay ** age, the newest value has weight 1
+
+    def __init__(self, size, decay):
+        self.size = size
+        self.decay = decay
+        self.drop_weight = decay ** size
+        self.values = deque()
+        self.nan_count: int = 0
+        self.nonzero_count: int = 0
+        self.total: float = 0
+
+    def update(self, x):
+
+        self.total, dropped = self.__next(x)
+        self.values.append(x)
+        self.nan_count = self.nan_count + (1 if math.isnan(x) else 0)
+        self.nonzero_count = self.nonzero_count + (1 if x != 0 else 0)
+        if dropped is not None:
+            self.values.popleft()
+            self.nan_count = self.nan_count - (1 if math.isnan(dropped) else 0)
+            self.nonzero_count = self.nonzero_count - (1 if dropped != 0 else 0)
+
+        # an all-zero window (no gains in a flat market) must give exactly 0, not leftover rounding
+        if self.nonzero_count == 0:
+            self.total = 0.0
+
+    def __next(self, x):
+
+        # NaN values take part as 0 and are tracked with nan_count, so the sum stays usable once they leave
+        total = self.decay * self.total + (0 if math.isnan(x) else x)
+        dropped = None
+        if len(self.values) == self.size:
+            dropped = self.values[0]
+            if not math.isnan(dropped):
+                total = total - self.drop_weight * dropped
+        return total, dropped
+
+    def get(self, x=None):
+
+        if x is None:
+            return self.total if len(self.values) == self.size and self.nan_count == 0 else NAN
+
+        total, dropped = self.__next(x)
+        length = min(len(self.values) + 1, self.size)
+        nan_count = self.nan_count + (1 if math.isnan(x) else 0) - (1 if dropped is not None and math.isnan(dropped) else 0)
+        nonzero_count = self.nonzero_count + (1 if x != 0 else 0) - (1 if dropped is not None and dropped != 0 else 0)
+        if length < self.size or nan_count > 0:
+            return NAN
+        return total if nonzero_count > 0 else 0.0
+
+    def oldest(self, x=None):
+
+        if x is not None and len(self.values) == self.size:
+            return self.values[1] if self.size > 1 else x
+        return self.values[0] if self.values else (NAN if x is None else x)
+
+
+class WindowedEma():
+    # Same value as calculate_ema(S=window, span=span) on the last `size` values
+
+    def __init__(self, size, span=15):
+        self.alpha = 2 / (span + 1)
+        self.first_weight = (1 - self.alpha) ** size
+        self.window = DecayingWindowSum(size, 1 - self.alpha)
+
+    def update(self, x):
+        self.window.update(x)
+
+    def get(self, x=None):
+        # ewm(adjust=False) over a window: alpha * decayed sum + (1 - alpha)^size * oldest value
+        return self.alpha * self.window.get(x) + self.first_weight * self.window.oldest(x)
+
+
+class WindowedRsi():
+    # Same value as calculate_rsi(window, period) on the last `size` prices
+
+    def __init__(self, size, period=14):
+        decay = 1 - 1 / period
+        self.enabled = size >= period
+        self.norm = sum(decay ** i for i in range(size))
+        self.gains = DecayingWindowSum(size - 1, decay)
+        self.losses = DecayingWindowSum(size - 1, decay)
+        self.last_price = None
+
+    def update(self, price):
+
+        if self.last_price is not None:
+            delta = price - self.last_price
+            self.gains.update(max(delta, 0) if not math.isnan(delta) else NAN)
+            self.losses.update(max(-delta, 0) if not math.isnan(delta) else NAN)
+        self.last_price = price
+
+    def get(self, price=None):
+
+        if not self.enabled:
+            return NAN
+
+        if price is None:
+            avg_gain, avg_loss = self.gains.get(), self.losses.get()
+        elif self.last_price is None:
+            return NAN
+        else:
+            delta = price - self.last_price
+            avg_gain = self.gains.get(max(delta, 0) if not math.isnan(delta) else NAN)
+            avg_loss = self.losses.get(max(-delta, 0) if not math.isnan(delta) else NAN)
+
+        if math.isnan(avg_gain) or math.isnan(avg_loss):
+            return NAN
+        if avg_loss == 0:
+            return NAN if avg_gain == 0 else 100.0
+
+        rs = (avg_gain / self.norm) / (avg_loss / self.norm)
+        return round(100 - (100 / (1 + rs)), 4)
+
+
+class RollingSlope():
+    # Least squares slope of the last `size` values against x = 0..size-1
+
+    def __init__(self, size, resync=1000):
+        self.size = size
+        self.resync = resync
+        self.values = deque()
+        self.nan_count: int = 0
+        self.sum_y: float = 0
+        self.sum_xy: float = 0
+        self.updates: int = 0
+        self.x_mean = (size - 1) / 2
+        self.sxx = size * (size ** 2 - 1) / 12
+
+    def __next(self, x):
+
+        y = 0 if math.isnan(x) else x
+        if len(self.values) < self.size:
+            return self.sum_y + y, self.sum_xy + len(self.values) * y
+        oldest = self.values[0]
+        oldest = 0 if math.isnan(oldest) else oldest
+        # every value moves one step to the left and the new one lands at x = size - 1
+        return self.sum_y - oldest + y, self.sum_xy - self.sum_y + oldest + (self.size - 1) * y
+
+    def update(self, x):
+
+        self.sum_y, self.sum_xy = self.__next(x)
+        self.values.append(x)
+        if math.isnan(x):
+            self.nan_count = self.nan_count + 1
+        if len(self.values) > self.size:
+            old = self.values.popleft()
+            if math.isnan(old):
+                self.nan_count = self.nan_count - 1
+
+        self.updates = self.updates + 1
+        if self.updates % self.resync == 0:
+            ys = [0 if math.isnan(v) else v for v in self.values]
+            self.sum_y = sum(ys)
+            self.sum_xy = sum(i * v for i, v in enumerate(ys))
+
+    def get(self, x=None):
+
+        if x is None:
+            sum_y, sum_xy = self.sum_y, self.sum_xy
+            length, nan_count = len(self.values), self.nan_count
+        else:
+            sum_y, sum_xy = self.__next(x)
+            length = min(len(self.values) + 1, self.size)
+            nan_count = self.nan_count + (1 if math.isnan(x) else 0)
+            if len(self.values) == self.size and math.isnan(self.values[0]):
+                nan_count = nan_count - 1
+
+        if length < self.size or nan_count > 0:
+            return NAN
+
+        return (sum_xy - self.x_mean * sum_y) / self.sxx
+
+
+class StreamingIndicators():
+
+    def __init__(self, period_long=200, period_short=30, std_dev=2, history=10):
+
+        self.period_long = period_long
+        self.period_short = period_short
+        self.std_dev = std_dev
+
+        self.close_long = RollingWindow(period_long)
+        self.close_short = RollingWindow(period_short)
+        self.std_dev_short = RollingWindow(period_short)
+        self.price_max = RollingExtreme(period_short, find_max=True)
+        self.price_min = RollingExtreme(period_short, find_max=False)
+        self.ema_short = WindowedEma(period_short)
+        self.ema_short_slope = RollingSlope(period_short)
+        self.rsi_short = WindowedRsi(period_short, period_short)
+        self.rsi_short_max = RollingExtreme(period_short, find_max=True)
+        self.rsi_short_min = RollingExtreme(period_short, find_max=False)
+        self.rsi_short_ema = WindowedEma(period_short)
+        self.rsi_short_prev = NAN
+
+        self.count: int = 0
+        self.history = deque(maxlen=history)
+        self.last_row = None
+
+    @property
+    def ready(self) -> bool:
+        # std_dev_mean is the last indicator to fill up
+        return self.count >= self.period_long + self.period_short - 1
+
+    def update(self, time, close, bid, ask, status="NA") -> dict:
+
+        row = self.__calc(time, close, bid, ask, status, commit=True)
+        self.count = self.count + 1
+        self.history.append(row)
+        self.last_row = row
+
+        return row
+
+    def preview(self, time, close, bid, ask, status="NA") -> dict:
+
+        row = self.__calc(time, close, bid, ask, status, commit=False)
+        self.last_row = row
+
+        return row
+
+    def __calc(self, time, close, bid, ask, status, commit) -> dict:
+
+        # mirror calc_indicators: close.fillna(0)
+        close = 0 if close is None or math.isnan(close) else close
+        x = None if commit else close
+
+        if commit:
+            self.close_long.update(close)
+            self.close_short.update(close)
+            self.price_max.update(close)
+            self.price_min.update(close)
+            self.ema_short.update(close)
+            self.rsi_short.update(close)
+
+        std_dev = self.close_long.get_std(x)
+        sma_long = self.close_long.get_mean(x)
+        ema_short = self.ema_short.get(x)
+        rsi_short = self.rsi_short.get(x)
+
+        if commit:
+            self.std_dev_short.update(std_dev)
+            self.ema_short_slope.update(ema_short)
+            self.rsi_short_max.update(rsi_short)
+            self.rsi_short_min.update(rsi_short)
+            self.rsi_short_ema.update(rsi_short)
+            y, ema, rsi = None, None, None
+        else:
+            y, ema, rsi = std_dev, ema_short, rsi_short
+
+        rsi_short_pct_change = NAN
+        if not (math.isnan(rsi_short) or math.isnan(self.rsi_short_prev)):
+            if self.rsi_short_prev != 0:
+                rsi_short_pct_change = rsi_short / self.rsi_short_prev - 1
+            elif rsi_short != 0:
+                rsi_short_pct_change = math.inf
+
+        row = dict(
+            time=time,
+            close=close,
+            bid=bid,
+            ask=ask,
+            status=status,
+            std_dev=std_dev,
+            std_dev_mean=self.std_dev_short.get_mean(y),
+            sma_short=self.close_short.get_mean(x),
+            sma_long=sma_long,
+            ema_short=ema_short,
+            ema_short_slope=self.ema_short_slope.get(ema),
+            bb_lower=sma_long - std_dev * self.std_dev,
+            bb_upper=sma_long + std_dev * self.std_dev,
+            price_max=self.price_max.get(x),
+            price_min=self.price_min.get(x),
+            rsi_short=rsi_short,
+            rsi_short_max=self.rsi_short_max.get(rsi),
+            rsi_short_min=self.rsi_short_min.get(rsi),
+            rsi_short_pct_change=rsi_short_pct_change,
+            rsi_short_ema=self.rsi_short_ema.get(rsi)
+        )
+
+        if commit:
+            self.rsi_short_prev = rsi_short
+
+        return row
+
+    def recent_rows(self, n) -> list:
+
+        # rows are never changed once built, a list of them stays valid while updates go on
+        rows = list(self.history)
+        if self.last_row is not None and (len(rows) == 0 or rows[-1] is not self.last_row):
+            rows.append(self.last_row)
+
+        return rows[-n:]
+
+    def to_frame(self) -> pd.DataFrame:
+        return self.rows_to_frame(self.recent_rows(self.history.maxlen + 1))
+
+    @staticmethod
+    def rows_to_frame(rows) -> pd.DataFrame:
+        return pd.DataFrame(rows).set_index("time")
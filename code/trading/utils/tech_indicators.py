@@ -13,6 +13,30 @@ def calculate_slope(S: pd.Series):
     # slope, _, _, _, _ = linregress(X, Y)
     # return slope
 
+# Vectorized equivalent of S.rolling(window).apply(lambda x: calculate_slope(x))
+def rolling_window_slope(values, window):
+
+    values = np.asarray(values, dtype=np.float64)
+
+    # the least squares slope does not change when y is shifted, so center it
+    # to keep the running sums small and accurate over long series
+    finite = values[np.isfinite(values)]
+    y = pd.Series(values - (finite.mean() if finite.size else 0))
+    index = np.arange(values.size)
+
+    # rolling sums are NaN whenever the window holds a NaN, same as rolling().apply
+    sum_y = y.rolling(window).sum().values
+    sum_jy = (y * index).rolling(window).sum().values
+
+    # with x = 0..window-1 inside each window: sum(x*y) = sum(j*y) - start * sum(y)
+    start = index - window + 1
+    sum_xy = sum_jy - start * sum_y
+
+    x_mean = (window - 1) / 2
+    sxx = window * (window ** 2 - 1) / 12
+
+    return (sum_xy - x_mean * sum_y) / sxx
+
 def count_sma_crossover(S: pd.Series):
 
     count = 0
@@ -48,6 +72,35 @@ def calculate_rsi(prices: pd.Series, period=14):
     
     return round(rsi, 4)
 
+# Vectorized equivalent of S.rolling(window).apply(lambda x: calculate_rsi(x, period))
+def rolling_window_rsi(values, window, period=14):
+
+    values = np.asarray(values, dtype=np.float64)
+    rsi = np.full(values.size, np.nan)
+
+    if window < period or values.size < window:
+        return rsi
+
+    # calculate_rsi zeroes the first delta of every window, so each window
+    # averages its window - 1 inner deltas with the fixed ewm(com=period - 1) weights
+    decay = 1 - 1 / period
+    weights = decay ** np.arange(window - 2, -1, -1)
+    norm = (decay ** np.arange(window)).sum()
+
+    delta = np.diff(values)
+    # np.maximum propagates NaN, so windows with missing prices stay NaN like rolling().apply
+    gain = np.maximum(delta, 0)
+    loss = np.maximum(-delta, 0)
+
+    avg_gain = np.lib.stride_tricks.sliding_window_view(gain, window - 1) @ weights / norm
+    avg_loss = np.lib.stride_tricks.sliding_window_view(loss, window - 1) @ weights / norm
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rs = avg_gain / avg_loss
+        rsi[window - 1:] = np.round(100 - (100 / (1 + rs)), 4)
+
+    return rsi
+
 def calculate_rsi_new(S, period=14):
     
     prices = pd.Series(S)
@@ -63,14 +116,26 @@ def calculate_rsi_new(S, period=14):
     
     return rsi
 
-def calculate_slope(S: pd.Series):
-
-    x = np.arange(S.size)
-    fit = np.polyfit(x, S.values, deg=1)
-    slope = fit[0]
-    return slope
-
 def calculate_ema(S: pd.Series, span=15):
 
    return S.ewm(span=span, adjust=False).mean().iloc[-1]
 
+# Vectorized equivalent of S.rolling(window).apply(lambda x: calculate_ema(S=x, span=span))
+def rolling_window_ema(values, window, span=15):
+
+    values = np.asarray(values, dtype=np.float64)
+    ema = np.full(values.size, np.nan)
+
+    if values.size < window:
+        return ema
+
+    # ewm(adjust=False) restarted on every window is a fixed-weight sum:
+    # the oldest value keeps (1 - alpha)^(window - 1), the rest alpha * (1 - alpha)^age
+    alpha = 2 / (span + 1)
+    weights = alpha * (1 - alpha) ** np.arange(window - 1, -1, -1)
+    weights[0] = (1 - alpha) ** (window - 1)
+
+    ema[window - 1:] = np.lib.stride_tricks.sliding_window_view(values, window) @ weights
+
+    return ema
+
@@ -0,0 +1,140 @@
+import logging
+import os
+import threading
+from collections import deque
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+from trading.utils.tick_store import STATUSES
+
+logger = logging.getLogger()
+
+"""
+Append-only journal of every streamed tick, one file per instrument per UTC day: <directory>/<instrument>/<YYYY-MM-DD>.ticks
+
+A file is a plain sequence of packed 25 byte records (int64 ns time, float64 bid, float64 ask, uint8 status code
+from tick_store.STATUSES, 255 for anything else), so it can be appended to at any point, survives a crash up to the
+last flush and reads back with one np.fromfile.
+
+record() only appends a tuple to a deque, the writer thread drains it every flush_interval seconds and writes one
+batch per file, so bursts cost the stream thread nothing more than the append.
+"""
+
+TICK_DTYPE = np.dtype([("time", "<i8"), ("bid", "<f8"), ("ask", "<f8"), ("status", "u1")])
+UNKNOWN_STATUS = 255
+NS_PER_DAY = 86_400 * 1_000_000_000
+
+
+class TickJournal():
+
+    def __init__(self, directory, flush_interval = 1.0):
+
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self.pending = deque()
+        self.status_codes = {status: code for code, status in enumerate(STATUSES)}
+        self.files = {}
+        self.days = {}
+        self.written: int = 0
+        self.stop_event = threading.Event()
+        self.thread: threading.Thread = None
+
+    def start(self):
+
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self.run, name="tick_journal", daemon=True)
+        self.thread.start()
+        return self
+
+    def close(self):
+
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
+        self.flush()
+        for f in self.files.values():
+            f.close()
+        self.files = {}
+
+    def record(self, instrument, time_ns, bid, ask, status):
+
+        # called on the stream thread, deque.append is thread safe and never blocks
+        self.pending.append((instrument, time_ns, bid, ask, status))
+
+    def run(self):
+
+        while not self.stop_event.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error("Error writing the tick journal")
+                logger.exception(e)
+
+    def flush(self):
+
+        count = len(self.pending)
+        if count == 0:
+            return
+
+        batches = {}
+        for _ in range(count):
+            instrument, time_ns, bid, ask, status = self.pending.popleft()
+            key = (instrument, self.day(time_ns))
+            batch = batches.get(key)
+            if batch is None:
+                batch = []
+                batches[key] = batch
+            batch.append((time_ns, bid, ask, self.status_codes.get(status, UNKNOWN_STATUS)))
+
+        for (instrument, day), batch in batches.items():
+            f = self.file(instrument, day)
+            f.write(np.array(batch, dtype=TICK_DTYPE).tobytes())
+            f.flush()
+
+        self.written = self.written + count
+
+    def day(self, time_ns) -> str:
+
+        day_number = time_ns // NS_PER_DAY
+        day = self.days.get(day_number)
+        if day is None:
+            day = datetime.fromtimestamp(day_number * 86_400, tz=timezone.utc).strftime("%Y-%m-%d")
+            self.days[day_number] = day
+        return day
+
+    def file(self, instrument, day):
+
+        f = self.files.get((instrument, day))
+        if f is None:
+            # a new day rotates the instrument's file
+            for key in [key for key in self.files if key[0] == instrument]:
+                self.files.pop(key).close()
+
+            os.makedirs(os.path.join(self.directory, instrument), exist_ok=True)
+            f = open(journal_file(self.directory, instrument, day), "ab")
+            self.files[(instrument, day)] = f
+        return f
+
+
+def journal_file(directory, instrument, day) -> str:
+    return os.path.join(directory, instrument, f"{day}.ticks")
+
+
+def read_journal(file_name) -> pd.DataFrame:
+
+    """
+        The ticks of a journal file as a DataFrame: time index, close (mid), bid, ask and status
+    """
+
+    ticks = np.fromfile(file_name, dtype=TICK_DTYPE)
+    codes = ticks["status"].astype(np.int16)
+    codes[codes >= len(STATUSES)] = len(STATUSES)
+
+    return pd.DataFrame({
+        "close": (ticks["bid"] + ticks["ask"]) / 2,
+        "bid": ticks["bid"],
+        "ask": ticks["ask"],
+        "status": pd.Categorical.from_codes(codes, categories=list(STATUSES) + ["unknown"])
+    }, index=pd.DatetimeIndex(ticks["time"].view("datetime64[ns]"), name="time"))
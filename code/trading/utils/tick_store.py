@@ -0,0 +1,232 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from trading.utils import utils
+
+"""
+Preallocated columnar store for streamed ticks and the 30s bars built from them.
+
+Ticks go into a fixed size ring (int64 ns time, float64 bid/ask/mid, uint8 status), so memory does not
+depend on the tick rate. Every tick also updates the current bar (OHLC of the mid price, last bid/ask/status,
+tick count as volume); a tick in a later 30s bucket closes the current bar and starts a new one.
+
+Bars are written twice into a buffer of twice the capacity, so the last N bars are always one contiguous
+slice and bars_frame() can hand out a DataFrame over views of the arrays instead of copies.
+"""
+
+STATUSES = ["NA", "tradeable", "non-tradeable", "invalid"]
+
+
+class TickStore():
+
+    def __init__(self, tick_capacity=utils.ticker_data_size * 500, bar_capacity=utils.ticker_data_size * 2, bar_size_ns=utils.bar_size_ns):
+
+        self.tick_capacity = tick_capacity
+        self.bar_capacity = bar_capacity
+        self.bar_size_ns = bar_size_ns
+
+        self.statuses = list(STATUSES)
+        self.status_codes = {status: code for code, status in enumerate(self.statuses)}
+
+        self.tick_count: int = 0
+        self.tick_time = np.zeros(tick_capacity, dtype=np.int64)
+        self.tick_bid = np.zeros(tick_capacity, dtype=np.float64)
+        self.tick_ask = np.zeros(tick_capacity, dtype=np.float64)
+        self.tick_mid = np.zeros(tick_capacity, dtype=np.float64)
+        self.tick_status = np.zeros(tick_capacity, dtype=np.uint8)
+
+        self.bar_count: int = 0
+        self.bar_time = np.zeros(2 * bar_capacity, dtype=np.int64)
+        self.bar_open = np.zeros(2 * bar_capacity, dtype=np.float64)
+        self.bar_high = np.zeros(2 * bar_capacity, dtype=np.float64)
+        self.bar_low = np.zeros(2 * bar_capacity, dtype=np.float64)
+        self.bar_close = np.zeros(2 * bar_capacity, dtype=np.float64)
+        self.bar_bid = np.zeros(2 * bar_capacity, dtype=np.float64)
+        self.bar_ask = np.zeros(2 * bar_capacity, dtype=np.float64)
+        self.bar_status = np.zeros(2 * bar_capacity, dtype=np.uint8)
+        self.bar_volume = np.zeros(2 * bar_capacity, dtype=np.int64)
+
+    def status_code(self, status) -> int:
+
+        code = self.status_codes.get(status)
+        if code is None:
+            code = len(self.statuses)
+            self.statuses.append(status)
+            self.status_codes[status] = code
+        return code
+
+    def add_tick(self, time_ns: int, bid: float, ask: float, status="tradeable"):
+
+        """
+            Returns the bar closed by this tick as [time, close, bid, ask, status], or None
+        """
+
+        mid = (ask + bid) / 2
+        code = self.status_code(status)
+
+        i = self.tick_count % self.tick_capacity
+        self.tick_time[i] = time_ns
+        self.tick_bid[i] = bid
+        self.tick_ask[i] = ask
+        self.tick_mid[i] = mid
+        self.tick_status[i] = code
+        self.tick_count = self.tick_count + 1
+
+        bar_time_ns = time_ns - time_ns % self.bar_size_ns
+        closed_bar = None
+
+        if self.bar_count == 0 or bar_time_ns > self.bar_time[self.__bar_pos(self.bar_count - 1)]:
+            if self.bar_count > 0:
+                closed_bar = self.last_bar()
+            self.__write_bar(self.bar_count, bar_time_ns, mid, mid, mid, mid, bid, ask, code, 1)
+            self.bar_count = self.bar_count + 1
+        else:
+            # same as resample("30s").last() for close/bid/ask/status, ticks arriving late stay in the current bar
+            p = self.__bar_pos(self.bar_count - 1)
+            for q in (p, p + self.bar_capacity):
+                if mid > self.bar_high[q]:
+                    self.bar_high[q] = mid
+                if mid < self.bar_low[q]:
+                    self.bar_low[q] = mid
+                self.bar_close[q] = mid
+                self.bar_bid[q] = bid
+                self.bar_ask[q] = ask
+                self.bar_status[q] = code
+                self.bar_volume[q] = self.bar_volume[q] + 1
+
+        return closed_bar
+
+    def add_candles(self, candles: pd.DataFrame, status="NA"):
+
+        """
+            Appends candles as returned by OandaApi: time index, close (mid), bid, ask and volume columns.
+            Candles older than the last bar are skipped and a candle of the last bar's time replaces it,
+            so a backfill can start at the forming bar.
+        """
+
+        close = candles["close"].to_numpy(dtype=np.float64)
+        times = candles.index.values.astype("datetime64[ns]").astype(np.int64)
+        volume = candles["volume"].to_numpy(dtype=np.int64) if "volume" in candles else np.zeros(close.size, dtype=np.int64)
+        code = self.status_code(status)
+        last_time = self.bar_time[self.__bar_pos(self.bar_count - 1)] if self.bar_count > 0 else None
+
+        for k in range(close.size):
+            if last_time is not None and times[k] < last_time:
+                continue
+            n = self.bar_count - 1 if times[k] == last_time else self.bar_count
+            self.__write_bar(n, times[k], close[k], close[k], close[k], close[k],
+                             candles["bid"].iat[k], candles["ask"].iat[k], code, volume[k])
+            if n == self.bar_count:
+                self.bar_count = self.bar_count + 1
+            last_time = times[k]
+
+    def save_bars(self, file_name):
+
+        """
+            Writes the closed bars (not the forming one) to an .npz file, see read_bars / add_bars
+        """
+
+        s = self.__bar_slice(self.bar_count)
+        s = slice(s.start, s.stop - 1)
+        # write to a temporary file first, a crash while saving must not leave a truncated snapshot behind
+        with open(f"{file_name}.tmp", "wb") as f:
+            np.savez(f, time=self.bar_time[s], open=self.bar_open[s], high=self.bar_high[s], low=self.bar_low[s],
+                     close=self.bar_close[s], bid=self.bar_bid[s], ask=self.bar_ask[s], status=self.bar_status[s],
+                     volume=self.bar_volume[s], statuses=np.array(self.statuses))
+        os.replace(f"{file_name}.tmp", file_name)
+
+    @staticmethod
+    def read_bars(file_name) -> dict:
+
+        with np.load(file_name) as data:
+            return {key: data[key] for key in data.files}
+
+    def add_bars(self, bars: dict):
+
+        # bars as returned by read_bars, status codes are mapped to this store's codes
+        codes = [self.status_code(str(status)) for status in bars["statuses"]]
+
+        for k in range(bars["time"].size):
+            self.__write_bar(self.bar_count, bars["time"][k], bars["open"][k], bars["high"][k], bars["low"][k],
+                             bars["close"][k], bars["bid"][k], bars["ask"][k], codes[bars["status"][k]], bars["volume"][k])
+            self.bar_count = self.bar_count + 1
+
+    def __bar_pos(self, n) -> int:
+        return n % self.bar_capacity
+
+    def __write_bar(self, n, time_ns, open, high, low, close, bid, ask, code, volume):
+
+        p = self.__bar_pos(n)
+        for q in (p, p + self.bar_capacity):
+            self.bar_time[q] = time_ns
+            self.bar_open[q] = open
+            self.bar_high[q] = high
+            self.bar_low[q] = low
+            self.bar_close[q] = close
+            self.bar_bid[q] = bid
+            self.bar_ask[q] = ask
+            self.bar_status[q] = code
+            self.bar_volume[q] = volume
+
+    def bar(self, n) -> list:
+
+        p = self.__bar_pos(n)
+        return [pd.Timestamp(int(self.bar_time[p])), float(self.bar_close[p]), float(self.bar_bid[p]),
+                float(self.bar_ask[p]), self.statuses[self.bar_status[p]]]
+
+    def last_bar(self) -> list:
+
+        """
+            The current (still forming) bar as [time, close, bid, ask, status], or None before the first tick
+        """
+
+        if self.bar_count == 0:
+            return None
+        return self.bar(self.bar_count - 1)
+
+    def __bar_slice(self, n) -> slice:
+
+        n = min(n, self.bar_count, self.bar_capacity)
+        end = self.__bar_pos(self.bar_count - 1) + self.bar_capacity + 1
+        return slice(end - n, end)
+
+    def bars_frame(self, n=utils.ticker_data_size, copy=False) -> pd.DataFrame:
+
+        """
+            The last n bars (the forming bar included) as a DataFrame backed by views of the bar arrays, or by
+            copies with copy=True. The views keep changing while ticks arrive: read them under the owner's lock
+            and take a copy for anything that outlives it.
+        """
+
+        s = self.__bar_slice(n)
+        index = pd.DatetimeIndex(self.bar_time[s].view("datetime64[ns]"), name="time")
+        status = pd.Categorical.from_codes(self.bar_status[s].astype(np.int16), categories=self.statuses)
+
+        return pd.DataFrame({
+            "close": self.bar_close[s],
+            "bid": self.bar_bid[s],
+            "ask": self.bar_ask[s],
+            "status": status,
+            "open": self.bar_open[s],
+            "high": self.bar_high[s],
+            "low": self.bar_low[s],
+            "volume": self.bar_volume[s]
+        }, index=index, copy=copy)
+
+    def ticks_frame(self, n=None) -> pd.DataFrame:
+
+        n = min(self.tick_count, self.tick_capacity) if n is None else min(n, self.tick_count, self.tick_capacity)
+        # the tick ring is written once per tick, so reading it in order needs a copy
+        idx = (np.arange(self.tick_count - n, self.tick_count)) % self.tick_capacity
+
+        return pd.DataFrame({
+            "close": self.tick_mid[idx],
+            "bid": self.tick_bid[idx],
+            "ask": self.tick_ask[idx],
+            "status": pd.Categorical.from_codes(self.tick_status[idx].astype(np.int16), categories=self.statuses)
+        }, index=pd.DatetimeIndex(self.tick_time[idx].view("datetime64[ns]"), name="time"))
+
+    def __len__(self):
+        return min(self.bar_count, self.bar_capacity)
@@ -0,0 +1,57 @@
+import json
+from collections import namedtuple
+from datetime import datetime, timezone
+
+"""
+Decoding of the OANDA pricing stream lines into compact tick records.
+
+Every streamed line used to go through pandas timestamp parsing, which cost more than everything else done
+per tick. Here the RFC3339 time ("2024-06-18T12:58:23.054370501Z") is turned into int64 epoch nanoseconds
+with string slicing and a per day cache, and HEARTBEAT lines are dropped before they are parsed as JSON.
+"""
+
+# received_ns is the perf_counter_ns() of the line's arrival, the start of the tick to order latency
+Tick = namedtuple("Tick", ["instrument", "time_ns", "bid", "ask", "status", "received_ns"], defaults=[0])
+
+NS_PER_SECOND = 1_000_000_000
+
+day_ns_cache = {}
+
+
+def day_ns(day) -> int:
+
+    ns = day_ns_cache.get(day)
+    if ns is None:
+        if len(day_ns_cache) > 64:
+            day_ns_cache.clear()
+        ns = int(datetime.strptime(day, "%Y-%m-%d").replace(tzinfo=timezone.utc).timestamp()) * NS_PER_SECOND
+        day_ns_cache[day] = ns
+    return ns
+
+
+def parse_time_ns(text) -> int:
+
+    # UTC RFC3339 with up to nanosecond digits, the format OANDA uses for every time field
+    ns = day_ns(text[:10]) + (int(text[11:13]) * 3600 + int(text[14:16]) * 60 + int(text[17:19])) * NS_PER_SECOND
+
+    if len(text) > 20 and text[19] == ".":
+        digits = text[20:-1] if text[-1] == "Z" else text[20:]
+        ns = ns + int(digits[:9].ljust(9, "0"))
+
+    return ns
+
+
+def decode_price(line: bytes, received_ns = 0) -> Tick:
+
+    """
+        Returns the Tick of a PRICE line, None for heartbeats and anything else
+    """
+
+    if not line or b'"HEARTBEAT"' in line:
+        return None
+
+    data = json.loads(line)
+    if data.get("type") != "PRICE":
+        return None
+
+    return Tick(data["instrument"], parse_time_ns(data["time"]), float(data["closeoutBid"]), float(data["closeoutAsk"]), data.get("status"), received_ns)
@@ -1,2 +1,3 @@
 date_format = "%Y-%m-%d %H:%M:%S"
-ticker_data_size=400
\ No newline at end of file
+ticker_data_size=400
+bar_size_ns=30 * 1_000_000_000
\ No newline at end of file
@@ -0,0 +1,91 @@
+import argparse
+import configparser
+import logging
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+file = Path(__file__).resolve()
+parent, root = file.parent, file.parents[1]
+sys.path.append(str(root))
+
+from backtesting.backtest_engine import BacktestEngine
+from backtesting.parameter_sweep import strategy_class
+from backtesting.trading_bot_backtest import TradingBacktester
+from trading.strategies.base.strategy_exec import TradingStrategyExec
+
+"""
+Checks BacktestEngine against the iterrows loop it replaces, TradingBacktester.trade_rows: every pairs.ini
+section given is backtested both ways on the same random walk of 30s candles and the trades must be the same.
+A bar entry_candidates rejects but check_if_need_open_trade would open a trade on shows up as a missing trade.
+Exits with an AssertionError on the first difference.
+"""
+
+
+def synthetic_candles(count, start = "2024-06-17 00:00", seed = 1, price = 1.07, step = 0.0001) -> pd.DataFrame:
+
+    # fat tailed steps, the rsi jumps the strategies enter on are rare in a normal random walk
+    rng = np.random.default_rng(seed)
+    close = np.round(price + np.cumsum(rng.standard_t(2, count) * step), 5)
+    spread = rng.choice([0.00010, 0.00012, 0.00014], count)
+
+    return pd.DataFrame({
+        "volume": rng.integers(1, 500, count),
+        "close": close,
+        "bid": np.round(close - spread / 2, 5),
+        "ask": np.round(close + spread / 2, 5)
+    }, index=pd.date_range(start, periods=count, freq="30s", name="time"))
+
+
+def new_strategy(pair_file, trading_strategy, data: pd.DataFrame) -> TradingStrategyExec:
+
+    config = configparser.ConfigParser()
+    config.read(pair_file)
+
+    strategy: TradingStrategyExec = strategy_class(config, trading_strategy)(trading_strategy=trading_strategy, pair_file=pair_file, unit_test=False)
+    strategy.backtest = True
+    strategy.data = data.copy()
+    strategy.calc_indicators()
+    return strategy
+
+
+def check_trades(pair_file, trading_strategy, data: pd.DataFrame):
+
+    engine = new_strategy(pair_file, trading_strategy, data)
+    BacktestEngine(engine).run()
+
+    # trade_rows only reads the backtester's strategy
+    backtester = TradingBacktester.__new__(TradingBacktester)
+    backtester.strategy = new_strategy(pair_file, trading_strategy, data)
+    backtester.trade_rows()
+
+    expected = backtester.strategy.trading_session.trades
+    actual = engine.trading_session.trades
+
+    assert len(expected) > 0, f"{trading_strategy}: the iterrows loop made no trades, nothing is compared"
+    assert actual == expected, f"{trading_strategy}: {len(actual)} trades from BacktestEngine, {len(expected)} from iterrows\n" \
+        + "\n".join(str(trade) for trade in actual if trade not in expected) + "\n---\n" \
+        + "\n".join(str(trade) for trade in expected if trade not in actual)
+    print(f"{trading_strategy}: {len(actual)} trades match, PL {engine.trading_session.pl:.2f}")
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('trading_strategy', type=str, nargs='*', default=["EUR_USD#1", "EUR_USD#2"], help='pairs.ini sections')
+    parser.add_argument('--pair_file', type = str, default="../trading/pairs.ini", help='pairs.ini')
+    parser.add_argument('--bars', type = int, default=20000, help='Number of 30s candles')
+    parser.add_argument('--seed', type = int, default=1, help='Random walk seed')
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+
+    data = synthetic_candles(args.bars, seed=args.seed)
+
+    for trading_strategy in args.trading_strategy:
+        check_trades(args.pair_file, trading_strategy, data)
+
+    # python backtest_check.py
+    # python backtest_check.py EUR_USD#2 --bars 50000 --seed 3
@@ -0,0 +1,86 @@
+import argparse
+import copy
+import json
+import sys
+import time
+from pathlib import Path
+
+import pandas as pd
+from dateutil import parser as date_parser
+
+file = Path(__file__).resolve()
+parent, root = file.parent, file.parents[1]
+sys.path.append(str(root))
+sys.path.append(str(root / "trading"))
+
+from trading.api.oanda_api import convert_candles
+
+"""
+Candles/sec of the OANDA candles to DataFrame conversion, before (a dict per candle, dateutil per time stamp,
+DataFrame.from_dict) and after (trading.api.oanda_api.convert_candles), on trading/api/samples/candles.json
+scaled up to --candles S30 candles.
+"""
+
+sample_file = root / "trading" / "api" / "samples" / "candles.json"
+
+
+def make_candles(count) -> list:
+
+    sample = json.loads(sample_file.read_text())["candles"]
+    start = pd.Timestamp("2024-02-28T15:30:00").value
+    candles = []
+
+    for i in range(count):
+        candle = copy.deepcopy(sample[i % len(sample)])
+        t = pd.Timestamp(start + i * 30_000_000_000)
+        candle["time"] = t.strftime("%Y-%m-%dT%H:%M:%S.000000000Z")
+        candles.append(candle)
+
+    return candles
+
+
+def convert_before(data) -> pd.DataFrame:
+
+    final_data = []
+    for candle in data:
+        new_dict = {}
+        new_dict['time'] = date_parser.parse(candle['time'])
+        new_dict['volume'] = candle['volume']
+        for p in ['mid', 'bid', 'ask']:
+            if p in candle:
+                new_dict[f"{p}"] = float(candle[p]["c"])
+        final_data.append(new_dict)
+
+    df = pd.DataFrame.from_dict(final_data)
+    df.rename(columns={"mid": "close"}, inplace=True)
+    df = df.set_index('time')
+    df.index = df.index.tz_localize(None)
+    return df
+
+
+def measure(name, convert, candles) -> pd.DataFrame:
+
+    start = time.perf_counter()
+    df = convert(candles)
+    elapsed = time.perf_counter() - start
+    print(f"{name:<24} {elapsed:>8.3f}s {len(candles) / elapsed:>12,.0f} candles/sec")
+    return df
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--candles', type = int, default=90_000, help='Number of candles, a month of S30 is about 90000')
+    args = parser.parse_args()
+
+    candles = make_candles(args.candles)
+
+    before = measure("before: convert", convert_before, candles)
+    after = measure("after: convert", convert_candles, candles)
+    measure("after: convert ohlc", lambda data: convert_candles(data, ohlc=True), candles)
+
+    # dateutil times come out in microseconds under pandas 3, the values are the same
+    before.index = before.index.as_unit("ns")
+    pd.testing.assert_frame_equal(before, after)
+
+    # python candle_convert_benchmark.py --candles 90000
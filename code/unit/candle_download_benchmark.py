@@ -0,0 +1,99 @@
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import timedelta
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+file = Path(__file__).resolve()
+parent, root = file.parent, file.parents[1]
+sys.path.append(str(root))
+sys.path.append(str(root / "trading"))
+
+from trading.api.oanda_api import OandaApi
+from unit.oanda_stub import OandaStub
+
+"""
+Seconds to download --days of S30 candles from the local OANDA stand-in, before (one request per day, one after
+the other, the frame concatenated in the loop) and after (OandaApi.get_price_candles_between: 5000 candle chunks
+fetched by candle_workers threads, converted once). --latency is added to every candles request like the round
+trip to OANDA, --failures makes that many requests fail with a 503 to exercise the retries. The after download
+is then repeated with the candle cache, once to fill it and once served from it.
+"""
+
+
+def make_ticks(days, end, every = 10, seed = 1) -> pd.DataFrame:
+
+    rng = np.random.default_rng(seed)
+    times = pd.date_range(end - timedelta(days=days), end, freq=f"{every}s", inclusive="left")
+    mid = np.round(1.07 + np.cumsum(rng.normal(0, 0.00005, len(times))), 5)
+
+    return pd.DataFrame({"bid": mid - 0.00006, "ask": mid + 0.00006, "status": "tradeable"}, index=pd.DatetimeIndex(times, name="time"))
+
+
+def download_before(api: OandaApi, instrument, date_f, days) -> pd.DataFrame:
+
+    df = pd.DataFrame()
+    for i in range(days):
+        start_d = date_f + timedelta(days=i)
+        df = pd.concat([df, api.get_price_candles_between(instrument, start_d, start_d + timedelta(days=1))])
+
+    return df
+
+
+def measure(name, download) -> pd.DataFrame:
+
+    start = time.perf_counter()
+    df = download()
+    elapsed = time.perf_counter() - start
+    print(f"{name:<40} {elapsed:>8.2f}s {len(df):>10,} candles")
+    return df
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--days', type = int, default=30, help='Days of candles')
+    parser.add_argument('--latency', type = float, default=0.05, help='Seconds added to every candles request')
+    parser.add_argument('--workers', type = int, default=8, help='candle_workers of the after run')
+    parser.add_argument('--rate', type = float, default=100, help='request_rate, requests a second, 0 for no limit')
+    parser.add_argument('--failures', type = int, default=0, help='Candles requests of the after run that fail first')
+    args = parser.parse_args()
+
+    instrument = "EUR_USD"
+    end = pd.Timestamp.now(tz="UTC").floor("D")
+    date_f = (end - timedelta(days=args.days)).to_pydatetime()
+
+    stub = OandaStub().start()
+    stub.load_ticks(instrument, make_ticks(args.days, end.tz_localize(None)))
+    stub.candle_latency = args.latency
+
+    directory = tempfile.mkdtemp(prefix="candles_")
+    config_file = os.path.join(directory, "oanda_stub.cfg")
+    stub.write_config(config_file, candle_workers=args.workers, request_rate=args.rate)
+    cached_file = os.path.join(directory, "oanda_stub_cached.cfg")
+    stub.write_config(cached_file, candle_workers=args.workers, request_rate=args.rate, candle_cache=os.path.join(directory, "cache"))
+
+    try:
+        before = measure(f"before: {args.days} days, one at a time", lambda: download_before(OandaApi(config_file), instrument, date_f, args.days))
+
+        stub.fail_candle_requests = args.failures
+        after = measure(f"after: {args.workers} workers, {args.rate:g} requests/s", lambda: OandaApi(config_file).get_price_candles_between(instrument, date_f, end.to_pydatetime()))
+
+        api = OandaApi(cached_file)
+        cold = measure("after: cache empty", lambda: api.get_price_candles_between(instrument, date_f, end.to_pydatetime()))
+        sent = api.scheduler.counters()["sent_candles"]
+        warm = measure("after: cache filled", lambda: api.get_price_candles_between(instrument, date_f, end.to_pydatetime()))
+        print(f"{api.scheduler.counters()['sent_candles'] - sent} candles requests with the cache filled")
+
+    finally:
+        stub.stop()
+
+    assert before.equals(after), "downloads disagree"
+    assert after.equals(cold) and after.equals(warm), "cached downloads disagree"
+
+    # python candle_download_benchmark.py --days 30 --latency 0.05 --workers 8
@@ -0,0 +1,106 @@
+import argparse
+import json
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+file = Path(__file__).resolve()
+parent, root = file.parent, file.parents[1]
+sys.path.append(str(root))
+
+from trading.utils.tech_indicators import calculate_rsi, rolling_window_ema, rolling_window_rsi, rolling_window_slope
+
+"""
+Checks the vectorized indicators against what they replace, rolling_window_rsi against rolling().apply of
+calculate_rsi, rolling_window_ema against pd.Series.ewm(adjust=False) and rolling_window_slope against np.polyfit
+over the same windows, on the mid closes of
+trading/api/samples/candles.json with a flat run of prices spliced in. Exits with an AssertionError on the
+first difference.
+"""
+
+sample_file = root / "trading" / "api" / "samples" / "candles.json"
+
+
+def sample_closes(flat = 60) -> pd.Series:
+
+    closes = [float(candle["mid"]["c"]) for candle in json.loads(sample_file.read_text())["candles"]]
+
+    # a run where the price does not move, no gains and no losses in its windows
+    middle = len(closes) // 2
+    closes[middle:middle + flat] = [closes[middle]] * flat
+
+    return pd.Series(closes)
+
+
+def check_rsi(closes: pd.Series, window, period):
+
+    expected = closes.rolling(window).apply(lambda x: calculate_rsi(x, period)).values
+    actual = rolling_window_rsi(closes.values, window, period)
+
+    assert np.isnan(actual[:window - 1]).all(), f"rsi window={window} period={period}: the first {window - 1} rows are not NaN"
+    np.testing.assert_allclose(actual, expected, rtol=0, atol=1e-4, equal_nan=True,
+                               err_msg=f"rsi window={window} period={period}")
+    print(f"rsi window={window} period={period}: {len(closes)} rows match")
+
+
+def check_ema(values: np.ndarray, window, name, span = 15):
+
+    # the ewm of every full window restarted from its first value, NaN while the window holds a NaN
+    expected = np.full(values.size, np.nan)
+    for end in range(window, values.size + 1):
+        y = values[end - window:end]
+        if np.isfinite(y).all():
+            expected[end - 1] = pd.Series(y).ewm(span=span, adjust=False).mean().iloc[-1]
+
+    actual = rolling_window_ema(values, window, span)
+
+    assert np.isnan(actual[:window - 1]).all(), f"ema {name} window={window}: the first {window - 1} rows are not NaN"
+    np.testing.assert_allclose(actual, expected, rtol=1e-12, atol=1e-12, equal_nan=True,
+                               err_msg=f"ema {name} window={window} span={span}")
+    print(f"ema {name} window={window} span={span}: {values.size} rows match ewm")
+
+
+def check_slope(values: np.ndarray, window, name):
+
+    # np.polyfit over every full window, NaN while the window holds a NaN like rolling().apply
+    x = np.arange(window)
+    expected = np.full(values.size, np.nan)
+    for end in range(window, values.size + 1):
+        y = values[end - window:end]
+        if np.isfinite(y).all():
+            expected[end - 1] = np.polyfit(x, y, 1)[0]
+
+    actual = rolling_window_slope(values, window)
+
+    assert np.isnan(actual[:window - 1]).all(), f"slope {name} window={window}: the first {window - 1} rows are not NaN"
+    # the slopes of prices are around 1e-5, compare them to the scale of the series
+    np.testing.assert_allclose(actual, expected, rtol=0, atol=1e-9 * np.nanmax(np.abs(values)), equal_nan=True,
+                               err_msg=f"slope {name} window={window}")
+    print(f"slope {name} window={window}: {values.size} rows match np.polyfit")
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--flat', type = int, default=60, help='Length of the flat price run')
+    args = parser.parse_args()
+
+    closes = sample_closes(args.flat)
+
+    # the settings calc_indicators uses, and a window longer than the flat run
+    for window, period in [(30, 30), (30, 14), (100, 14)]:
+        check_rsi(closes, window, period)
+
+    # ema_short and rsi_short_ema, the rsi starts with window - 1 NaN
+    check_ema(closes.values, 30, "close")
+    check_ema(rolling_window_rsi(closes.values, 30, 30), 30, "rsi_short")
+    check_ema(closes.values, 100, "close", span=30)
+
+    # ema_short_slope is the slope of ema_short, which starts with window - 1 NaN
+    check_slope(closes.values, 30, "close")
+    check_slope(rolling_window_ema(closes.values, 30), 30, "ema_short")
+    check_slope(closes.values, 200, "close")
+
+    # python indicator_check.py
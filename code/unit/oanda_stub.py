@@ -0,0 +1,499 @@
+import argparse
+import json
+import re
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, unquote
+
+import numpy as np
+import pandas as pd
+
+file = Path(__file__).resolve()
+parent, root = file.parent, file.parents[1]
+sys.path.append(str(root))
+
+"""
+Local stand-in for the OANDA v3 REST and streaming endpoints the bot uses, so it can run without network access.
+
+Point the bot at it with hostname/stream_hostname entries in the oanda config (see write_config).
+Supported:
+    GET  /v3/accounts/{id}/pricing/stream           replays the ticks loaded with load_ticks, see start_replay
+    GET  /v3/accounts/{id}/candles/latest           S30 candles built from the ticks streamed so far
+    GET  /v3/instruments/{instrument}/candles       from and count, or from and to with OANDA's 5000 candles cap
+    GET  /v3/accounts/{id}/transactions/stream
+    GET  /v3/accounts/{id}/positions/{instrument}
+    POST /v3/accounts/{id}/orders                   market orders are filled at once at the last streamed ask / bid,
+                                                    order.price or 1.0
+    GET  /v3/accounts/{id}/orders/{id or @client_id}
+"""
+
+date_format = "%Y-%m-%dT%H:%M:%S.%f000Z"
+bar_ns = 30 * 1_000_000_000
+max_candles = 5000
+
+
+def format_time_ns(time_ns) -> str:
+    seconds, ns = divmod(int(time_ns), 1_000_000_000)
+    return datetime.fromtimestamp(seconds, tz=timezone.utc).strftime("%Y-%m-%dT%H:%M:%S") + f".{ns:09d}Z"
+
+
+def parse_time(text) -> int:
+    time = pd.Timestamp(text)
+    return (time if time.tz is None else time.tz_convert(None)).value
+
+
+class OandaStub():
+
+    def __init__(self, host="127.0.0.1", port=0, account_id="001-001-0000000-001", heartbeat=5):
+
+        self.account_id = account_id
+        self.heartbeat = heartbeat
+        self.positions = {}
+        self.transactions = []
+        self.orders = {}
+        # the next n orders are placed but the connection is closed before the response, like a timeout
+        self.drop_order_responses = 0
+        self.condition = threading.Condition()
+        self.running = False
+
+        # replay: ticks per instrument, the merged tick sequence of the pricing stream and the position in it.
+        # The stub clock is the time of the last streamed tick, candles and fills only see the ticks up to it.
+        self.ticks = {}
+        self.replay = []
+        self.replay_position: int = 0
+        self.clock_ns: int = 0
+        self.prices = {}
+        # 1 plays the ticks in real time, 10 ten times faster, 0 as fast as the client reads them
+        self.speed = 0
+
+        # seconds every candles request takes, like the round trip to OANDA, and the next n candles requests fail with a 503
+        self.candle_latency = 0
+        self.fail_candle_requests = 0
+
+        stub = self
+
+        class Handler(OandaStubHandler):
+            pass
+        Handler.stub = stub
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/v3"
+
+    def start(self):
+
+        self.running = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def write_config(self, config_file, **settings):
+
+        with open(config_file, "w") as f:
+            f.write("[oanda]\n")
+            f.write("access_token=stub\n")
+            f.write(f"account_id={self.account_id}\n")
+            f.write("account_type=practice\n")
+            f.write(f"hostname={self.url}\n")
+            f.write(f"stream_hostname={self.url}\n")
+            # the stub has no request limit, a replay runs faster than real time. Its candles are not cached
+            for name, value in dict(dict(request_rate=0, candle_cache="None"), **settings).items():
+                f.write(f"{name}={value}\n")
+
+    def now(self):
+        if self.clock_ns:
+            return format_time_ns(self.clock_ns)
+        return datetime.now(tz=timezone.utc).strftime(date_format)
+
+    def load_ticks(self, instrument, ticks: pd.DataFrame):
+
+        """
+            ticks: time index, bid, ask and status columns, like trading.utils.tick_journal.read_journal returns
+        """
+
+        ticks = ticks.sort_index(kind="stable")
+        self.ticks[instrument] = (
+            ticks.index.values.astype("datetime64[ns]").astype(np.int64),
+            ticks["bid"].to_numpy(dtype=np.float64),
+            ticks["ask"].to_numpy(dtype=np.float64),
+            ticks["status"].astype(str).to_numpy() if "status" in ticks else np.full(len(ticks), "tradeable", dtype=object)
+        )
+
+    def start_replay(self, start_ns, speed = 0) -> int:
+
+        """
+            The pricing stream replays the loaded ticks from start_ns on, the ticks before it are only served as candles
+            (the warm up). Returns the number of ticks to stream.
+        """
+
+        merged = []
+        for instrument, (times, bid, ask, status) in self.ticks.items():
+            first = int(np.searchsorted(times, start_ns, side="left"))
+            merged.extend(zip(times[first:].tolist(), [instrument] * (len(times) - first), bid[first:].tolist(), ask[first:].tolist(), status[first:].tolist()))
+
+        # ties keep the load order, so a replay streams the same sequence every time
+        merged.sort(key=lambda tick: tick[0])
+
+        with self.condition:
+            self.replay = merged
+            self.replay_position = 0
+            self.speed = speed
+            self.advance(start_ns - 1)
+
+        return len(merged)
+
+    def advance(self, time_ns, instrument = None, bid = None, ask = None):
+
+        # called with condition held
+        self.clock_ns = max(self.clock_ns, time_ns)
+        if instrument is not None:
+            self.prices[instrument] = (bid, ask)
+
+    def get_candles(self, instrument, count, from_ns = None, to_ns = None) -> list:
+
+        """
+            S30 MBA candles of the ticks up to the stub clock, the latest count or count from from_ns on, before to_ns.
+            The last one is incomplete while its 30 seconds have not passed. Before a replay starts all the loaded
+            ticks are history.
+        """
+
+        if instrument not in self.ticks:
+            return []
+
+        times, bid, ask, _ = self.ticks[instrument]
+        clock_ns = self.clock_ns or (int(times[-1]) // bar_ns + 1) * bar_ns
+
+        if from_ns is None:
+            first_bar = clock_ns - clock_ns % bar_ns - (count - 1) * bar_ns
+        else:
+            first_bar = from_ns - from_ns % bar_ns
+
+        start = int(np.searchsorted(times, first_bar, side="left"))
+        end = int(np.searchsorted(times, clock_ns, side="right"))
+        if to_ns is not None:
+            # the ticks of the bars that start before to_ns
+            end = min(end, int(np.searchsorted(times, -(-to_ns // bar_ns) * bar_ns, side="left")))
+        if end <= start:
+            return []
+
+        bars = times[start:end] // bar_ns
+        last = np.append(np.flatnonzero(np.diff(bars)), len(bars) - 1)
+        first = np.concatenate([[0], last[:-1] + 1])
+        if from_ns is None:
+            first, last = first[-count:], last[-count:]
+        else:
+            first, last = first[:count], last[:count]
+
+        candles = []
+        for f, l in zip(first.tolist(), last.tolist()):
+            bar_time = int(bars[l]) * bar_ns
+            b, a = bid[start + l], ask[start + l]
+            candles.append(dict(
+                time=format_time_ns(bar_time),
+                volume=l - f + 1,
+                complete=bar_time + bar_ns <= clock_ns,
+                mid=dict(c=f"{(b + a) / 2:.6f}"),
+                bid=dict(c=f"{b:.5f}"),
+                ask=dict(c=f"{a:.5f}")
+            ))
+
+        return candles
+
+    def last_transaction_id(self) -> int:
+        return len(self.transactions)
+
+    def add_transaction(self, transaction: dict) -> dict:
+
+        with self.condition:
+            transaction["id"] = str(len(self.transactions) + 1)
+            transaction["accountID"] = self.account_id
+            transaction["time"] = self.now()
+            self.transactions.append(transaction)
+            self.condition.notify_all()
+
+        return transaction
+
+    def fill(self, instrument, units, price=1.0, reason="MARKET_ORDER") -> dict:
+
+        """
+            Fills units of instrument and publishes the ORDER_FILL, reason STOP_LOSS_ORDER or TAKE_PROFIT_ORDER
+            simulates a triggered stop loss / take profit
+        """
+
+        with self.condition:
+            self.positions[instrument] = self.positions.get(instrument, 0) + units
+            return self.add_transaction(dict(type="ORDER_FILL", instrument=instrument, units=str(units), price=str(price), reason=reason))
+
+    def get_position(self, instrument) -> dict:
+
+        units = self.positions.get(instrument, 0)
+        return dict(
+            position=dict(
+                instrument=instrument,
+                long=dict(units=str(max(units, 0))),
+                short=dict(units=str(min(units, 0)))
+            ),
+            lastTransactionID=str(self.last_transaction_id())
+        )
+
+    def place_order(self, order: dict) -> dict:
+
+        with self.condition:
+            create = self.add_transaction(dict(type="MARKET_ORDER", instrument=order["instrument"], units=order["units"],
+                                               timeInForce=order.get("timeInForce"), positionFill=order.get("positionFill"),
+                                               reason="CLIENT_ORDER"))
+            units = int(float(order["units"]))
+            price = self.prices.get(order["instrument"])
+            price = float(order.get("price", 1.0)) if price is None else (price[1] if units > 0 else price[0])
+            fill = self.fill(order["instrument"], units, price)
+            fill["orderID"] = create["id"]
+
+            client_extensions = order.get("clientExtensions")
+            if client_extensions:
+                create["clientExtensions"] = client_extensions
+                fill["clientOrderID"] = client_extensions["id"]
+
+            placed = dict(id=create["id"], instrument=order["instrument"], units=order["units"], type="MARKET",
+                          state="FILLED", fillingTransactionID=fill["id"], clientExtensions=client_extensions)
+            self.orders[create["id"]] = placed
+            if client_extensions:
+                self.orders[f"@{client_extensions['id']}"] = placed
+
+        return dict(orderCreateTransaction=create, orderFillTransaction=fill, lastTransactionID=fill["id"])
+
+
+class OandaStubHandler(BaseHTTPRequestHandler):
+
+    stub: OandaStub = None
+    # streams use chunked transfer encoding like OANDA, so clients get every line as soon as it is written
+    protocol_version = "HTTP/1.1"
+    # headers and body are separate writes, with Nagle on every keep-alive request waits for a delayed ack
+    disable_nagle_algorithm = True
+
+    routes = [
+        ("GET", re.compile(r"^/v3/accounts/[^/]+/pricing/stream$"), "pricing_stream"),
+        ("GET", re.compile(r"^/v3/accounts/[^/]+/candles/latest$"), "latest_candles"),
+        ("GET", re.compile(r"^/v3/instruments/(?P<instrument>[^/]+)/candles$"), "candles"),
+        ("GET", re.compile(r"^/v3/accounts/[^/]+/transactions/stream$"), "transactions_stream"),
+        ("GET", re.compile(r"^/v3/accounts/[^/]+/positions/(?P<instrument>[^/]+)$"), "position"),
+        ("POST", re.compile(r"^/v3/accounts/[^/]+/orders$"), "orders"),
+        ("GET", re.compile(r"^/v3/accounts/[^/]+/orders/(?P<specifier>[^/]+)$"), "order"),
+    ]
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self.route("GET")
+
+    def do_POST(self):
+        self.route("POST")
+
+    def route(self, verb):
+
+        path = self.path.split("?", 1)[0]
+        for method, pattern, name in self.routes:
+            match = pattern.match(path)
+            if method == verb and match:
+                return getattr(self, name)(**match.groupdict())
+
+        self.send_json(404, dict(errorMessage=f"Not found: {verb} {path}"))
+
+    def query(self) -> dict:
+        return {name: values[-1] for name, values in parse_qs(self.path.split("?", 1)[1] if "?" in self.path else "").items()}
+
+    def send_json(self, code, data):
+
+        body = json.dumps(data).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def read_json(self):
+
+        length = int(self.headers.get("Content-Length", 0))
+        return json.loads(self.rfile.read(length)) if length > 0 else {}
+
+    def start_stream(self):
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+    def write_line(self, data):
+        self.write_lines([data])
+
+    def write_lines(self, items):
+
+        # one chunk for several lines, the max speed replay would spend its time in syscalls otherwise
+        lines = b"".join(json.dumps(data).encode("utf-8") + b"\n" for data in items)
+        self.wfile.write(f"{len(lines):x}\r\n".encode("ascii") + lines + b"\r\n")
+        self.wfile.flush()
+
+    def end_stream(self):
+
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+        self.close_connection = True
+
+    def latest_candles(self):
+
+        query = self.query()
+        self.send_json(200, dict(instrument=query["instrument"], granularity="S30",
+                                 candles=self.stub.get_candles(query["instrument"], int(query.get("count", 500)))))
+
+    def candles(self, instrument):
+
+        query = self.query()
+        stub = self.stub
+        time.sleep(stub.candle_latency)
+
+        with stub.condition:
+            fail = stub.fail_candle_requests > 0
+            stub.fail_candle_requests = stub.fail_candle_requests - fail
+        if fail:
+            return self.send_json(503, dict(errorMessage="Service unavailable"))
+
+        if "to" in query:
+            candles = stub.get_candles(instrument, max_candles + 1, parse_time(query["from"]), parse_time(query["to"]))
+            if len(candles) > max_candles:
+                return self.send_json(400, dict(errorMessage="Maximum value for 'count' exceeded"))
+        else:
+            candles = stub.get_candles(instrument, int(query.get("count", 500)), parse_time(query["from"]))
+
+        self.send_json(200, dict(instrument=instrument, granularity="S30", candles=candles))
+
+    def pricing_stream(self):
+
+        """
+            Streams the replay ticks of the requested instruments from where the last connection stopped and ends
+            the stream when they run out. speed > 0 paces them by their time stamps, with heartbeats in the gaps.
+        """
+
+        stub = self.stub
+        instruments = set(self.query().get("instruments", "").split(","))
+        self.start_stream()
+
+        started = time.monotonic()
+        first_ns = None
+        batch = []
+
+        try:
+            while stub.running and stub.replay_position < len(stub.replay):
+
+                time_ns, instrument, bid, ask, status = stub.replay[stub.replay_position]
+
+                if stub.speed > 0:
+                    if first_ns is None:
+                        first_ns = time_ns
+                    while stub.running:
+                        delay = started + (time_ns - first_ns) / 1e9 / stub.speed - time.monotonic()
+                        if delay <= 0:
+                            break
+                        time.sleep(min(delay, stub.heartbeat))
+                        if delay > stub.heartbeat:
+                            self.write_line(dict(type="HEARTBEAT", time=stub.now()))
+
+                with stub.condition:
+                    stub.replay_position = stub.replay_position + 1
+                    stub.advance(time_ns, instrument, bid, ask)
+
+                if instrument in instruments:
+                    batch.append(dict(type="PRICE", time=format_time_ns(time_ns), instrument=instrument,
+                                      closeoutBid=f"{bid:.5f}", closeoutAsk=f"{ask:.5f}", status=status, tradeable=status == "tradeable"))
+
+                if stub.speed > 0 or len(batch) >= 64:
+                    if batch:
+                        self.write_lines(batch)
+                    batch = []
+
+            if batch:
+                self.write_lines(batch)
+            self.end_stream()
+
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True
+
+    def position(self, instrument):
+        self.send_json(200, self.stub.get_position(instrument))
+
+    def orders(self):
+
+        response = self.stub.place_order(self.read_json()["order"])
+        if self.stub.drop_order_responses > 0:
+            self.stub.drop_order_responses = self.stub.drop_order_responses - 1
+            self.close_connection = True
+            return
+        self.send_json(201, response)
+
+    def order(self, specifier):
+
+        placed = self.stub.orders.get(unquote(specifier))
+        if placed is None:
+            self.send_json(404, dict(errorMessage=f"The order {specifier} does not exist"))
+        else:
+            self.send_json(200, dict(order=placed, lastTransactionID=str(self.stub.last_transaction_id())))
+
+    def transactions_stream(self):
+
+        stub = self.stub
+        self.start_stream()
+        sent = stub.last_transaction_id()
+
+        try:
+            while True:
+                with stub.condition:
+                    stub.condition.wait_for(lambda: not stub.running or stub.last_transaction_id() > sent, timeout=stub.heartbeat)
+                    if not stub.running:
+                        break
+                    pending = stub.transactions[sent:]
+                    sent = sent + len(pending)
+
+                for transaction in pending:
+                    self.write_line(transaction)
+                if not pending:
+                    self.write_line(dict(type="HEARTBEAT", lastTransactionID=str(sent), time=stub.now()))
+
+            self.end_stream()
+
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--port', type = int, default=8080, help='Port to listen on')
+    parser.add_argument('--config', type = str, default=None, help='Write an oanda config file pointing at the stub')
+    args = parser.parse_args()
+
+    stub = OandaStub(port=args.port).start()
+    if args.config:
+        stub.write_config(args.config)
+    print(f"OANDA stub listening on {stub.url}")
+
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        stub.stop()
+
+    # python oanda_stub.py --port 8080 --config ../../config/oanda_stub.cfg
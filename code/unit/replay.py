@@ -0,0 +1,137 @@
+import argparse
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from tabulate import tabulate
+
+file = Path(__file__).resolve()
+parent, root = file.parent, file.parents[1]
+sys.path.append(str(root))
+
+from trading.async_trader import AsyncTrader
+from trading.trading_bot import Trader
+from trading.utils import utils
+from trading.utils.tick_journal import journal_file, read_journal
+from unit.oanda_stub import OandaStub
+
+"""
+Replays recorded ticks through the live Trader: the same new_price_ticker, feed and strategy code, against the
+local OANDA stand-in in oanda_stub.py, which streams the ticks and serves candles, positions and fills from them.
+
+The first --warmup bars worth of ticks are only served as candles for the warm up, the rest are streamed at
+--speed (1 real time, 10 ten times faster, 0 as fast as possible). In replay mode the Trader evaluates on the
+stream thread and places orders synchronously, and the strategies' clock is the time of the last tick, so two
+replays of the same ticks make the same trades.
+
+Ticks come from the tick journal (trading.utils.tick_journal) or a synthetic random walk.
+"""
+
+
+def synthetic_ticks(count, start = "2024-06-18 08:00", seed = 1, price = 1.07) -> pd.DataFrame:
+
+    rng = np.random.default_rng(seed)
+    time_ns = pd.Timestamp(start).value + np.cumsum(rng.integers(50_000_000, 2_000_000_000, count))
+    mid = np.round(price + np.cumsum(rng.normal(0, 0.00015, count)), 5)
+    spread = rng.choice([0.00010, 0.00012, 0.00014], count)
+
+    return pd.DataFrame({
+        "bid": np.round(mid - spread / 2, 5),
+        "ask": np.round(mid + spread / 2, 5),
+        "status": "tradeable"
+    }, index=pd.DatetimeIndex(time_ns.astype("datetime64[ns]"), name="time"))
+
+
+def load_ticks(args, instruments) -> dict:
+
+    ticks = {}
+
+    if args.synthetic:
+        for seed, instrument in enumerate(instruments, 1):
+            ticks[instrument] = synthetic_ticks(args.synthetic, seed=seed)
+
+    elif args.journal:
+        # <journal_dir>/<instrument>/<day>.ticks
+        for journal in args.journal:
+            instrument = Path(journal).parent.name
+            ticks[instrument] = pd.concat([ticks[instrument], read_journal(journal)]) if instrument in ticks else read_journal(journal)
+
+    else:
+        for instrument in instruments:
+            ticks[instrument] = read_journal(journal_file(args.journal_dir, instrument, args.day))
+
+    missing = [instrument for instrument in instruments if instrument not in ticks]
+    if missing:
+        raise Exception(f"No ticks for {', '.join(missing)}")
+
+    return ticks
+
+
+def replay(args):
+
+    stub = OandaStub().start()
+    config_file = os.path.join(tempfile.mkdtemp(prefix="replay_"), "oanda_stub.cfg")
+    stub.write_config(config_file)
+
+    try:
+        trader_class = AsyncTrader if args.asyncio in ['True', 'true'] else Trader
+        trader = trader_class(
+            conf_file=config_file,
+            pair_file=args.pair_file,
+            trading_strategy=args.trading_strategy,
+            unit_test=False,
+            incremental=(args.incremental in ['True', 'true']),
+            replay=True
+        )
+
+        ticks = load_ticks(args, list(trader.feeds))
+        for instrument in trader.feeds:
+            stub.load_ticks(instrument, ticks[instrument])
+
+        start_ns = min(ticks[instrument].index[0].value for instrument in trader.feeds) + args.warmup * utils.bar_size_ns
+        count = stub.start_replay(start_ns, speed=args.speed)
+        print(f"Replaying {count} ticks of {', '.join(trader.feeds)} from {pd.Timestamp(start_ns)}, speed: {args.speed or 'max'}")
+
+        started = time.perf_counter()
+        trader.start_trading(stop_after=count)
+        elapsed = time.perf_counter() - started
+
+    finally:
+        stub.stop()
+
+    for strategy in trader.strategies:
+        session = strategy.trading_session
+        print(f"\n{strategy.trading_strategy}: {len(session.trades)} trades, PL: {'${:,.2f}'.format(session.pl)}")
+        if session.trades:
+            print(tabulate(session.trades, headers=session.columns))
+
+    print(f"\n{count} ticks in {elapsed:.2f}s, {count / elapsed:,.0f} ticks/sec, {trader.exec_counter} evaluations")
+    print(trader.latency.to_string())
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('trading_strategy', type=str, nargs='+', help='trading_strategy, pairs.ini sections')
+    parser.add_argument('--pair_file', type = str, default="../trading/pairs.ini", help='pairs.ini')
+    parser.add_argument('--journal', type = str, nargs='+', default=None, help='Tick journal files, <journal_dir>/<instrument>/<day>.ticks')
+    parser.add_argument('--journal_dir', type = str, default="../../journal", help='Tick journal directory, used with --day')
+    parser.add_argument('--day', type = str, default=None, help='Day to replay from the journal directory, YYYY-MM-DD')
+    parser.add_argument('--synthetic', type = int, default=0, help='Replay this many random walk ticks per instrument instead')
+    parser.add_argument('--speed', type = float, default=0, help='1 real time, 10 ten times faster, 0 as fast as possible')
+    parser.add_argument('--warmup', type = int, default=utils.ticker_data_size, help='Bars of ticks served as warm up candles')
+    parser.add_argument('--incremental', choices=['True', 'False', 'true', 'false'], default="True", type = str, help='Update indicators per closed bar')
+    parser.add_argument('--asyncio', choices=['True', 'False', 'true', 'false'], default="False", type = str, help='Replay through the asyncio Trader')
+    args = parser.parse_args()
+
+    if not args.synthetic and not args.journal and args.day is None:
+        parser.error("one of --journal, --day or --synthetic is required")
+
+    replay(args)
+
+# python replay.py EUR_USD --synthetic 200000
+# python replay.py EUR_USD#1 EUR_USD#2 --journal_dir ../../journal --day 2024-06-18 --speed 10
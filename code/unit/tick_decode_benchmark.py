@@ -0,0 +1,94 @@
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+import pandas as pd
+
+file = Path(__file__).resolve()
+parent, root = file.parent, file.parents[1]
+sys.path.append(str(root))
+
+from trading.utils.tick_store import TickStore
+from trading.utils.ticks import decode_price
+
+"""
+Ticks/sec of the pricing stream decode path, before (json + float + kwargs callback + pd.to_datetime)
+and after (trading.utils.ticks.decode_price), on lines shaped like trading/api/samples/stream.json.
+"""
+
+sample_file = root / "trading" / "api" / "samples" / "stream.json"
+
+
+def make_lines(count, heartbeat_every=10) -> list:
+
+    sample = json.loads(sample_file.read_text())
+    start = pd.Timestamp(sample["time"][:-1]).value
+    lines = []
+
+    for i in range(count):
+        if i % heartbeat_every == 0:
+            lines.append(json.dumps(dict(type="HEARTBEAT", time=sample["time"])).encode("utf-8"))
+        t = pd.Timestamp(start + i * 250_123_457)
+        price = 1.07277 + (i % 50) * 0.00001
+        sample["time"] = t.strftime("%Y-%m-%dT%H:%M:%S.") + f"{t.value % 1_000_000_000:09d}Z"
+        sample["closeoutBid"] = f"{price:.5f}"
+        sample["closeoutAsk"] = f"{price + 0.00014:.5f}"
+        lines.append(json.dumps(sample).encode("utf-8"))
+
+    return lines
+
+
+def decode_before(lines, consumer):
+
+    def callback(**kwargs):
+        consumer(kwargs.get("instrument"), pd.to_datetime(kwargs.get("time")).replace(tzinfo=None).value,
+                 kwargs.get("bid"), kwargs.get("ask"), kwargs.get("status"))
+
+    for line in lines:
+        if line:
+            data = json.loads(line.decode('utf-8'))
+            if data.get("type") == "PRICE":
+                callback(instrument=data["instrument"], time=data["time"], bid=float(data["closeoutBid"]),
+                         ask=float(data["closeoutAsk"]), status=data["status"])
+
+
+def decode_after(lines, consumer):
+
+    for line in lines:
+        tick = decode_price(line)
+        if tick is not None:
+            consumer(*tick)
+
+
+def measure(name, decode, lines, consumer, ticks):
+
+    start = time.perf_counter()
+    decode(lines, consumer)
+    elapsed = time.perf_counter() - start
+    print(f"{name:<32} {ticks / elapsed:>12,.0f} ticks/sec")
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--ticks', type = int, default=100_000, help='Number of PRICE lines')
+    args = parser.parse_args()
+
+    lines = make_lines(args.ticks)
+
+    before, after = [], []
+    decode_before(lines[:1000], lambda *tick: before.append(tick))
+    decode_after(lines[:1000], lambda *tick: after.append(tick))
+    assert before == [tick[:5] for tick in after], "decode paths disagree"
+
+    measure("before: decode", decode_before, lines, lambda *tick: None, args.ticks)
+    measure("after: decode", decode_after, lines, lambda *tick: None, args.ticks)
+
+    store = TickStore()
+    measure("before: decode + TickStore", decode_before, lines, lambda i, t, b, a, s, *received: store.add_tick(t, b, a, s), args.ticks)
+    store = TickStore()
+    measure("after: decode + TickStore", decode_after, lines, lambda i, t, b, a, s, *received: store.add_tick(t, b, a, s), args.ticks)
+
+    # python tick_decode_benchmark.py --ticks 100000